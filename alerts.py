@@ -0,0 +1,131 @@
+# =============================================================================
+# IMPORTS
+# =============================================================================
+import time, queue, threading, traceback
+
+# =============================================================================
+# CONSTANTS
+# =============================================================================
+MAX_MESSAGE_LENGTH = 1800  # discord caps content at 2000, leave room for framing
+MAX_TRACEBACK_LENGTH = 600
+
+
+# =============================================================================
+# NON-BLOCKING ALERT QUEUE WITH A BACKGROUND SENDER
+#
+# submit() only puts on a queue. The sender thread wakes every
+# `batch_interval` seconds, groups what arrived by fingerprint
+# (market + exception type) and sends one summary for the whole batch.
+# A fingerprint that was already sent is muted for `cooldown` seconds;
+# repeats during that window are counted and reported once it's over.
+# =============================================================================
+class AlertQueue:
+    def __init__(self, send, batch_interval=5.0, cooldown=300.0, max_queue=10000):
+        self.send = send
+        self.batch_interval = batch_interval
+        self.cooldown = cooldown
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.last_sent = {}  # fingerprint -> time last reported
+        self.suppressed = {}  # fingerprint -> count muted since then
+        self._stop = threading.Event()
+        self._thread = None
+
+    def submit(self, msg, market=None):
+        try:
+            self.queue.put_nowait((market, msg))
+        except queue.Full:
+            pass
+
+    # =========================================================================
+    # SENDER SIDE
+    # =========================================================================
+    def drain(self):
+        items = []
+        while True:
+            try:
+                items.append(self.queue.get_nowait())
+            except queue.Empty:
+                return items
+
+    def flush(self, now=None):
+        now = time.monotonic() if now is None else now
+        groups = {}
+        for market, msg in self.drain():
+            fp = fingerprint(market, msg)
+            group = groups.setdefault(fp, {"count": 0, "first": msg})
+            group["count"] += 1
+
+        lines = []
+        for fp, group in groups.items():
+            if now - self.last_sent.get(fp, -self.cooldown) < self.cooldown:
+                self.suppressed[fp] = self.suppressed.get(fp, 0) + group["count"]
+                continue
+            muted = self.suppressed.pop(fp, 0)
+            lines.append(summary_line(fp, group["count"], muted, group["first"]))
+            self.last_sent[fp] = now
+
+        for fp in list(self.suppressed):
+            if now - self.last_sent[fp] >= self.cooldown:
+                count = self.suppressed.pop(fp)
+                lines.append(f"{describe(fp)}: {count}x more during cooldown")
+                self.last_sent[fp] = now
+
+        for chunk in chunk_lines(lines):
+            try:
+                self.send(chunk)
+            except Exception as e:
+                print(f"Failed sending alert: {e}")
+        return len(lines)
+
+    def run(self):
+        while not self._stop.wait(self.batch_interval):
+            self.flush()
+        self.flush()
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+
+# =============================================================================
+# HELPERS
+# =============================================================================
+def fingerprint(market, msg):
+    if isinstance(msg, BaseException):
+        return market, type(msg).__name__
+    return market, str(msg)
+
+
+def describe(fp):
+    market, kind = fp
+    return f"[{market}] {kind}" if market else kind
+
+
+def summary_line(fp, count, muted, first):
+    line = f"{describe(fp)}: {count}x"
+    if muted:
+        line += f" (+{muted} muted during cooldown)"
+    if isinstance(first, BaseException):
+        tb = "".join(
+            traceback.format_exception(type(first), first, first.__traceback__)
+        )
+        line += f"\n{tb[-MAX_TRACEBACK_LENGTH:]}"
+    return line
+
+
+def chunk_lines(lines):
+    chunk = ""
+    for line in lines:
+        line = line[: MAX_MESSAGE_LENGTH - 1] + "\n"
+        if chunk and len(chunk) + len(line) > MAX_MESSAGE_LENGTH:
+            yield chunk
+            chunk = ""
+        chunk += line
+    if chunk:
+        yield chunk
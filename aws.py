@@ -0,0 +1,59 @@
+# =============================================================================
+# IMPORTS
+# =============================================================================
+import os, threading
+from dotenv import load_dotenv
+
+# =============================================================================
+# AWS CONFIG
+# =============================================================================
+load_dotenv()
+AWS_ACCESS_KEY = os.getenv("AWS_ACCESS_KEY")
+AWS_SECRET_KEY = os.getenv("AWS_SECRET_KEY")
+AWS_REGION = "eu-west-2"
+# "local:{dir}" or "memory" swaps the bucket for a stand-in (offline runs,
+# replay benchmarks), unset is the real S3
+S3_BACKEND = os.getenv("S3_BACKEND")
+
+
+# =============================================================================
+# boto3 clients can't be pickled, every process makes its own
+# =============================================================================
+def create_s3_client():
+    if S3_BACKEND == "memory":
+        from local_s3 import MemoryS3
+
+        return MemoryS3()
+    if S3_BACKEND and S3_BACKEND.startswith("local:"):
+        from local_s3 import LocalS3
+
+        return LocalS3(S3_BACKEND[len("local:") :])
+    # boto3 alone is a few hundred ms of imports
+    import boto3
+
+    return boto3.client(
+        "s3",
+        aws_access_key_id=AWS_ACCESS_KEY,
+        aws_secret_access_key=AWS_SECRET_KEY,
+        region_name=AWS_REGION,
+    )
+
+
+# =============================================================================
+# BUILT ON FIRST USE, SO IMPORTING A MODULE THAT HOLDS ONE COSTS NOTHING
+# =============================================================================
+class LazyS3Client:
+    def __init__(self, factory=create_s3_client):
+        self._factory = factory
+        self._client = None
+        self._lock = threading.Lock()
+
+    def _get(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = self._factory()
+        return self._client
+
+    def __getattr__(self, name):
+        return getattr(self._get(), name)
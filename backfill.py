@@ -0,0 +1,192 @@
+# =============================================================================
+# IMPORTS
+# =============================================================================
+import os, json, time, threading
+import concurrent.futures
+import pandas as pd
+import http_client
+from fetch_scheduler import TokenBucket, RateLimited, backoff_delay
+from venues import BINANCE_API_URL, BinanceAdapter, check_status
+
+# =============================================================================
+# CONFIG
+# =============================================================================
+BINANCE_URL = BINANCE_API_URL
+KLINE_LIMIT = 1000
+KLINE_COLUMNS = ["timestamp", "open", "high", "low", "close", "volume"]
+INTERVAL_MS = {"1m": 60_000, "5m": 300_000, "15m": 900_000, "1h": 3_600_000}
+MAX_RETRIES = 8
+
+
+# =============================================================================
+# ONE PAGE OF KLINES, RATE LIMITED BY THE ADAPTER'S BUCKET AND RETRIED
+#
+# venue: venues.BinanceAdapter, which builds the request and parses the page
+# =============================================================================
+def fetch_klines(venue, market, interval, start_ms, end_ms):
+    symbol = venue.symbol(market)
+    url, params = venue.kline_request(market, interval, start_ms, end_ms, KLINE_LIMIT)
+    for attempt in range(MAX_RETRIES):
+        venue.bucket.acquire()
+        try:
+            res = http_client.get(url, params=params)
+            # 418 is binance's "you kept going after 429"
+            check_status(res.status_code, res)
+            res.raise_for_status()
+            return venue.parse_klines(res.json())
+        except RateLimited as e:
+            delay = max(e.retry_after or 0.0, backoff_delay(attempt, 1.0, 60.0))
+        except Exception as e:
+            if attempt == MAX_RETRIES - 1:
+                raise
+            delay = backoff_delay(attempt, 0.5, 30.0)
+            print(f"Kline fetch failed for {symbol} @ {start_ms}: {e}")
+        time.sleep(delay)
+    raise Exception(f"Gave up fetching klines for {symbol} @ {start_ms}")
+
+
+def fetch_range(venue, market, interval, start_ms, end_ms):
+    rows = []
+    while start_ms < end_ms:
+        page = fetch_klines(venue, market, interval, start_ms, end_ms)
+        if not page:
+            break
+        rows += page
+        start_ms = page[-1][0] + INTERVAL_MS[interval]
+    return rows
+
+
+# =============================================================================
+# RESUMABLE, CONCURRENT DOWNLOADER
+#
+# The range is cut into windows of KLINE_LIMIT candles. Each window is
+# fetched by a worker, written to its own file as soon as it arrives, and
+# then recorded in the checkpoint once every kline in it has closed (a window
+# reaching up to now is fetched again on the next run). Re-running skips
+# recorded windows:
+#   {out_dir}/{symbol}/{interval}/{start_ms}-{end_ms}.csv
+#   {out_dir}/{symbol}/{interval}/_checkpoint.json
+# =============================================================================
+class KlineBackfill:
+    def __init__(
+        self,
+        out_dir="klines",
+        interval="1m",
+        quote="BUSD",
+        workers=4,
+        rate=10,
+        base_url=BINANCE_URL,
+    ):
+        self.out_dir = out_dir
+        self.interval = interval
+        self.workers = workers
+        self.venue = BinanceAdapter(base_url, quote, TokenBucket(rate))
+        self.lock = threading.Lock()
+
+    def directory(self, symbol):
+        return os.path.join(self.out_dir, symbol, self.interval)
+
+    def windows(self, start, end):
+        # aligned to multiples of the window size so reruns with a different
+        # start still line up with the checkpoint
+        step = INTERVAL_MS[self.interval] * KLINE_LIMIT
+        start_ms, end_ms = to_ms(start), to_ms(end)
+        first = start_ms - start_ms % step
+        return [
+            (max(s, start_ms), min(s + step, end_ms))
+            for s in range(first, end_ms, step)
+        ]
+
+    # =========================================================================
+    # CHECKPOINT
+    # =========================================================================
+    def checkpoint_path(self, symbol):
+        return os.path.join(self.directory(symbol), "_checkpoint.json")
+
+    def completed(self, symbol):
+        try:
+            with open(self.checkpoint_path(symbol)) as f:
+                return {tuple(w) for w in json.load(f)["done"]}
+        except FileNotFoundError:
+            return set()
+
+    def mark_done(self, symbol, window):
+        with self.lock:
+            done = self.completed(symbol)
+            done.add(window)
+            write_atomic(
+                self.checkpoint_path(symbol),
+                json.dumps({"done": sorted(done)}),
+            )
+
+    # =========================================================================
+    # DOWNLOAD
+    # =========================================================================
+    def download_window(self, market, window):
+        symbol = self.venue.symbol(market)
+        rows = fetch_range(self.venue, market, self.interval, *window)
+        df = pd.DataFrame(rows, columns=KLINE_COLUMNS)
+        path = os.path.join(self.directory(symbol), f"{window[0]}-{window[1]}.csv")
+        write_atomic(path, df.to_csv(index=False))
+        if window[1] <= self.last_closed():
+            self.mark_done(symbol, window)
+        return len(rows)
+
+    def last_closed(self):
+        # one interval of slack: the kline opened an interval ago may only
+        # just have closed, and the venue's clock isn't ours
+        return int(time.time() * 1000) - INTERVAL_MS[self.interval]
+
+    def run(self, markets, start, end):
+        jobs = []
+        for market in markets:
+            done = self.completed(self.venue.symbol(market))
+            jobs += [(market, w) for w in self.windows(start, end) if w not in done]
+        print(f"{len(jobs)} kline windows to download")
+
+        fetched = 0
+        with concurrent.futures.ThreadPoolExecutor(self.workers) as executor:
+            futures = {executor.submit(self.download_window, *job): job for job in jobs}
+            for future in concurrent.futures.as_completed(futures):
+                market, window = futures[future]
+                try:
+                    fetched += future.result()
+                except Exception as e:
+                    print(f"Failed window {market} {window}: {e}, retried on rerun")
+        return fetched
+
+    # =========================================================================
+    # READ BACK WHAT WAS DOWNLOADED
+    # =========================================================================
+    def load(self, market, start, end):
+        symbol = self.venue.symbol(market)
+        start_ms, end_ms = to_ms(start), to_ms(end)
+        frames = []
+        for s, e in sorted(self.completed(symbol)):
+            if e <= start_ms or s >= end_ms:
+                continue
+            path = os.path.join(self.directory(symbol), f"{s}-{e}.csv")
+            frames.append(pd.read_csv(path))
+        if not frames:
+            return pd.DataFrame(columns=KLINE_COLUMNS)
+        df = pd.concat(frames, ignore_index=True).drop_duplicates("timestamp")
+        df = df[(df["timestamp"] >= start_ms) & (df["timestamp"] < end_ms)]
+        df["timestamp"] = pd.to_datetime(df["timestamp"], unit="ms")
+        return df.sort_values("timestamp").reset_index(drop=True)
+
+
+# =============================================================================
+# HELPERS
+# =============================================================================
+def to_ms(ts):
+    if isinstance(ts, (int, float)):
+        return int(ts)
+    return int(pd.Timestamp(ts).value // 1_000_000)
+
+
+def write_atomic(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        f.write(text)
+    os.replace(tmp, path)
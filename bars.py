@@ -0,0 +1,183 @@
+# =============================================================================
+# IMPORTS
+# =============================================================================
+import os, sys, json
+import datetime as dt
+import numpy as np
+import pandas as pd
+from storage_formats import get_format, parse_timestamps
+from change_filter import RECORD_CHANGES_ONLY, max_gap
+
+# =============================================================================
+# CONFIG
+# =============================================================================
+# Precomputed bars per finished day and market:
+#   bars/{resolution}/{market}/{market}_{day}.{ext}
+# bars/_manifest.json remembers the ETag of the raw daily file each set of
+# bars was built from, so a rerun only redoes days whose raw file changed.
+RESOLUTIONS = ["1s", "1min", "5min", "1h"]
+MANIFEST_KEY = "bars/_manifest.json"
+BAR_COLUMNS = [
+    "timestamp",
+    "open",
+    "high",
+    "low",
+    "close",
+    "spread",
+    "bid_size",
+    "ask_size",
+    "samples",
+]
+
+
+def bars_key(resolution, market, day, fmt):
+    return f"bars/{resolution}/{market}/{market}_{day}.{fmt.extension}"
+
+
+# =============================================================================
+# HOW LONG A SAMPLE STAYS THE CURRENT QUOTE
+#
+# Until the next sample, but no longer than `max_hold` seconds: a gap in the
+# recording is no reason to keep weighting the last quote. Change-only days
+# promise a row at least every max_gap(); fixed-interval days one per typical
+# interval, so a missed tick doesn't stretch the quote before it.
+# =============================================================================
+def default_max_hold(ts):
+    if RECORD_CHANGES_ONLY:
+        return max_gap()
+    steps = np.diff(ts.to_numpy()) / np.timedelta64(1, "s")
+    steps = steps[steps > 0]
+    return float(np.median(steps)) if len(steps) else max_gap()
+
+
+def integrate(starts, ends, values, edges):
+    # integral of `values[i]` held over [starts[i], ends[i]) between each pair
+    # of edges; starts are sorted and the intervals don't overlap
+    durations = ends - starts
+    area = np.r_[0.0, np.cumsum(values * durations)]
+    last = np.searchsorted(starts, edges, side="right") - 1
+    i = np.clip(last, 0, None)
+    partial = values[i] * np.clip(edges - starts[i], 0, durations[i])
+    total = np.where(last >= 0, area[i] + partial, 0.0)
+    return np.diff(total)
+
+
+# =============================================================================
+# BARS FOR ONE RESOLUTION
+#
+# OHLC of mid. Spread and top-of-book sizes are time weighted: each sample
+# counts for as long as it was the current quote (see above), split at the
+# bucket edges it spans. A bucket with no samples that a quote was held into
+# gets a flat bar at that quote's mid and samples=0.
+# =============================================================================
+def compute_bars(df, day, resolution, max_hold=None):
+    if not len(df):
+        return pd.DataFrame(columns=BAR_COLUMNS)
+    df = df.copy()
+    df["timestamp"] = parse_timestamps(df["timestamp"])
+    df = df.sort_values("timestamp").set_index("timestamp")
+
+    day_start = pd.Timestamp(day)
+    step = pd.Timedelta(resolution)
+    edges = pd.date_range(day_start, day_start + pd.Timedelta(days=1), freq=step)
+    ts = df.index.to_series()
+    if max_hold is None:
+        max_hold = default_max_hold(ts)
+
+    # seconds into the day
+    starts = ((ts - day_start).dt.total_seconds()).to_numpy()
+    starts = np.clip(starts, 0, 86400)
+    ends = np.minimum(np.r_[starts[1:], 86400.0], starts + max_hold)
+    edge_s = ((edges - day_start).total_seconds()).to_numpy()
+
+    def weighted_mean(values):
+        values = values.to_numpy(dtype=float)
+        known = ~np.isnan(values)
+        num = integrate(starts, ends, np.where(known, values, 0.0), edge_s)
+        den = integrate(starts, ends, known.astype(float), edge_s)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return pd.Series(num / den, index=edges[:-1])
+
+    bucket = df.index.floor(resolution)
+    bars = df["mid"].groupby(bucket).ohlc()
+    bars["samples"] = df["mid"].groupby(bucket).count()
+    # buckets without a row of their own still hold the quote from before,
+    # which on change-only days is most of them
+    held = weighted_mean(df["mid"]).dropna()
+    bars = bars.reindex(bars.index.union(held.index))
+    quiet = bars["samples"].isna()
+    for column in ("open", "high", "low", "close"):
+        bars.loc[quiet, column] = held[quiet[quiet].index]
+    bars["samples"] = bars["samples"].fillna(0).astype(int)
+    bars["spread"] = weighted_mean(df["ask_price"] - df["bid_price"])
+    bars["bid_size"] = weighted_mean(df["bid_size"])
+    bars["ask_size"] = weighted_mean(df["ask_size"])
+    bars.index.name = "timestamp"
+    return bars.replace([np.inf, -np.inf], np.nan).reset_index()[BAR_COLUMNS]
+
+
+# =============================================================================
+# MANIFEST
+# =============================================================================
+def read_manifest(s3, bucket):
+    try:
+        obj = s3.get_object(Bucket=bucket, Key=MANIFEST_KEY)
+        return json.loads(obj["Body"].read())
+    except s3.exceptions.NoSuchKey:
+        return {}
+
+
+def write_manifest(s3, bucket, manifest):
+    body = json.dumps(manifest, indent=1, sort_keys=True)
+    s3.put_object(Bucket=bucket, Key=MANIFEST_KEY, Body=body)
+
+
+def source_etag(s3, bucket, key):
+    try:
+        return s3.head_object(Bucket=bucket, Key=key)["ETag"]
+    except s3.exceptions.ClientError:
+        return None
+
+
+# =============================================================================
+# COMPACT ONE DAY, ONLY MARKETS WHOSE RAW FILE CHANGED SINCE LAST TIME
+# =============================================================================
+def compact_bars(s3, bucket, markets, day, fmt, resolutions=RESOLUTIONS, force=False):
+    manifest = read_manifest(s3, bucket)
+    built = 0
+    for market in markets:
+        key = fmt.daily_key(market, day)
+        etag = source_etag(s3, bucket, key)
+        entry = f"{market}/{day}"
+        if etag is None or (not force and manifest.get(entry) == etag):
+            continue
+        df = fmt.deserialize(s3.get_object(Bucket=bucket, Key=key)["Body"].read())
+        for resolution in resolutions:
+            bars = compute_bars(df, day, resolution)
+            s3.put_object(
+                Bucket=bucket,
+                Key=bars_key(resolution, market, day, fmt),
+                Body=fmt.serialize(bars),
+            )
+        manifest[entry] = etag
+        built += 1
+        print(f"Bars built for {market} {day}")
+    if built:
+        write_manifest(s3, bucket, manifest)
+    return built
+
+
+def load_bars(s3, bucket, resolution, market, day, fmt):
+    key = bars_key(resolution, market, day, fmt)
+    return fmt.deserialize(s3.get_object(Bucket=bucket, Key=key)["Body"].read())
+
+
+if __name__ == "__main__":
+    from main import S3, BUCKET_NAME, MARKETS
+
+    if len(sys.argv) > 1:
+        day = sys.argv[1]
+    else:
+        day = str(dt.datetime.now(dt.timezone.utc).date() - dt.timedelta(days=1))
+    fmt = get_format(os.getenv("OUTPUT_FORMAT", "csv"))
+    compact_bars(S3, BUCKET_NAME, MARKETS, day, fmt, force="--force" in sys.argv)
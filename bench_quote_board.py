@@ -0,0 +1,62 @@
+# =============================================================================
+# IMPORTS
+# =============================================================================
+import os, sys, time, tempfile, multiprocessing
+from quote_board import BoardWriter, QuoteBoard
+
+# =============================================================================
+# BENCHMARK: QUOTE BOARD READS WHILE ANOTHER PROCESS WRITES FLAT OUT
+#
+#   python bench_quote_board.py [seconds, default 3]
+#
+# The writer publishes bid = k, ask = k + 1, sizes = k for k = 1, 2, ... so a
+# torn read (fields from two different updates) shows up as a mismatch.
+# =============================================================================
+MARKETS = [f"M{i}-USD" for i in range(37)]
+
+
+def write_forever(path, stop):
+    writer = BoardWriter(path, MARKETS)
+    k = 0
+    while not stop.is_set():
+        k += 1
+        for market in MARKETS:
+            writer.publish(market, k, k, k + 1, k, k, time.time(), 0)
+
+
+def torn(fields):
+    bid, bid_size, ask, ask_size, tick, _, _ = fields
+    return not (ask == bid + 1 and bid_size == bid and ask_size == bid and tick == bid)
+
+
+if __name__ == "__main__":
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 3
+    path = os.path.join(tempfile.mkdtemp(prefix="board-"), "quotes")
+    BoardWriter(path, MARKETS).close()
+    stop = multiprocessing.Event()
+    writer = multiprocessing.Process(target=write_forever, args=(path, stop))
+    writer.start()
+
+    try:
+        board = QuoteBoard(path)
+        while board.read(MARKETS[-1]) is None:
+            time.sleep(0.01)
+        reads = bad = 0
+        started = time.perf_counter()
+        while time.perf_counter() - started < seconds:
+            for market in MARKETS:
+                bad += torn(board.read(market))
+            reads += len(MARKETS)
+        elapsed = time.perf_counter() - started
+
+        mids = 0
+        started = time.perf_counter()
+        for _ in range(10000):
+            mids += board.mid(MARKETS[0]) is not None
+        mid_elapsed = time.perf_counter() - started
+    finally:
+        stop.set()
+        writer.join()
+
+    print(f"read():  {elapsed / reads * 1e6:.2f} us each, {reads} reads, {bad} torn")
+    print(f"mid():   {mid_elapsed / mids * 1e6:.2f} us each")
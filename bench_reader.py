@@ -0,0 +1,106 @@
+# =============================================================================
+# IMPORTS
+# =============================================================================
+import tempfile, time
+import pandas as pd
+from bench_storage_formats import synthetic_day
+from local_s3 import LocalS3
+from storage_formats import FORMATS
+from reader import Reader, ChunkCache, write_csv_index
+
+# =============================================================================
+# BENCHMARK: PARTIAL RANGE READS VS DOWNLOADING WHOLE DAILY FILES
+#
+#   python bench_reader.py
+#
+# Three synthetic days (one row per second) per format in a LocalS3 bucket.
+# Every query is run as a full-file read (GET everything, parse, filter),
+# through the reader without a cache, and through the reader again warm.
+# =============================================================================
+BUCKET = "bench"
+MARKET = "ETH-USD"
+DAYS = ["2023-01-19", "2023-01-20", "2023-01-21"]
+QUERIES = [
+    ("5 min", "2023-01-20 10:00", "2023-01-20 10:05"),
+    ("2 days", "2023-01-19 10:00", "2023-01-21 10:05"),
+    ("1 h", "2023-01-20 10:00", "2023-01-20 11:00"),
+]
+COLUMNS = ["mid"]
+REPEAT = 3
+
+
+class CountingS3:
+    # counts GETs and bytes transferred, passes everything through
+    def __init__(self, s3):
+        self.s3 = s3
+        self.exceptions = s3.exceptions
+        self.gets = 0
+        self.bytes = 0
+
+    def get_object(self, **kwargs):
+        res = self.s3.get_object(**kwargs)
+        self.gets += 1
+        self.bytes += res["ContentLength"]
+        return res
+
+    def __getattr__(self, name):
+        return getattr(self.s3, name)
+
+
+def populate(s3, fmt):
+    for day in DAYS:
+        df = synthetic_day()
+        df["timestamp"] = pd.date_range(day, periods=len(df), freq="1s").astype(str)
+        body = fmt.serialize(df)
+        res = s3.put_object(Bucket=BUCKET, Key=fmt.daily_key(MARKET, day), Body=body)
+        if fmt.name == "csv":
+            write_csv_index(s3, BUCKET, fmt.daily_key(MARKET, day), body, res["ETag"])
+
+
+def full_read(s3, fmt, start, end):
+    start, end = pd.Timestamp(start), pd.Timestamp(end)
+    frames = []
+    for day in DAYS:
+        data = s3.get_object(Bucket=BUCKET, Key=fmt.daily_key(MARKET, day))
+        df = fmt.deserialize(data["Body"].read())
+        df["timestamp"] = pd.to_datetime(df["timestamp"])
+        frames.append(df[(df["timestamp"] >= start) & (df["timestamp"] < end)])
+    return pd.concat(frames)[["timestamp"] + COLUMNS]
+
+
+def measure(s3, fn):
+    best = float("inf")
+    for _ in range(REPEAT):
+        s3.gets = s3.bytes = 0
+        t = time.perf_counter()
+        rows = len(fn())
+        best = min(best, time.perf_counter() - t)
+    return best, rows, s3.gets, s3.bytes
+
+
+def report(label, result):
+    best, rows, gets, nbytes = result
+    print(
+        f"    {label:>10}: {best * 1e3:8.2f} ms  {rows:6d} rows  "
+        f"{gets:3d} GETs  {nbytes / 1024:9.1f} KiB"
+    )
+
+
+if __name__ == "__main__":
+    root = tempfile.mkdtemp()
+    s3 = CountingS3(LocalS3(root))
+    for fmt in FORMATS.values():
+        populate(s3, fmt)
+        for name, start, end in QUERIES:
+            print(f"{fmt.name} {name}")
+            report("full", measure(s3, lambda: full_read(s3, fmt, start, end)))
+
+            cold = Reader(s3, BUCKET, fmt)
+            load = lambda: cold.load(MARKET, start, end, COLUMNS)
+            report("ranged", measure(s3, load))
+
+            cache = ChunkCache(tempfile.mkdtemp(dir=root))
+            warm = Reader(s3, BUCKET, fmt, cache)
+            warm.load(MARKET, start, end, COLUMNS)
+            load = lambda: warm.load(MARKET, start, end, COLUMNS)
+            report("cached", measure(s3, load))
@@ -0,0 +1,77 @@
+# =============================================================================
+# IMPORTS
+# =============================================================================
+import os, sys, time, tempfile, subprocess
+from replay import Recording, StubServer, synthesize
+
+# =============================================================================
+# BENCHMARK: COLD START OF A ONE-SHOT SNAPSHOT RUN
+#
+#   python bench_startup.py [runs, default 5]
+#
+# Every run is a fresh interpreter, the way the scheduler starts us:
+#   import      `import main` and nothing else
+#   cold cache  `python main.py` with no market params cache on disk
+#   warm cache  `python main.py` with a fresh cache on disk
+# The exchange and webhook are a local stub serving a synthetic recording,
+# S3 is MemoryS3, so only our own startup + one tick is measured.
+# =============================================================================
+TICKS = 5
+
+
+def timed_run(args, env):
+    started = time.perf_counter()
+    subprocess.run(
+        [sys.executable] + args,
+        env=env,
+        check=True,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    return time.perf_counter() - started
+
+
+def bench(label, runs, args, env, before=None):
+    times = []
+    for _ in range(runs):
+        if before is not None:
+            before()
+        times.append(timed_run(args, env))
+    times.sort()
+    print(
+        f"{label:>12}: best {times[0] * 1e3:7.1f} ms  "
+        f"median {times[len(times) // 2] * 1e3:7.1f} ms"
+    )
+
+
+if __name__ == "__main__":
+    from constants import MARKETS
+
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    scratch = tempfile.mkdtemp(prefix="startup-")
+    recording = os.path.join(scratch, "recording")
+    synthesize(recording, MARKETS, TICKS)
+    stub = StubServer(Recording(recording)).start()
+
+    cache = os.path.join(scratch, "market_params.json")
+    env = dict(
+        os.environ,
+        DYDX_URL=f"{stub.url}/v3",
+        DISCORD_WEBHOOK_URL=f"{stub.url}/webhook",
+        S3_BACKEND="memory",
+        MARKET_PARAMS_FILE=cache,
+        QUALITY_STATE_FILE=os.path.join(scratch, "quality_state.json"),
+        CHANGES_STATE_FILE=os.path.join(scratch, "changes_state.json"),
+        LAST_DAY_FILE=os.path.join(scratch, "last_day"),
+        DYDX_RATE_LIMIT="10000",
+    )
+
+    def drop_cache():
+        if os.path.exists(cache):
+            os.remove(cache)
+
+    bench("python", runs, ["-c", "pass"], env)
+    bench("import", runs, ["-c", "import main"], env)
+    bench("cold cache", runs, ["main.py"], env, before=drop_cache)
+    bench("warm cache", runs, ["main.py"], env)
+    stub.stop()
@@ -0,0 +1,51 @@
+# =============================================================================
+# IMPORTS
+# =============================================================================
+import sys, timeit
+import numpy as np
+import pandas as pd
+from storage_formats import FORMATS
+
+# =============================================================================
+# BENCHMARK: SIZE AND READ SPEED OF EACH STORAGE FORMAT
+#
+#   python bench_storage_formats.py [csv file, defaults to result.csv]
+#
+# Besides the file itself, a synthetic full day (one row per second) in the
+# same columns is measured, since that is what a backtest reads per market.
+# =============================================================================
+REPEAT = 5
+
+
+def synthetic_day():
+    rng = np.random.default_rng(0)
+    n = 86400
+    mid = 20 + np.cumsum(rng.normal(0, 0.01, n))
+    spread = 0.001 * rng.integers(1, 5, n)
+    return pd.DataFrame(
+        {
+            "timestamp": pd.date_range("2023-01-19", periods=n, freq="1s").astype(str),
+            "bid_price": (mid - spread / 2).round(3),
+            "ask_price": (mid + spread / 2).round(3),
+            "mid": mid.round(6),
+            "bid_size": rng.uniform(1, 500, n).round(1),
+            "ask_size": rng.uniform(1, 500, n).round(1),
+        }
+    )
+
+
+def bench(name, df):
+    print(f"{name}: {len(df)} rows")
+    for fmt in FORMATS.values():
+        data = fmt.serialize(df)
+        number = 5
+        timer = timeit.Timer(lambda: fmt.deserialize(data))
+        best = min(timer.repeat(number=number, repeat=REPEAT)) / number
+        size = len(data) / 1024
+        print(f"  {fmt.name:>8}: {size:10.1f} KiB  read {best * 1e3:8.2f} ms")
+
+
+if __name__ == "__main__":
+    path = sys.argv[1] if len(sys.argv) > 1 else "result.csv"
+    bench(path, pd.read_csv(path))
+    bench("synthetic day @ 1s", synthetic_day())
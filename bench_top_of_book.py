@@ -0,0 +1,106 @@
+# =============================================================================
+# IMPORTS
+# =============================================================================
+import os, sys, json, glob, random, timeit
+import pandas as pd
+from top_of_book import parse_top_of_book
+
+# =============================================================================
+# BENCHMARK: pandas top-of-book vs. top_of_book.parse_top_of_book
+#
+#   python bench_top_of_book.py [dir with recorded orderbook *.json]
+#
+# Without a directory, 37 books with dYdX-like depth are generated.
+# =============================================================================
+N_MARKETS = 37
+N_LEVELS = 100
+REPEAT = 5
+
+
+# =============================================================================
+# THE PREVIOUS main.extract_top_of_orderbook, KEPT HERE AS THE BASELINE
+# =============================================================================
+def process_orderbook_to_df(orderbook, _type):
+    df = pd.DataFrame(orderbook[_type])
+    df["price"] = pd.to_numeric(df["price"])
+    df["size"] = pd.to_numeric(df["size"])
+    return df
+
+
+def extract_top_of_orderbook_pandas(market, orderbook):
+    asks = process_orderbook_to_df(orderbook, "asks")
+    bids = process_orderbook_to_df(orderbook, "bids")
+
+    best_ask = asks.iloc[asks["price"].idxmin()]
+    best_bid = bids.iloc[bids["price"].idxmax()]
+    return {
+        "market": market,
+        "ask_price": best_ask["price"],
+        "ask_size": best_ask["size"],
+        "bid_price": best_bid["price"],
+        "bid_size": best_bid["size"],
+    }
+
+
+# =============================================================================
+# PAYLOADS
+# =============================================================================
+def load_recorded(directory):
+    books = []
+    for path in sorted(
+        glob.glob(os.path.join(directory, "**", "*.json"), recursive=True)
+    ):
+        with open(path) as f:
+            payload = json.load(f)
+        if "bids" in payload and "asks" in payload:
+            books.append((os.path.basename(os.path.dirname(path)), payload))
+    return books
+
+
+def synthetic_books():
+    rng = random.Random(0)
+    books = []
+    for i in range(N_MARKETS):
+        mid = rng.uniform(0.1, 20000)
+        tick = mid / 10000
+        book = {
+            "bids": synthetic_side(rng, mid, -tick),
+            "asks": synthetic_side(rng, mid, tick),
+        }
+        books.append((f"MKT{i}-USD", book))
+    return books
+
+
+def synthetic_side(rng, mid, step):
+    return [
+        {"price": f"{mid + (k + 1) * step:.6f}", "size": f"{rng.uniform(0.1, 500):.4f}"}
+        for k in range(N_LEVELS)
+    ]
+
+
+# =============================================================================
+# RUN
+# =============================================================================
+def bench(books):
+    for market, book in books:
+        old = extract_top_of_orderbook_pandas(market, book)
+        new = parse_top_of_book(market, book).as_dict()
+        assert old == new, (old, new)
+
+    def tick_pandas():
+        for market, book in books:
+            extract_top_of_orderbook_pandas(market, book)
+
+    def tick_fast():
+        for market, book in books:
+            parse_top_of_book(market, book)
+
+    for name, fn in (("pandas", tick_pandas), ("fast", tick_fast)):
+        number = 20 if name == "pandas" else 2000
+        best = min(timeit.repeat(fn, number=number, repeat=REPEAT)) / number
+        print(f"{name:>8}: {best * 1e3:9.3f} ms / tick ({len(books)} books)")
+
+
+if __name__ == "__main__":
+    books = load_recorded(sys.argv[1]) if len(sys.argv) > 1 else synthetic_books()
+    bench(books)
@@ -0,0 +1,342 @@
+# =============================================================================
+# IMPORTS
+# =============================================================================
+import os, sys, json, time, threading
+import datetime as dt
+import http_client
+from constants import DYDX_URL, MARKETS, BUCKET_NAME
+from segment_writer import (
+    write_segment_rows,
+    list_segments,
+    delete_keys,
+    segment_id,
+)
+from fetch_scheduler import (
+    FetchScheduler,
+    TokenBucket,
+    RateLimited,
+    retry_after_from_response,
+)
+from metrics import METRICS
+
+# =============================================================================
+# CANDLE PULLER, RUNS NEXT TO THE ORDERBOOK PULLER
+#
+#   python candles.py [--once]
+#
+# dYdX keeps revising a candle after its minute is over (more trades, a
+# later updatedAt), so a candle is only done once it stops changing. Every
+# poll fetches each market's candles from the oldest one still open, an
+# index keyed by (market, startedAt) keeps the newest updatedAt seen, and
+# only candles whose updatedAt advanced are written, one object per poll:
+#   candles/{resolution}/{day}/{poll segment_id}.csv
+# A candle is final once CANDLE_SETTLE_SECONDS passed after both its end and
+# its last change. When a whole day is final, its revisions are compacted to
+# the latest one per candle, one file per market:
+#   candles/{resolution}/{market}/{market}_{day}.csv
+# =============================================================================
+CANDLE_RESOLUTION = os.getenv("CANDLE_RESOLUTION", "1MIN")
+RESOLUTION_SECONDS = {
+    "1MIN": 60,
+    "5MINS": 300,
+    "15MINS": 900,
+    "30MINS": 1800,
+    "1HOUR": 3600,
+    "4HOURS": 14400,
+    "1DAY": 86400,
+}
+CANDLE_POLL_SECONDS = float(os.getenv("CANDLE_POLL_SECONDS", 15))
+CANDLE_SETTLE_SECONDS = float(os.getenv("CANDLE_SETTLE_SECONDS", 120))
+CANDLE_MAX_LIMIT = 100  # most candles dYdX returns per request
+CANDLE_FIRST_LIMIT = int(os.getenv("CANDLE_FIRST_LIMIT", 3))
+CANDLES_STATE_FILE = os.getenv("CANDLES_STATE_FILE", ".candles_state.json")
+CANDLE_COLUMNS = [
+    "market",
+    "startedAt",
+    "updatedAt",
+    "open",
+    "high",
+    "low",
+    "close",
+    "baseTokenVolume",
+    "usdVolume",
+    "trades",
+    "startingOpenInterest",
+]
+
+
+def candles_prefix(resolution):
+    return f"candles/{resolution}"
+
+
+def candles_daily_key(resolution, market, day):
+    return f"{candles_prefix(resolution)}/{market}/{market}_{day}.csv"
+
+
+def parse_iso(ts):
+    # "2023-01-03T16:15:00.000Z" -> unix seconds
+    return dt.datetime.fromisoformat(ts.replace("Z", "+00:00")).timestamp()
+
+
+def day_of(ts):
+    return str(dt.datetime.fromtimestamp(ts, dt.timezone.utc).date())
+
+
+# =============================================================================
+# INDEX OF THE CANDLES STILL OPEN, (market, startedAt) -> REVISION
+# =============================================================================
+class CandleIndex:
+    def __init__(self, resolution=CANDLE_RESOLUTION, settle=CANDLE_SETTLE_SECONDS):
+        self.seconds = RESOLUTION_SECONDS[resolution]
+        self.settle = settle
+        self.open = {}  # (market, startedAt) -> [updatedAt, changed at]
+        self.final = {}  # market -> newest final startedAt
+        self.compacted = None  # last day compacted
+        self.lock = threading.Lock()
+
+    def is_revision(self, market, candle):
+        # a new candle or a newer revision of an open one
+        with self.lock:
+            return self._is_revision(market, candle)
+
+    def _is_revision(self, market, candle):
+        final = self.final.get(market)
+        if final is not None and candle["startedAt"] <= final:
+            return False
+        entry = self.open.get((market, candle["startedAt"]))
+        return entry is None or candle["updatedAt"] > entry[0]
+
+    def upsert(self, market, candle, now):
+        # only once the revision is stored, see CandleIngestor.poll
+        with self.lock:
+            if not self._is_revision(market, candle):
+                return False
+            self.open[(market, candle["startedAt"])] = [candle["updatedAt"], now]
+        return True
+
+    def finalize(self, now):
+        done = []
+        with self.lock:
+            for (market, started), (_, changed) in list(self.open.items()):
+                end = parse_iso(started) + self.seconds
+                if now - max(end, changed) >= self.settle:
+                    del self.open[(market, started)]
+                    if started > self.final.get(market, ""):
+                        self.final[market] = started
+                    done.append((market, started))
+        return done
+
+    def limit(self, market, now):
+        # enough candles to reach back to the oldest one that may still move
+        with self.lock:
+            starts = [s for (m, s) in self.open if m == market]
+            oldest = min(starts) if starts else self.final.get(market)
+        if oldest is None:
+            return CANDLE_FIRST_LIMIT
+        n = int((now - parse_iso(oldest)) // self.seconds) + 1
+        return max(2, min(CANDLE_MAX_LIMIT, n))
+
+    def open_days(self):
+        with self.lock:
+            return {day_of(parse_iso(started)) for (_, started) in self.open}
+
+    def first_day(self):
+        # oldest day the index knows of, where compaction starts on a new index
+        with self.lock:
+            starts = [s for (_, s) in self.open] + list(self.final.values())
+        return day_of(parse_iso(min(starts))) if starts else None
+
+    # =========================================================================
+    # STATE ON DISK, A RESTART ONLY FETCHES WHAT WAS STILL OPEN
+    # =========================================================================
+    def load(self, path):
+        try:
+            with open(path) as f:
+                saved = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return False
+        with self.lock:
+            for market, started, updated, changed in saved["open"]:
+                self.open[(market, started)] = [updated, changed]
+            self.final.update(saved["final"])
+            self.compacted = saved.get("compacted")
+        return True
+
+    def save(self, path):
+        with self.lock:
+            saved = {
+                "open": [[m, s, u, c] for (m, s), (u, c) in self.open.items()],
+                "final": dict(self.final),
+                "compacted": self.compacted,
+            }
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(saved, f)
+        os.replace(tmp, path)
+
+
+# =============================================================================
+# INGESTOR: FETCH EVERY MARKET CONCURRENTLY, WRITE ONLY NEW REVISIONS
+# =============================================================================
+class CandleIngestor:
+    def __init__(
+        self,
+        s3,
+        bucket,
+        markets=MARKETS,
+        resolution=CANDLE_RESOLUTION,
+        base_url=DYDX_URL,
+        index=None,
+    ):
+        self.s3 = s3
+        self.bucket = bucket
+        self.markets = list(markets)
+        self.resolution = resolution
+        self.base_url = base_url
+        self.index = index or CandleIndex(resolution)
+        self.scheduler = FetchScheduler(
+            self.fetch,
+            lambda market: None,
+            TokenBucket(float(os.getenv("DYDX_RATE_LIMIT", 15))),
+            max_workers=int(os.getenv("FETCH_CONCURRENCY", 8)),
+            max_retries=3,
+            deadline=CANDLE_POLL_SECONDS,
+            on_error=self.report,
+            metrics=METRICS,
+        )
+        self.now = None
+
+    def fetch(self, market, timeout):
+        limit = self.index.limit(market, self.now)
+        res = http_client.get(
+            f"{self.base_url}/candles/{market}",
+            params={"resolution": self.resolution, "limit": limit},
+            timeout=timeout,
+        )
+        if res.status_code == 429:
+            raise RateLimited(retry_after_from_response(res))
+        res.raise_for_status()
+        return res.json()["candles"]
+
+    def report(self, market, e):
+        print(f"Failed fetching candles for market: {market}: {e}")
+        METRICS.inc("fetch_errors", market=market, error=type(e).__name__)
+
+    def poll(self, now=None):
+        self.now = now or time.time()
+        with METRICS.timer("candles_fetch"):
+            results = self.scheduler.run(self.markets)
+
+        revised = {}  # day -> [(market, candle)]
+        for market, candles in zip(self.markets, results):
+            for candle in candles or []:
+                if self.index.is_revision(market, candle):
+                    day = day_of(parse_iso(candle["startedAt"]))
+                    revised.setdefault(day, []).append((market, candle))
+
+        n_revised = 0
+        with METRICS.timer("candles_store"):
+            now_s = str(dt.datetime.fromtimestamp(self.now, dt.timezone.utc))
+            seg_id = segment_id(now_s.split("+")[0])
+            for day, candles in revised.items():
+                rows = [dict(candle, market=market) for market, candle in candles]
+                try:
+                    write_segment_rows(
+                        self.s3,
+                        self.bucket,
+                        candles_prefix(self.resolution),
+                        day,
+                        rows,
+                        CANDLE_COLUMNS,
+                        seg_id,
+                    )
+                except Exception as e:
+                    # left out of the index, so the next poll fetches them again
+                    print(f"Failed storing candles for {day}: {e}")
+                    METRICS.inc("candle_store_errors")
+                    continue
+                for market, candle in candles:
+                    self.index.upsert(market, candle, self.now)
+                n_revised += len(rows)
+        METRICS.inc("candle_revisions", n_revised)
+        METRICS.inc("candles_final", len(self.index.finalize(self.now)))
+        self.compact_finished_days()
+        return n_revised
+
+    # =========================================================================
+    # A DAY WITH NO OPEN CANDLE LEFT: LATEST REVISION PER CANDLE, PER MARKET
+    # =========================================================================
+    def compact_finished_days(self):
+        # every day up to yesterday, also the ones missed while we were down
+        yesterday = day_of(self.now - 86400)
+        if self.index.compacted is not None:
+            day = next_day(self.index.compacted)
+        else:
+            day = min(self.index.first_day() or yesterday, yesterday)
+        open_days = self.index.open_days()
+        while day <= yesterday and day not in open_days:
+            written = compact_candles(self.s3, self.bucket, self.resolution, day)
+            self.index.compacted = day
+            if written:
+                print(f"Candles for {day} final, compacted into {len(written)} files")
+            day = next_day(day)
+
+
+def next_day(day):
+    return str(dt.date.fromisoformat(day) + dt.timedelta(days=1))
+
+
+def compact_candles(s3, bucket, resolution, day):
+    import pandas as pd
+
+    prefix = candles_prefix(resolution)
+    keys = list_segments(s3, bucket, prefix, day)
+    if not keys:
+        return []
+    frames = [
+        pd.read_csv(s3.get_object(Bucket=bucket, Key=key)["Body"], dtype=str)
+        for key in keys
+    ]
+    df = pd.concat(frames, ignore_index=True)
+    # the newest revision of every candle wins, whatever order it came in
+    df = df.sort_values(["market", "startedAt", "updatedAt"])
+    df = df.drop_duplicates(subset=["market", "startedAt"], keep="last")
+
+    written = []
+    for market, candles in df.groupby("market"):
+        key = candles_daily_key(resolution, market, day)
+        body = candles.drop(columns="market").to_csv(index=False)
+        s3.put_object(Bucket=bucket, Key=key, Body=body)
+        written.append(key)
+    delete_keys(s3, bucket, keys)
+    return written
+
+
+# =============================================================================
+# LOOP
+# =============================================================================
+def run(ingestor, every=CANDLE_POLL_SECONDS, state_file=CANDLES_STATE_FILE):
+    ingestor.index.load(state_file)
+    while True:
+        started = time.time()
+        try:
+            n = ingestor.poll(started)
+            print(f"{n} candle revisions written")
+        except Exception as e:
+            print(f"Candle poll failed: {e}")
+        ingestor.index.save(state_file)
+        time.sleep(max(0.0, every - (time.time() - started)))
+
+
+if __name__ == "__main__":
+    from aws import LazyS3Client
+    from metrics import InstrumentedS3
+
+    s3 = InstrumentedS3(LazyS3Client(), METRICS)
+    ingestor = CandleIngestor(s3, BUCKET_NAME)
+    if "--once" in sys.argv[1:]:
+        ingestor.index.load(CANDLES_STATE_FILE)
+        print(f"{ingestor.poll()} candle revisions written")
+        ingestor.index.save(CANDLES_STATE_FILE)
+    else:
+        run(ingestor)
@@ -0,0 +1,126 @@
+# =============================================================================
+# IMPORTS
+# =============================================================================
+import os, json, math, threading
+import datetime as dt
+
+# =============================================================================
+# CHANGE-ONLY RECORDING
+#
+# With RECORD_CHANGES_ONLY=1 a market's row is only stored when its top of
+# book (prices, sizes, quality) differs from the last one stored, or when
+# HEARTBEAT_SECONDS have passed since, or on the first tick of a UTC day.
+# Every stored row holds until the next one; no row for longer than
+# max_gap() means no data (the puller wasn't running), which is what the
+# heartbeats are for. expand_to_grid() turns a stream back into one row per
+# slot.
+# =============================================================================
+RECORD_CHANGES_ONLY = os.getenv("RECORD_CHANGES_ONLY", "0") == "1"
+HEARTBEAT_SECONDS = float(os.getenv("HEARTBEAT_SECONDS", 300))
+KEY_FIELDS = ["bid_price", "bid_size", "ask_price", "ask_size", "quality"]
+
+
+def max_gap(heartbeat=HEARTBEAT_SECONDS):
+    # a heartbeat can be late by up to a tick, leave room for a missed one
+    return 2 * heartbeat
+
+
+def book_key(bid_ask):
+    # nan != nan, so nan rows compare through None
+    key = []
+    for field in KEY_FIELDS:
+        value = bid_ask.get(field)
+        if isinstance(value, float) and math.isnan(value):
+            value = None
+        key.append(value)
+    return key
+
+
+# =============================================================================
+# LAST STORED BOOK PER MARKET, DECIDES WHAT GETS STORED
+# =============================================================================
+class ChangeFilter:
+    def __init__(self, heartbeat=HEARTBEAT_SECONDS):
+        self.heartbeat = heartbeat
+        self.last = {}  # market -> [book key, stored at (unix s)]
+        self.lock = threading.Lock()
+
+    def changed(self, market, bid_ask, now):
+        key = book_key(bid_ask)
+        with self.lock:
+            last = self.last.get(market)
+            if last is not None:
+                last_key, stored_at = last
+                same_day = day_of(stored_at) == day_of(now)
+                if last_key == key and same_day and now - stored_at < self.heartbeat:
+                    return False
+            self.last[market] = [key, now]
+        return True
+
+    def filter(self, rows, now_s):
+        now = timestamp_of(now_s)
+        return [row for row in rows if self.changed(row["market"], row, now)]
+
+    # =========================================================================
+    # STATE ON DISK, SO ONE-SHOT RUNS KNOW WHAT THE LAST ONE STORED
+    # =========================================================================
+    def load(self, path):
+        try:
+            with open(path) as f:
+                saved = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return False
+        self.restore(saved)
+        return True
+
+    def save(self, path):
+        saved = self.state()
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(saved, f)
+        os.replace(tmp, path)
+
+    def state(self):
+        # JSON-able, for load / save and sharding.py's shared copy
+        with self.lock:
+            return dict(self.last)
+
+    def restore(self, saved):
+        with self.lock:
+            self.last.update(saved)
+
+
+def timestamp_of(now_s):
+    ts = dt.datetime.fromisoformat(now_s).replace(tzinfo=dt.timezone.utc)
+    return ts.timestamp()
+
+
+def day_of(ts):
+    return dt.datetime.fromtimestamp(ts, dt.timezone.utc).date()
+
+
+# =============================================================================
+# BACK TO A REGULAR GRID: EVERY SLOT GETS THE LAST ROW AT OR BEFORE IT, IF
+# THAT ROW IS NO OLDER THAN max_gap SECONDS, NAN OTHERWISE
+# =============================================================================
+def expand_to_grid(df, start, end, freq, gap=None):
+    import pandas as pd
+    from storage_formats import parse_timestamps
+
+    gap = max_gap() if gap is None else gap
+    grid = pd.DataFrame(
+        {"timestamp": pd.date_range(start, end, freq=freq, inclusive="left")}
+    )
+    if not len(df):
+        return grid.reindex(columns=list(df.columns) or ["timestamp"])
+    df = df.copy()
+    df["timestamp"] = parse_timestamps(df["timestamp"]).astype("datetime64[ns]")
+    df = df.sort_values("timestamp")
+    expanded = pd.merge_asof(
+        grid.astype({"timestamp": "datetime64[ns]"}),
+        df,
+        on="timestamp",
+        direction="backward",
+        tolerance=pd.Timedelta(seconds=gap),
+    )
+    return expanded[list(df.columns)]
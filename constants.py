@@ -1,3 +1,67 @@
+# =============================================================================
+# IMPORTS
+# =============================================================================
+import os
+
+# =============================================================================
+# EXCHANGE
+# =============================================================================
+DYDX_URL = os.getenv("DYDX_URL", "https://api.dydx.exchange/v3")
+MARKETS = [
+    "1INCH-USD",
+    "AAVE-USD",
+    "ADA-USD",
+    "ALGO-USD",
+    "ATOM-USD",
+    "AVAX-USD",
+    "BTC-USD",
+    "BCH-USD",
+    "CELO-USD",
+    "ETC-USD",
+    "COMP-USD",
+    "ICP-USD",
+    "CRV-USD",
+    "DOGE-USD",
+    "DOT-USD",
+    "ENJ-USD",
+    "EOS-USD",
+    "ETH-USD",
+    "FIL-USD",
+    "LINK-USD",
+    "LTC-USD",
+    "MATIC-USD",
+    "MKR-USD",
+    "NEAR-USD",
+    "RUNE-USD",
+    "SNX-USD",
+    "SOL-USD",
+    "SUSHI-USD",
+    "TRX-USD",
+    "UMA-USD",
+    "UNI-USD",
+    "XLM-USD",
+    "XMR-USD",
+    "XTZ-USD",
+    "YFI-USD",
+    "ZEC-USD",
+    "ZRX-USD",
+]
+
+# =============================================================================
+# STORAGE
+# =============================================================================
+BUCKET_NAME = "dydx-orderbook"
+CSV_HEADER = [
+    "timestamp",
+    "bid_price",
+    "ask_price",
+    "mid",
+    "bid_size",
+    "ask_size",
+    "quality",
+]
+
+
 pairs = [
     "AAVE-USD"
     "ADA-USD"
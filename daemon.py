@@ -0,0 +1,247 @@
+# =============================================================================
+# IMPORTS
+# =============================================================================
+import os, time, math, asyncio, threading
+import datetime as dt
+import aiohttp
+import main
+from main import (
+    DYDX_URL,
+    MARKETS,
+    MARKET_PARAMS,
+    DYDX,
+    DYDX_BUCKET,
+    build_market_params,
+    load_market_params,
+    load_rolling_state,
+    save_rolling_state,
+    grade_venue_rows,
+    write_market_params_cache,
+    extract_top_of_orderbook,
+    attach_levels,
+    check_if_bid_ask_proper,
+    add_mid_to_bid_ask,
+    store_bid_asks,
+    store_depth,
+    DEPTH_LEVELS,
+    VENUE_ADAPTERS,
+    QUOTE_BOARD,
+    publish_quotes,
+    create_relevant_date_strings,
+    create_nan_bid_ask_dict,
+    ALERTS,
+)
+from wal import WalFlusher, WAL_FLUSH_INTERVAL, WAL_FLUSH_ROWS
+from metrics import METRICS, METRICS_PORT, METRICS_JSON, JsonDumper, serve
+from venues import snapshot_venues, venue_rows, venue_skew
+from fetch_scheduler import RateLimited, next_retry, retry_after_from_response
+
+# =============================================================================
+# CONFIG
+# =============================================================================
+SNAPSHOT_INTERVAL = float(os.getenv("SNAPSHOT_INTERVAL", 1.0))
+MARKET_PARAMS_REFRESH = float(os.getenv("MARKET_PARAMS_REFRESH", 3600))
+MAX_RETRIES = 3
+BASE_BACKOFF = 0.05
+MAX_BACKOFF = 0.5
+
+
+# =============================================================================
+# WALL-CLOCK ALIGNED SCHEDULE
+#
+# Ticks land on multiples of the interval (…:00.0, …:00.5, …:01.0 for 0.5s),
+# computed from the clock rather than by adding sleeps, so drift never builds
+# up and a slow tick skips ahead instead of bunching the following ones.
+# =============================================================================
+def next_tick(now, interval):
+    return (math.floor(now / interval) + 1) * interval
+
+
+async def sleep_until(ts):
+    await asyncio.sleep(max(0.0, ts - time.time()))
+
+
+# =============================================================================
+# FETCH ONE MARKET, GIVES UP AT THE DEADLINE WITH A NAN ROW
+# =============================================================================
+async def fetch_bid_ask(session, market, deadline):
+    for attempt in range(MAX_RETRIES):
+        wait = DYDX_BUCKET.reserve()
+        if time.time() + wait >= deadline:
+            break
+        await asyncio.sleep(wait)
+        remaining = deadline - time.time()
+        ((url, params, _),) = DYDX.requests([market])
+        try:
+            with METRICS.timer("http_fetch", market=market):
+                res = await session.get(
+                    url,
+                    params=params,
+                    timeout=aiohttp.ClientTimeout(total=remaining),
+                )
+            async with res:
+                if res.status == 429:
+                    raise RateLimited(retry_after_from_response(res))
+                res.raise_for_status()
+                with METRICS.timer("json_decode", market=market):
+                    orderbook = await res.json()
+            with METRICS.timer("top_of_book", market=market):
+                bid_ask = extract_top_of_orderbook(market, orderbook)
+            attach_levels(bid_ask, orderbook)
+            bid_ask["received"] = time.time()
+            with METRICS.timer("check_bid_ask", market=market):
+                return check_if_bid_ask_proper(bid_ask)
+        except Exception as e:
+            print(f"Failed fetching data for market: {market}")
+            METRICS.inc("fetch_errors", market=market, error=type(e).__name__)
+            ALERTS.submit(e, market)
+            # same policy as FetchScheduler: no sleep after the last attempt
+            # or past the deadline, whatever Retry-After says
+            delay, gave_up = next_retry(
+                e,
+                attempt,
+                MAX_RETRIES,
+                BASE_BACKOFF,
+                MAX_BACKOFF,
+                deadline,
+                time.time(),
+            )
+        if gave_up is not None:
+            METRICS.inc(gave_up, market=market)
+            return create_nan_bid_ask_dict(market)
+        METRICS.inc("retries", market=market)
+        await asyncio.sleep(delay)
+    METRICS.inc("deadline_missed", market=market)
+    return create_nan_bid_ask_dict(market)
+
+
+# =============================================================================
+# ONE SNAPSHOT OF EVERY MARKET, STAMPED WITH THE SCHEDULED TICK TIME
+# =============================================================================
+async def snapshot(session, tick, interval):
+    started = time.perf_counter()
+    deadline = tick + interval
+    # dYdX and every other venue start together, all stamped with `tick`
+    dydx = asyncio.gather(
+        *(fetch_bid_ask(session, market, deadline) for market in MARKETS)
+    )
+    venues = {adapter: MARKETS for adapter in VENUE_ADAPTERS}
+    others = snapshot_venues(session, venues, max(0.1, deadline - time.time()))
+    results, quotes = await asyncio.gather(dydx, others)
+    METRICS.observe("fetch_batch", time.perf_counter() - started)
+    if VENUE_ADAPTERS:
+        results += venues_to_rows(results, quotes)
+
+    now = dt.datetime.fromtimestamp(tick, dt.timezone.utc)
+    now_s, today = create_relevant_date_strings(now)
+    rows = [add_mid_to_bid_ask(bid_ask) for bid_ask in results]
+    if QUOTE_BOARD:
+        publish_quotes(rows, tick)
+    # S3 / disk writes are blocking, keep them off the event loop
+    await asyncio.get_running_loop().run_in_executor(
+        None, timed_store, rows, now_s, today
+    )
+    METRICS.observe("tick", time.perf_counter() - started)
+    # how late after the scheduled tick time the snapshot was done
+    METRICS.observe("tick_lag", max(0.0, time.time() - tick))
+
+
+def venues_to_rows(dydx_rows, quotes):
+    received = {
+        ("dydx", bid_ask["market"]): bid_ask["received"]
+        for bid_ask in dydx_rows
+        if "received" in bid_ask
+    }
+    received.update({key: quote.received for key, quote in quotes.items()})
+    # how far apart in time the venues' books for the same market really are
+    for market, skew in venue_skew(received).items():
+        METRICS.observe("venue_skew", skew, market=market)
+
+    rows = []
+    for adapter in VENUE_ADAPTERS:
+        venue_quotes = {m: q for (v, m), q in quotes.items() if v == adapter.name}
+        rows += venue_rows(adapter.name, MARKETS, venue_quotes)
+    return grade_venue_rows(rows)
+
+
+def timed_store(rows, now_s, today):
+    if DEPTH_LEVELS:
+        with METRICS.timer("depth"):
+            store_depth(rows, now_s, today)
+    with METRICS.timer("store"):
+        store_bid_asks(rows, now_s, today)
+    # first tick of a new UTC day: compact the last one and build its bars
+    finished_day = main.detect_day_rollover(today)
+    if finished_day is not None:
+        threading.Thread(target=main.roll_over_day, args=(finished_day,)).start()
+
+
+# =============================================================================
+# REFRESH MARKET_PARAMS ON A SLOW TIMER, IN PLACE
+# =============================================================================
+async def refresh_market_params(session, every):
+    while True:
+        await asyncio.sleep(every)
+        try:
+            async with session.get(f"{DYDX_URL}/markets") as res:
+                markets = (await res.json())["markets"]
+            params = build_market_params(markets)
+            MARKET_PARAMS.update(params)
+            write_market_params_cache(params)
+        except Exception as e:
+            print(f"Failed refreshing market params: {e}")
+
+
+# =============================================================================
+# EVENT LOOP
+# =============================================================================
+async def run(interval=SNAPSHOT_INTERVAL, params_refresh=MARKET_PARAMS_REFRESH):
+    load_market_params()
+    load_rolling_state()
+    connector = aiohttp.TCPConnector(
+        limit=len(MARKETS) + len(VENUE_ADAPTERS), ttl_dns_cache=300
+    )
+    async with aiohttp.ClientSession(connector=connector) as session:
+        refresher = asyncio.create_task(refresh_market_params(session, params_refresh))
+        pending = set()
+        tick = next_tick(time.time(), interval)
+        try:
+            while True:
+                await sleep_until(tick)
+                task = asyncio.create_task(snapshot(session, tick, interval))
+                pending.add(task)
+                task.add_done_callback(pending.discard)
+                tick = next_tick(max(time.time(), tick), interval)
+        finally:
+            refresher.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+            save_rolling_state()
+
+
+if __name__ == "__main__":
+    flusher = None
+    if main.STORAGE_MODE == "wal":
+        flusher = WalFlusher(
+            main.WAL,
+            main.S3,
+            main.BUCKET_NAME,
+            interval=WAL_FLUSH_INTERVAL,
+            max_rows=WAL_FLUSH_ROWS,
+        ).start()
+    if METRICS_PORT:
+        serve(METRICS, METRICS_PORT)
+    dumper = None
+    if METRICS_JSON:
+        dumper = JsonDumper(METRICS, METRICS_JSON).start()
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if flusher is not None:
+            flusher.stop()
+        main.flush_wide_writer()
+        main.flush_depth_writer()
+        ALERTS.stop()
+        if dumper is not None:
+            dumper.stop()
@@ -0,0 +1,190 @@
+# =============================================================================
+# IMPORTS
+# =============================================================================
+import io, os, threading
+import numpy as np
+from segment_writer import segment_id
+from wide_snapshot import timestamp_ns
+
+# =============================================================================
+# CONFIG
+# =============================================================================
+# With DEPTH_LEVELS=N (main.py) the top N levels per side are recorded next to
+# the top of book, plus the features below, one object per DEPTH_BATCH_TICKS:
+#   depth/{today}/{segment_id}.parquet
+# One row per (tick, market), one column per level field, so every column is
+# a slowly changing series that zstd squeezes well.
+DEPTH_BPS = [float(b) for b in os.getenv("DEPTH_BPS", "10,25,50").split(",")]
+DEPTH_BATCH_TICKS = int(os.getenv("DEPTH_BATCH_TICKS", 60))
+SIDES = ["bid_px", "bid_sz", "ask_px", "ask_sz"]
+
+
+def depth_prefix(today):
+    return f"depth/{today}/"
+
+
+# =============================================================================
+# N LEVELS OF EVERY MARKET AS FIXED-WIDTH ARRAYS, NAN PADDED
+#
+# `books` is [(bids, asks), ...] in market order with the raw dYdX levels
+# ({"price": "...", "size": "..."}), None for markets without a book. All
+# the strings are converted in a single numpy call.
+# =============================================================================
+def parse_depth(books, levels):
+    n = len(books)
+    strings = np.full((n, 4, levels), "nan", dtype=object)
+    for i, book in enumerate(books):
+        if book is None:
+            continue
+        bids, asks = book
+        for side, entries in ((0, bids[:levels]), (2, asks[:levels])):
+            for j, level in enumerate(entries):
+                strings[i, side, j] = level["price"]
+                strings[i, side + 1, j] = level["size"]
+    values = strings.astype(np.float64)
+    bid_px, bid_sz, ask_px, ask_sz = (values[:, k] for k in range(4))
+    return sort_levels(bid_px, bid_sz, ask_px, ask_sz)
+
+
+def sort_levels(bid_px, bid_sz, ask_px, ask_sz):
+    # dYdX sends best first; only reorder rows that came out of order
+    bad = (np.diff(bid_px, axis=1) > 0).any(axis=1)
+    if bad.any():
+        order = np.argsort(-np.nan_to_num(bid_px[bad], nan=-np.inf), axis=1)
+        bid_px[bad] = np.take_along_axis(bid_px[bad], order, axis=1)
+        bid_sz[bad] = np.take_along_axis(bid_sz[bad], order, axis=1)
+    bad = (np.diff(ask_px, axis=1) < 0).any(axis=1)
+    if bad.any():
+        order = np.argsort(np.nan_to_num(ask_px[bad], nan=np.inf), axis=1)
+        ask_px[bad] = np.take_along_axis(ask_px[bad], order, axis=1)
+        ask_sz[bad] = np.take_along_axis(ask_sz[bad], order, axis=1)
+    return bid_px, bid_sz, ask_px, ask_sz
+
+
+# =============================================================================
+# FEATURES FOR THE WHOLE BATCH AT ONCE, EVERY ARRAY IS [n_markets]
+#
+#   microprice    level 1 mid weighted by the opposite side's size
+#   weighted_mid  mean of the bid and ask VWAP over the N levels
+#   imbalance     (bid size - ask size) / total over the N levels, in [-1, 1]
+#   bid_{x}bps    size resting within x bps of mid (likewise ask_{x}bps);
+#                 only as deep as the N levels recorded
+# =============================================================================
+def depth_features(bid_px, bid_sz, ask_px, ask_sz, bps=DEPTH_BPS):
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mid = (bid_px[:, 0] + ask_px[:, 0]) / 2
+        microprice = (bid_px[:, 0] * ask_sz[:, 0] + ask_px[:, 0] * bid_sz[:, 0]) / (
+            bid_sz[:, 0] + ask_sz[:, 0]
+        )
+        bid_qty = np.nansum(bid_sz, axis=1)
+        ask_qty = np.nansum(ask_sz, axis=1)
+        bid_vwap = np.nansum(bid_px * bid_sz, axis=1) / bid_qty
+        ask_vwap = np.nansum(ask_px * ask_sz, axis=1) / ask_qty
+        features = {
+            "mid": mid,
+            "microprice": microprice,
+            "weighted_mid": (bid_vwap + ask_vwap) / 2,
+            "imbalance": (bid_qty - ask_qty) / (bid_qty + ask_qty),
+        }
+
+        # [n_markets, n_bps, 1] against [n_markets, 1, levels]
+        band = mid[:, None] * np.asarray(bps)[None, :] / 1e4
+        bid_in = bid_px[:, None, :] >= (mid[:, None] - band)[:, :, None]
+        ask_in = ask_px[:, None, :] <= (mid[:, None] + band)[:, :, None]
+        bid_cum = np.where(bid_in, bid_sz[:, None, :], 0.0).sum(axis=2)
+        ask_cum = np.where(ask_in, ask_sz[:, None, :], 0.0).sum(axis=2)
+    for k, b in enumerate(bps):
+        features[f"bid_{b:g}bps"] = np.where(np.isnan(mid), np.nan, bid_cum[:, k])
+        features[f"ask_{b:g}bps"] = np.where(np.isnan(mid), np.nan, ask_cum[:, k])
+    return features
+
+
+# =============================================================================
+# BUFFERS TICKS, WRITES ONE COMPRESSED PARQUET OBJECT PER BATCH
+# =============================================================================
+class DepthWriter:
+    compression = "zstd"
+
+    def __init__(
+        self,
+        s3,
+        bucket,
+        markets,
+        levels,
+        bps=DEPTH_BPS,
+        batch_ticks=DEPTH_BATCH_TICKS,
+    ):
+        self.s3 = s3
+        self.bucket = bucket
+        self.markets = list(markets)
+        self.levels = levels
+        self.bps = bps
+        self.batch_ticks = batch_ticks
+        self.buffer = []  # (now_s, today, columns)
+        self.lock = threading.Lock()
+
+    def add(self, books, now_s, today):
+        # books: {market: (bids, asks)}
+        ordered = [books.get(market) for market in self.markets]
+        arrays = parse_depth(ordered, self.levels)
+        columns = depth_features(*arrays, bps=self.bps)
+        for name, values in zip(SIDES, arrays):
+            for j in range(self.levels):
+                columns[f"{name}_{j}"] = values[:, j]
+        with self.lock:
+            if self.buffer and self.buffer[0][1] != today:
+                self._flush()
+            self.buffer.append((now_s, today, columns))
+            if len(self.buffer) >= self.batch_ticks:
+                return self._flush()
+
+    def flush(self):
+        with self.lock:
+            return self._flush()
+
+    def _flush(self):
+        if not self.buffer:
+            return None
+        buffer = sorted(self.buffer, key=lambda b: b[0])
+        self.buffer = []
+        first_s, today, _ = buffer[0]
+        key = f"{depth_prefix(today)}{segment_id(first_s)}.parquet"
+        body = self.encode(buffer)
+        self.s3.put_object(Bucket=self.bucket, Key=key, Body=body)
+        return key
+
+    def encode(self, buffer):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        n = len(self.markets)
+        timestamps = np.repeat([timestamp_ns(now_s) for now_s, _, _ in buffer], n)
+        markets = np.tile(np.arange(n, dtype=np.int32), len(buffer))
+        table = {
+            "timestamp": pa.array(timestamps.astype("datetime64[ns]")),
+            "market": pa.DictionaryArray.from_arrays(
+                pa.array(markets), pa.array(self.markets)
+            ),
+        }
+        for name in buffer[0][2]:
+            table[name] = np.concatenate([columns[name] for _, _, columns in buffer])
+        out = io.BytesIO()
+        pq.write_table(pa.table(table), out, compression=self.compression)
+        return out.getvalue()
+
+
+# =============================================================================
+# READ BACK
+# =============================================================================
+def read_depth(s3, bucket, key, columns=None):
+    import pandas as pd
+
+    data = s3.get_object(Bucket=bucket, Key=key)["Body"].read()
+    return pd.read_parquet(io.BytesIO(data), columns=columns)
+
+
+def level_arrays(df, levels):
+    # [rows, levels] per side, back from the flat level columns
+    return tuple(
+        df[[f"{name}_{j}" for j in range(levels)]].to_numpy() for name in SIDES
+    )
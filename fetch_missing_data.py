@@ -1,27 +1,29 @@
-import requests
-import pandas as pd
-import time
+# =============================================================================
+# IMPORTS
+# =============================================================================
+import sys
+from constants import MARKETS
+from backfill import KlineBackfill
 
-date = 1674086400 * 1000
-interval = "1m"
-symbol = "SOLBUSD"
-headers = ["timestamp", "open", "high", "low", "close", "volume"]
-data = []
-while date < 1674165600000:
-    url = f"https://api.binance.com/api/v3/klines?symbol={symbol}&interval={interval}&startTime={date}&limit={1400}"
-    res = requests.get(url)
-    res = [d[0:6] for d in res.json()]
+# =============================================================================
+# DOWNLOAD BINANCE KLINES FOR A DATE RANGE, RESUMABLE
+#
+#   python fetch_missing_data.py START END [MARKET ...] [--export=path.csv]
+#
+# Windows land in klines/ as they arrive; rerunning after an interruption
+# only fetches what's missing. --export writes timestamp,mid (the close) for
+# the first market, the shape sol-data.csv has.
+# =============================================================================
+if __name__ == "__main__":
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    start, end = args[0], args[1]
+    markets = args[2:] or MARKETS
 
-    if len(data) > 0 and data[-1][0] == res[-1][0]:
-        break
+    backfill = KlineBackfill()
+    print(f"{backfill.run(markets, start, end)} klines fetched")
 
-    data += res
-    date = res[-1][0]
-    time.sleep(1)
-
-
-df = pd.DataFrame(data, columns=headers)
-df["timestamp"] = pd.to_datetime(df["timestamp"], unit="ms")
-df = df[["timestamp", "close"]]
-print(df)
-df.to_csv("sol-data.csv", index=False)
+    for opt in sys.argv[1:]:
+        if opt.startswith("--export="):
+            df = backfill.load(markets[0], start, end)
+            df = df[["timestamp", "close"]].rename(columns={"close": "mid"})
+            df.to_csv(opt.split("=", 1)[1], index=False)
@@ -0,0 +1,185 @@
+# =============================================================================
+# IMPORTS
+# =============================================================================
+import time, random, threading
+import concurrent.futures
+
+
+# =============================================================================
+# RAISED BY A FETCH WHEN THE EXCHANGE ANSWERS 429
+# =============================================================================
+class RateLimited(Exception):
+    def __init__(self, retry_after=None):
+        super().__init__(f"Rate limited, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+def retry_after_from_response(res):
+    try:
+        return float(res.headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
+
+
+# =============================================================================
+# TOKEN BUCKET, SHARED BY EVERY WORKER THAT HITS THE SAME HOST
+#
+# reserve() hands out a slot and returns how long the caller has to wait for
+# it, so threads can time.sleep() and coroutines can asyncio.sleep() on it.
+# =============================================================================
+class TokenBucket:
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self):
+        with self.lock:
+            now = time.monotonic()
+            refill = (now - self.updated) * self.rate
+            self.tokens = min(self.capacity, self.tokens + refill)
+            self.updated = now
+            self.tokens -= 1
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+    def acquire(self, deadline=None):
+        wait = self.reserve()
+        if deadline is not None and time.monotonic() + wait > deadline:
+            return False
+        if wait:
+            time.sleep(wait)
+        return True
+
+
+# =============================================================================
+# FULL-JITTER EXPONENTIAL BACKOFF
+# =============================================================================
+def backoff_delay(attempt, base, cap):
+    return random.uniform(0, min(cap, base * 2**attempt))
+
+
+# =============================================================================
+# AFTER A FAILED ATTEMPT: HOW LONG TO WAIT, OR WHY TO GIVE UP
+#
+# Shared by FetchScheduler (threads, monotonic clock) and daemon.py (asyncio,
+# wall clock); `now` has to be on the same clock as `deadline`. Returns
+# (delay, None) to retry after `delay` seconds, or (None, reason) with reason
+# "retries_exhausted" after the last attempt or "deadline_missed" when the
+# wait (Retry-After included) would run past the deadline.
+# =============================================================================
+def next_retry(e, attempt, max_retries, base, cap, deadline=None, now=None):
+    if attempt >= max_retries - 1:
+        return None, "retries_exhausted"
+    delay = backoff_delay(attempt, base, cap)
+    if isinstance(e, RateLimited):
+        delay = max(delay, e.retry_after or 0.0)
+    if deadline is not None and now + delay >= deadline:
+        return None, "deadline_missed"
+    return delay, None
+
+
+# =============================================================================
+# BOUNDED, RATE LIMITED FETCH OF A BATCH OF MARKETS WITH A PER-TICK DEADLINE
+#
+# `fetch(market, timeout)` does one attempt and raises on failure. Markets
+# that don't succeed before the deadline are filled in with
+# `on_missing(market)` instead of holding up the rest of the batch.
+# =============================================================================
+class FetchScheduler:
+    def __init__(
+        self,
+        fetch,
+        on_missing,
+        bucket,
+        max_workers=8,
+        max_retries=10,
+        base_backoff=0.1,
+        max_backoff=2.0,
+        deadline=10.0,
+        on_error=None,
+        metrics=None,
+    ):
+        self.fetch = fetch
+        self.on_missing = on_missing
+        self.bucket = bucket
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.deadline = deadline
+        self.on_error = on_error
+        self.metrics = metrics
+
+    def run(self, markets):
+        deadline = time.monotonic() + self.deadline
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers)
+        futures = [
+            executor.submit(self.attempt, market, deadline) for market in markets
+        ]
+        done, _ = concurrent.futures.wait(
+            futures, timeout=max(0.0, deadline - time.monotonic())
+        )
+        # stragglers give up on their own at the deadline, don't wait for them
+        executor.shutdown(wait=False, cancel_futures=True)
+
+        # counted here only, a straggler giving up late must not count twice
+        results = []
+        for market, future in zip(markets, futures):
+            if future in done:
+                bid_ask, gave_up = future.result()
+                if gave_up is not None:
+                    print(f"No bid ask for {market}, {gave_up.replace('_', ' ')}")
+            else:
+                bid_ask, gave_up = None, "deadline_missed"
+                print(f"No bid ask for {market} before the deadline")
+            if gave_up is not None:
+                self.count(gave_up, market)
+            if bid_ask is None:
+                bid_ask = self.on_missing(market)
+            results.append(bid_ask)
+        return results
+
+    def fetch_with_retry(self, market, deadline=None):
+        bid_ask, gave_up = self.attempt(market, deadline)
+        if gave_up is not None:
+            self.count(gave_up, market)
+        return bid_ask
+
+    def attempt(self, market, deadline=None):
+        # -> (bid_ask, None) or (None, why it gave up)
+        for attempt in range(self.max_retries):
+            if not self.bucket.acquire(deadline):
+                return None, "deadline_missed"
+            timeout = None
+            if deadline is not None:
+                timeout = max(0.1, deadline - time.monotonic())
+            try:
+                return self.fetch(market, timeout), None
+            except Exception as e:
+                self.report(market, e)
+                delay, gave_up = next_retry(
+                    e,
+                    attempt,
+                    self.max_retries,
+                    self.base_backoff,
+                    self.max_backoff,
+                    deadline,
+                    time.monotonic(),
+                )
+            if gave_up is not None:
+                return None, gave_up
+            self.count("retries", market)
+            time.sleep(delay)
+        return None, "retries_exhausted"
+
+    def report(self, market, e):
+        if self.on_error is not None:
+            self.on_error(market, e)
+
+    def count(self, name, market):
+        if self.metrics is not None:
+            self.metrics.inc(name, market=market)
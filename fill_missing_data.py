@@ -1,43 +1,34 @@
 # =============================================================================
 # IMPORTS
 # =============================================================================
-import sys, os, pytz, time, traceback
-import boto3
-import io
-import datetime as dt
-from dotenv import load_dotenv
-import pandas as pd
-from pprint import pprint
+import os, sys
+from constants import MARKETS
+from gap_filler import BinanceKlineSource, repair_range
 
-load_dotenv()
 # =============================================================================
-# CONFIG
+# REPAIR GAPS IN THE STORED DAILY FILES
+#
+#   python fill_missing_data.py START_DAY [END_DAY] [MARKET ...] [--dry-run]
+#
+# e.g. `python fill_missing_data.py 2023-01-19 2023-01-19 SOL-USD` does what
+# the original one-off did for SOL-USD, but on any range and every market.
 # =============================================================================
-BUCKET_NAME = "dydx-orderbook"
-AWS_ACCESS_KEY = os.getenv("AWS_ACCESS_KEY")
-AWS_SECRET_KEY = os.getenv("AWS_SECRET_KEY")
-S3 = boto3.client(
-    "s3",
-    aws_access_key_id=AWS_ACCESS_KEY,
-    aws_secret_access_key=AWS_SECRET_KEY,
-    region_name="eu-west-2",
-)
+if __name__ == "__main__":
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    start = args[0]
+    end = args[1] if len(args) > 1 and not args[1].endswith("-USD") else start
+    markets = [a for a in args if a.endswith("-USD")] or MARKETS
 
-
-binance = pd.read_csv("sol-data.csv")
-filepath = "SOL-USD/SOL-USD_2023-01-19.csv"
-csv = S3.get_object(Bucket=BUCKET_NAME, Key=filepath)
-fucked = csv["Body"].read().decode("utf-8")
-fucked = pd.read_csv(io.StringIO(fucked))
-fucked = fucked.iloc[892:].reset_index(drop=True)
-result = pd.concat([binance, fucked], axis=0, ignore_index=True)
-result = result.set_index("timestamp")
-
-csv_buffer = io.StringIO()
-result.to_csv(csv_buffer)
-print(result)
-print(filepath)
-res = S3.put_object(Bucket=BUCKET_NAME, Key=filepath, Body=csv_buffer.getvalue())
-# print(
-#     f"{filepath} saved with status code: {res['ResponseMetadata']['HTTPStatusCode']}"
-# )
+    summaries = repair_range(
+        markets,
+        start,
+        end,
+        BinanceKlineSource(),
+        fmt_name=os.getenv("OUTPUT_FORMAT", "csv"),
+        dry_run="--dry-run" in sys.argv,
+    )
+    missing = sum(s["missing"] for s in summaries)
+    filled = sum(s["filled"] for s in summaries)
+    print(
+        f"{len(summaries)} market-days checked, {missing} missing slots, {filled} filled"
+    )
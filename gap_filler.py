@@ -0,0 +1,220 @@
+# =============================================================================
+# IMPORTS
+# =============================================================================
+import os
+import datetime as dt
+import concurrent.futures
+import numpy as np
+import pandas as pd
+from aws import create_s3_client
+from constants import BUCKET_NAME, CSV_HEADER
+from storage_formats import get_format, parse_timestamps
+from backfill import BINANCE_URL, fetch_range, to_ms
+from venues import BinanceAdapter
+from change_filter import RECORD_CHANGES_ONLY, max_gap, expand_to_grid
+from quality import MISSING, BACKFILL
+
+# =============================================================================
+# CONFIG
+# =============================================================================
+# the grid every stored day is expected to cover, one row per slot
+GRID_FREQ = os.getenv("GAP_GRID_FREQ", "1min")
+# change-only days: a row covers the slots after it for up to this long
+HOLD_SECONDS = max_gap() if RECORD_CHANGES_ONLY else 0
+
+
+# =============================================================================
+# BACKFILL SOURCES
+#
+# Anything with fetch(market, start, end) -> DataFrame[timestamp, mid] can be
+# used. Sources are pickled into the worker processes, keep them plain.
+# =============================================================================
+class BinanceKlineSource:
+    def __init__(self, quote="BUSD", interval="1m", base_url=BINANCE_URL):
+        self.quote = quote
+        self.interval = interval
+        self.base_url = base_url
+
+    def fetch(self, market, start, end):
+        # built here, in the worker process: an adapter holds a lock
+        venue = BinanceAdapter(self.base_url, self.quote)
+        rows = fetch_range(venue, market, self.interval, to_ms(start), to_ms(end))
+        closes = [(k[0], float(k[4])) for k in rows]
+        df = pd.DataFrame(closes, columns=["timestamp", "mid"])
+        df["timestamp"] = pd.to_datetime(df["timestamp"], unit="ms")
+        return df
+
+
+# =============================================================================
+# DETECT MISSING / NAN SLOTS ON THE DAY'S GRID, VECTORIZED
+# =============================================================================
+def day_grid(day, freq=GRID_FREQ):
+    start = pd.Timestamp(day)
+    end = start + pd.Timedelta(days=1)
+    return pd.date_range(start, end, freq=freq, inclusive="left")
+
+
+def missing_slots(df, day, freq=GRID_FREQ, hold=HOLD_SECONDS):
+    grid = day_grid(day, freq)
+    covered = np.zeros(len(grid), dtype=bool)
+    if len(df):
+        ts = parse_timestamps(df["timestamp"]).dt.floor(freq)
+        slots = grid.get_indexer(ts[df["mid"].notna().to_numpy()])
+        covered[slots[slots >= 0]] = True
+        if hold:
+            # slots whose latest row is a valid one no older than `hold`
+            valid = df.assign(timestamp=ts)[["timestamp", "mid"]]
+            held = expand_to_grid(valid, grid[0], grid[-1] + grid.freq, freq, hold)
+            covered |= held["mid"].notna().to_numpy()
+    return grid[~covered]
+
+
+def gap_intervals(slots, freq=GRID_FREQ):
+    # consecutive missing slots -> [(start, end_exclusive), ...]
+    if len(slots) == 0:
+        return []
+    step = pd.Timedelta(freq)
+    breaks = np.flatnonzero(np.diff(slots.values) != step.to_timedelta64()) + 1
+    starts = np.r_[0, breaks]
+    ends = np.r_[breaks, len(slots)] - 1
+    return [(slots[s], slots[e] + step) for s, e in zip(starts, ends)]
+
+
+# =============================================================================
+# MERGE REPLACEMENT DATA IN BY TIMESTAMP
+#
+# NaN rows we already have get their mid from the nearest source row; empty
+# slots become new rows holding only the source mid (bid/ask stay NaN), the
+# same shape the original one-off produced in result.csv. Both are marked
+# MISSING | BACKFILL in `quality`, which stays an integer column; days stored
+# before there was a `quality` column get 0 / MISSING for their own rows.
+# =============================================================================
+def merge_backfill(df, replacement, slots, freq=GRID_FREQ):
+    tolerance = pd.Timedelta(freq)
+    replacement = replacement.sort_values("timestamp")[["timestamp", "mid"]]
+    replacement = replacement.rename(columns={"mid": "backfill_mid"})
+
+    df = df.copy()
+    df["timestamp"] = parse_timestamps(df["timestamp"])
+    df = df.sort_values("timestamp")
+    nan_rows = df["mid"].isna().to_numpy()
+    if "quality" not in df.columns:
+        df["quality"] = np.where(nan_rows, MISSING, 0)
+    df["quality"] = df["quality"].fillna(MISSING).astype(np.int64)
+    if nan_rows.any():
+        merged = pd.merge_asof(
+            df.loc[nan_rows, ["timestamp"]],
+            replacement,
+            on="timestamp",
+            direction="nearest",
+            tolerance=tolerance,
+        )
+        df.loc[nan_rows, "mid"] = merged["backfill_mid"].to_numpy()
+        repaired = nan_rows & df["mid"].notna().to_numpy()
+        flags = df.loc[repaired, "quality"] | MISSING | BACKFILL
+        df.loc[repaired, "quality"] = flags
+
+    # slots with a (still) NaN row were handled above, only add truly empty ones
+    present = df["timestamp"].dt.floor(freq)
+    empty = slots[~slots.isin(present)]
+    new_rows = pd.merge_asof(
+        pd.DataFrame({"timestamp": empty}),
+        replacement,
+        on="timestamp",
+        direction="forward",
+        tolerance=tolerance,
+    ).rename(columns={"backfill_mid": "mid"})
+    new_rows = new_rows.dropna(subset=["mid"])
+    new_rows["quality"] = MISSING | BACKFILL
+
+    out = pd.concat([df, new_rows], ignore_index=True)
+    columns = [c for c in CSV_HEADER if c in out.columns]
+    out = out[columns + [c for c in out.columns if c not in columns]]
+    return out.sort_values("timestamp").reset_index(drop=True), len(new_rows)
+
+
+# =============================================================================
+# ONE MARKET-DAY, RUNS INSIDE A WORKER PROCESS
+# =============================================================================
+_S3 = None
+
+
+def init_worker():
+    global _S3
+    _S3 = create_s3_client()
+
+
+def repair_market_day(
+    market, day, source, fmt_name="csv", freq=GRID_FREQ, dry_run=False
+):
+    s3 = _S3 or create_s3_client()
+    fmt = get_format(fmt_name)
+    key = fmt.daily_key(market, day)
+    try:
+        data = s3.get_object(Bucket=BUCKET_NAME, Key=key)["Body"].read()
+        df = fmt.deserialize(data)
+    except s3.exceptions.NoSuchKey:
+        df = pd.DataFrame(columns=CSV_HEADER)
+
+    slots = missing_slots(df, day, freq)
+    summary = {"market": market, "day": day, "missing": len(slots), "filled": 0}
+    if len(slots) == 0:
+        return summary
+
+    intervals = gap_intervals(slots, freq)
+    start = intervals[0][0] - pd.Timedelta(freq)
+    end = intervals[-1][1] + pd.Timedelta(freq)
+    replacement = source.fetch(market, start, end)
+    repaired, added = merge_backfill(df, replacement, slots, freq)
+    summary["filled"] = len(slots) - len(missing_slots(repaired, day, freq))
+    summary["added_rows"] = added
+
+    if not dry_run and summary["filled"]:
+        body = fmt.serialize(repaired, market)
+        s3.put_object(Bucket=BUCKET_NAME, Key=key, Body=body)
+    return summary
+
+
+# =============================================================================
+# A DATE RANGE x MARKETS, MARKET-DAYS IN A PROCESS POOL
+# =============================================================================
+def date_range(start, end):
+    start, end = dt.date.fromisoformat(start), dt.date.fromisoformat(end)
+    return [str(start + dt.timedelta(days=i)) for i in range((end - start).days + 1)]
+
+
+def repair_range(
+    markets,
+    start,
+    end,
+    source,
+    fmt_name="csv",
+    freq=GRID_FREQ,
+    dry_run=False,
+    workers=None,
+):
+    jobs = [(market, day) for day in date_range(start, end) for market in markets]
+    summaries = []
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=workers, initializer=init_worker
+    ) as executor:
+        futures = {
+            executor.submit(
+                repair_market_day, market, day, source, fmt_name, freq, dry_run
+            ): (market, day)
+            for market, day in jobs
+        }
+        for future in concurrent.futures.as_completed(futures):
+            market, day = futures[future]
+            try:
+                summary = future.result()
+            except Exception as e:
+                print(f"Failed repairing {market} {day}: {e}")
+                continue
+            if summary["missing"]:
+                print(
+                    f"{market} {day}: {summary['missing']} missing slots, "
+                    f"{summary['filled']} filled"
+                )
+            summaries.append(summary)
+    return summaries
@@ -0,0 +1,57 @@
+# =============================================================================
+# IMPORTS
+# =============================================================================
+import os, threading
+import requests
+from requests.adapters import HTTPAdapter
+
+# =============================================================================
+# CONFIG
+# =============================================================================
+# (connect, read) seconds, used whenever a caller doesn't pass its own timeout
+DEFAULT_TIMEOUT = (3.05, 10)
+DEFAULT_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", 40))
+
+
+# =============================================================================
+# SESSION WITH A DEFAULT TIMEOUT
+# =============================================================================
+class TimeoutSession(requests.Session):
+    def request(self, method, url, **kwargs):
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = DEFAULT_TIMEOUT
+        return super().request(method, url, **kwargs)
+
+
+def create_session(pool_size=DEFAULT_POOL_SIZE):
+    session = TimeoutSession()
+    # keep-alive connections per host; pool_block so a burst waits for a free
+    # connection instead of opening (and TLS handshaking) a throwaway one
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, pool_block=True)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+# =============================================================================
+# ONE SHARED SESSION PER PROCESS, EVERY EXCHANGE / WEBHOOK CALL GOES THROUGH IT
+# =============================================================================
+_SESSION = None
+_LOCK = threading.Lock()
+
+
+def get_session(pool_size=None):
+    global _SESSION
+    if _SESSION is None:
+        with _LOCK:
+            if _SESSION is None:
+                _SESSION = create_session(pool_size or DEFAULT_POOL_SIZE)
+    return _SESSION
+
+
+def get(url, **kwargs):
+    return get_session().get(url, **kwargs)
+
+
+def post(url, **kwargs):
+    return get_session().post(url, **kwargs)
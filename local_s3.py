@@ -0,0 +1,188 @@
+# =============================================================================
+# IMPORTS
+# =============================================================================
+import os, io, hashlib, threading
+
+
+# =============================================================================
+# ERRORS, SHAPED LIKE THE ONES BOTO3 RAISES
+# =============================================================================
+class ClientError(Exception):
+    def __init__(self, code, message):
+        super().__init__(f"{code}: {message}")
+        self.response = {"Error": {"Code": code, "Message": message}}
+
+
+class NoSuchKey(ClientError):
+    def __init__(self, key):
+        super().__init__("NoSuchKey", f"The specified key does not exist: {key}")
+
+
+class _Exceptions:
+    ClientError = ClientError
+    NoSuchKey = NoSuchKey
+
+
+# =============================================================================
+# STAND-IN FOR THE boto3 S3 CLIENT, BACKED BY A LOCAL DIRECTORY
+#
+# Only implements the calls this repo makes, so anything that takes an `s3`
+# argument can be pointed at a folder instead of a bucket.
+# =============================================================================
+class LocalS3:
+    exceptions = _Exceptions
+
+    def __init__(self, root):
+        self.root = root
+
+    def _path(self, bucket, key):
+        return os.path.join(self.root, bucket, *key.split("/"))
+
+    def put_object(self, Bucket, Key, Body):
+        path = self._path(Bucket, Key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if isinstance(Body, str):
+            Body = Body.encode("utf-8")
+        tmp = f"{path}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(Body)
+        os.replace(tmp, path)
+        return {
+            "ETag": f'"{hashlib.md5(Body).hexdigest()}"',
+            "ResponseMetadata": {"HTTPStatusCode": 200},
+        }
+
+    def get_object(self, Bucket, Key, Range=None):
+        path = self._path(Bucket, Key)
+        if not os.path.isfile(path):
+            raise NoSuchKey(Key)
+        with open(path, "rb") as f:
+            data = f.read()
+        if Range is not None:
+            start, end = Range.replace("bytes=", "").split("-")
+            data = data[int(start) : int(end) + 1 if end else None]
+        return {
+            "Body": io.BytesIO(data),
+            "ContentLength": len(data),
+            "ResponseMetadata": {"HTTPStatusCode": 206 if Range else 200},
+        }
+
+    def head_object(self, Bucket, Key):
+        path = self._path(Bucket, Key)
+        if not os.path.isfile(path):
+            raise ClientError("404", "Not Found")
+        with open(path, "rb") as f:
+            etag = hashlib.md5(f.read()).hexdigest()
+        return {"ContentLength": os.path.getsize(path), "ETag": f'"{etag}"'}
+
+    def list_objects_v2(self, Bucket, Prefix="", ContinuationToken=None, MaxKeys=1000):
+        base = os.path.join(self.root, Bucket)
+        keys = []
+        for dirpath, _, filenames in os.walk(base):
+            for name in filenames:
+                if name.endswith(".tmp"):
+                    continue
+                rel = os.path.relpath(os.path.join(dirpath, name), base)
+                key = rel.replace(os.sep, "/")
+                if key.startswith(Prefix):
+                    keys.append(key)
+        keys.sort()
+        if ContinuationToken is not None:
+            keys = [key for key in keys if key > ContinuationToken]
+        page = keys[:MaxKeys]
+        res = {
+            "Contents": [
+                {"Key": key, "Size": os.path.getsize(self._path(Bucket, key))}
+                for key in page
+            ],
+            "KeyCount": len(page),
+            "IsTruncated": len(keys) > MaxKeys,
+        }
+        if res["IsTruncated"]:
+            res["NextContinuationToken"] = page[-1]
+        return res
+
+    def delete_objects(self, Bucket, Delete):
+        for obj in Delete["Objects"]:
+            path = self._path(Bucket, obj["Key"])
+            if os.path.isfile(path):
+                os.remove(path)
+        return {"ResponseMetadata": {"HTTPStatusCode": 200}}
+
+
+# =============================================================================
+# SAME CALLS, KEPT IN A DICT, COUNTS THE BYTES THAT GO IN AND OUT
+# =============================================================================
+class MemoryS3:
+    exceptions = _Exceptions
+
+    def __init__(self):
+        self.objects = {}  # (bucket, key) -> bytes
+        self.lock = threading.Lock()
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.calls = {}
+
+    def _count(self, op, bytes_in=0, bytes_out=0):
+        with self.lock:
+            self.calls[op] = self.calls.get(op, 0) + 1
+            self.bytes_in += bytes_in
+            self.bytes_out += bytes_out
+
+    def put_object(self, Bucket, Key, Body):
+        if isinstance(Body, str):
+            Body = Body.encode("utf-8")
+        Body = bytes(Body)
+        self.objects[(Bucket, Key)] = Body
+        self._count("put_object", bytes_in=len(Body))
+        return {
+            "ETag": f'"{hashlib.md5(Body).hexdigest()}"',
+            "ResponseMetadata": {"HTTPStatusCode": 200},
+        }
+
+    def get_object(self, Bucket, Key, Range=None):
+        data = self.objects.get((Bucket, Key))
+        if data is None:
+            self._count("get_object")
+            raise NoSuchKey(Key)
+        if Range is not None:
+            start, end = Range.replace("bytes=", "").split("-")
+            data = data[int(start) : int(end) + 1 if end else None]
+        self._count("get_object", bytes_out=len(data))
+        return {
+            "Body": io.BytesIO(data),
+            "ContentLength": len(data),
+            "ResponseMetadata": {"HTTPStatusCode": 206 if Range else 200},
+        }
+
+    def head_object(self, Bucket, Key):
+        self._count("head_object")
+        data = self.objects.get((Bucket, Key))
+        if data is None:
+            raise ClientError("404", "Not Found")
+        etag = hashlib.md5(data).hexdigest()
+        return {"ContentLength": len(data), "ETag": f'"{etag}"'}
+
+    def list_objects_v2(self, Bucket, Prefix="", ContinuationToken=None, MaxKeys=1000):
+        self._count("list_objects_v2")
+        keys = [key for bucket, key in list(self.objects) if bucket == Bucket]
+        keys = sorted(key for key in keys if key.startswith(Prefix))
+        if ContinuationToken is not None:
+            keys = [key for key in keys if key > ContinuationToken]
+        page = keys[:MaxKeys]
+        res = {
+            "Contents": [
+                {"Key": key, "Size": len(self.objects[(Bucket, key)])} for key in page
+            ],
+            "KeyCount": len(page),
+            "IsTruncated": len(keys) > MaxKeys,
+        }
+        if res["IsTruncated"]:
+            res["NextContinuationToken"] = page[-1]
+        return res
+
+    def delete_objects(self, Bucket, Delete):
+        self._count("delete_objects")
+        for obj in Delete["Objects"]:
+            self.objects.pop((Bucket, obj["Key"]), None)
+        return {"ResponseMetadata": {"HTTPStatusCode": 200}}
@@ -1,108 +1,289 @@
 # =============================================================================
 # IMPORTS
 # =============================================================================
-import os, boto3, time, json, sys
-from pprint import pprint
+# pandas / numpy / boto3 are only imported by the code paths that need them,
+# every snapshot run pays for whatever is imported here
+import os, time, json, sys
 import traceback
 import datetime as dt
-import pandas as pd, numpy as np
-from dotenv import load_dotenv
-import io
-import requests
-import concurrent.futures
-
-# =============================================================================
-# CONSTANTS
-# =============================================================================
-DYDX_URL = "https://api.dydx.exchange/v3"
-MARKETS = [
-    "1INCH-USD",
-    "AAVE-USD",
-    "ADA-USD",
-    "ALGO-USD",
-    "ATOM-USD",
-    "AVAX-USD",
-    "BTC-USD",
-    "BCH-USD",
-    "CELO-USD",
-    "ETC-USD",
-    "COMP-USD",
-    "ICP-USD",
-    "CRV-USD",
-    "DOGE-USD",
-    "DOT-USD",
-    "ENJ-USD",
-    "EOS-USD",
-    "ETH-USD",
-    "FIL-USD",
-    "LINK-USD",
-    "LTC-USD",
-    "MATIC-USD",
-    "MKR-USD",
-    "NEAR-USD",
-    "RUNE-USD",
-    "SNX-USD",
-    "SOL-USD",
-    "SUSHI-USD",
-    "TRX-USD",
-    "UMA-USD",
-    "UNI-USD",
-    "XLM-USD",
-    "XMR-USD",
-    "XTZ-USD",
-    "YFI-USD",
-    "ZEC-USD",
-    "ZRX-USD",
-]
-
-
-CSV_HEADER = [
-    "timestamp",
-    "bid_price",
-    "ask_price",
-    "mid",
-    "bid_size",
-    "ask_size",
-]
+import threading
+import http_client
+from constants import DYDX_URL, MARKETS, CSV_HEADER, BUCKET_NAME
+from aws import LazyS3Client
+from segment_writer import write_segment_rows, segment_id
+from wal import WriteAheadLog
+from storage_formats import get_format, set_tick_params
+from fetch_scheduler import (
+    FetchScheduler,
+    TokenBucket,
+    RateLimited,
+    retry_after_from_response,
+)
+from alerts import AlertQueue
+from metrics import METRICS, METRICS_JSON, InstrumentedS3
+from venues import DydxAdapter, get_adapter, fetch_quotes, venue_rows, venue_market
+from quality import QualityValidator, MISSING, flag_names
+from change_filter import ChangeFilter, RECORD_CHANGES_ONLY
 
 # =============================================================================
 # AWS CONFIG
 # =============================================================================
-load_dotenv()
-AWS_ACCESS_KEY = os.getenv("AWS_ACCESS_KEY")
-AWS_SECRET_KEY = os.getenv("AWS_SECRET_KEY")
-S3 = boto3.client(
-    "s3",
-    aws_access_key_id=AWS_ACCESS_KEY,
-    aws_secret_access_key=AWS_SECRET_KEY,
-    region_name="eu-west-2",
-)
+# every head / get / put is timed into METRICS, the client itself is only
+# built on the first call
+S3 = InstrumentedS3(LazyS3Client(), METRICS)
+
+# =============================================================================
+# STORAGE CONFIG
+# =============================================================================
+# "segments": put one segment per market per tick straight to S3
+# "wal": append to the local write-ahead log, `python wal.py` ships it to S3
+# "wide": one object per tick (or WIDE_BATCH_TICKS ticks) with every market
+# RECORD_CHANGES_ONLY=1 skips unchanged rows in "segments" / "wal"; a "wide"
+# object holds every market anyway
+STORAGE_MODE = os.getenv("STORAGE_MODE", "segments")
+WAL = WriteAheadLog(os.getenv("WAL_DIR", "wal"), CSV_HEADER)
+# format of the daily files: "csv" or "parquet"
+OUTPUT_FORMAT = get_format(os.getenv("OUTPUT_FORMAT", "csv"))
+# remembers the last UTC day we wrote, to notice the roll-over to a new one
+LAST_DAY_FILE = os.getenv("LAST_DAY_FILE", ".last_day")
+# other venues recorded on the same ticks as dYdX, e.g. "binance"; stored as
+# {market}.{venue}, see venues.py
+VENUES = [v for v in os.getenv("VENUES", "").split(",") if v and v != "dydx"]
+STORAGE_MARKETS = MARKETS + [venue_market(v, m) for v in VENUES for m in MARKETS]
+# > 0: also record this many order book levels per side, see depth.py
+DEPTH_LEVELS = int(os.getenv("DEPTH_LEVELS", 0))
+# tick / step / min order size rarely change, kept on disk between runs
+MARKET_PARAMS_FILE = os.getenv("MARKET_PARAMS_FILE", ".market_params.json")
+MARKET_PARAMS_TTL = float(os.getenv("MARKET_PARAMS_TTL", 6 * 3600))
+# rolling per-market stats behind the `quality` column, kept between runs
+QUALITY_STATE_FILE = os.getenv("QUALITY_STATE_FILE", ".quality_state.json")
+# what RECORD_CHANGES_ONLY last stored per market, see change_filter.py
+CHANGES_STATE_FILE = os.getenv("CHANGES_STATE_FILE", ".changes_state.json")
+# set (e.g. /dev/shm/dydx-quotes): publish every tick to a local quote board,
+# read by other processes with quote_board.QuoteBoard
+QUOTE_BOARD = os.getenv("QUOTE_BOARD")
+
+
+# =============================================================================
+# MARKET PARAMS
+# =============================================================================
+def build_market_params(markets):
+    params = {}
+    for market, data in markets.items():
+        if market not in MARKETS:
+            continue
+        tick_size = float(data["tickSize"])
+        order_size = float(data["stepSize"])
+        min_order = float(data["minOrderSize"])
+
+        params[market] = {
+            "price_rounder": tick_size,
+            "order_size": order_size,
+            "min_order": min_order,
+        }
+    return params
+
+
+# filled in place by load_market_params(), on first use
+MARKET_PARAMS = {}
+# the "ticks" output format quantizes with the same params
+set_tick_params(MARKET_PARAMS)
+
 
 # =============================================================================
-# CONSTANTS
+# CACHED COPY FIRST; A STALE ONE IS STILL USED, AND REFRESHED IN THE BACKGROUND
 # =============================================================================
-BUCKET_NAME = "dydx-orderbook"
-res = requests.get(f"{DYDX_URL}/markets")
-res = res.json()["markets"]
-MARKET_PARAMS = {}
+_PARAMS_LOCK = threading.Lock()
 
-for market, data in res.items():
-    if market not in MARKETS:
-        continue
-    tick_size = float(data["tickSize"])
-    order_size = float(data["stepSize"])
-    min_order = float(data["minOrderSize"])
-
-    MARKET_PARAMS[market] = {
-        "price_rounder": tick_size,
-        "order_size": order_size,
-        "min_order": min_order,
-    }
+
+def load_market_params():
+    if MARKET_PARAMS:
+        return MARKET_PARAMS
+    with _PARAMS_LOCK:
+        if MARKET_PARAMS:
+            return MARKET_PARAMS
+        cached, fetched_at = read_market_params_cache()
+        if cached is None:
+            MARKET_PARAMS.update(fetch_market_params())
+            return MARKET_PARAMS
+        MARKET_PARAMS.update(cached)
+    if time.time() - fetched_at > MARKET_PARAMS_TTL:
+        threading.Thread(target=refresh_market_params).start()
+    return MARKET_PARAMS
+
+
+def fetch_market_params():
+    res = http_client.get(f"{DYDX_URL}/markets")
+    res.raise_for_status()
+    params = build_market_params(res.json()["markets"])
+    write_market_params_cache(params)
+    return params
+
+
+def refresh_market_params():
+    try:
+        MARKET_PARAMS.update(fetch_market_params())
+    except Exception as e:
+        print(f"Failed refreshing market params: {e}")
+
+
+def read_market_params_cache():
+    try:
+        with open(MARKET_PARAMS_FILE) as f:
+            cached = json.load(f)
+        return cached["params"], cached["fetched_at"]
+    except (FileNotFoundError, ValueError, KeyError):
+        return None, 0
+
+
+def write_market_params_cache(params):
+    # several workers on one host can write it at once (sharding.py)
+    tmp = f"{MARKET_PARAMS_FILE}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump({"fetched_at": time.time(), "params": params}, f)
+    os.replace(tmp, MARKET_PARAMS_FILE)
+
+
+# keep-alive pool big enough for every market to have its own connection
+http_client.get_session(pool_size=len(MARKETS))
+
+# =============================================================================
+# QUALITY FLAGS AND CHANGE-ONLY RECORDING, THEIR ROLLING STATE IS READ ONCE
+# AND SAVED AFTER EVERY TICK
+# =============================================================================
+QUALITY = QualityValidator()
+CHANGES = ChangeFilter()
+_STATE_LOADED = []
+
+
+def load_rolling_state():
+    if not _STATE_LOADED:
+        QUALITY.load(QUALITY_STATE_FILE)
+        if RECORD_CHANGES_ONLY:
+            CHANGES.load(CHANGES_STATE_FILE)
+        _STATE_LOADED.append(True)
+
+
+def save_rolling_state():
+    try:
+        QUALITY.save(QUALITY_STATE_FILE)
+        if RECORD_CHANGES_ONLY:
+            CHANGES.save(CHANGES_STATE_FILE)
+    except Exception as e:
+        print(f"Failed saving rolling state: {e}")
+
+
+def grade_bid_ask(key, bid_ask, tick_size=None):
+    flags = QUALITY.grade(key, bid_ask, tick_size, bid_ask.get("received"))
+    for name in flag_names(flags):
+        METRICS.inc("quality_flags", market=key, flag=name)
+    return flags
+
+
+# =============================================================================
+# WIDE STORAGE WRITER, BUILT ON FIRST USE
+# =============================================================================
+_WIDE_WRITER = None
+_WIDE_LOCK = threading.Lock()
+
+
+def wide_writer():
+    global _WIDE_WRITER
+    if _WIDE_WRITER is None:
+        with _WIDE_LOCK:
+            if _WIDE_WRITER is None:
+                from wide_snapshot import WideSnapshotWriter
+
+                batch_ticks = int(os.getenv("WIDE_BATCH_TICKS", 1))
+                _WIDE_WRITER = WideSnapshotWriter(
+                    S3, BUCKET_NAME, STORAGE_MARKETS, batch_ticks=batch_ticks
+                )
+    return _WIDE_WRITER
+
+
+def flush_wide_writer():
+    if _WIDE_WRITER is not None:
+        _WIDE_WRITER.flush()
+
+
+# =============================================================================
+# QUOTE BOARD WRITER, BUILT ON FIRST USE (ONLY WHEN QUOTE_BOARD IS SET)
+# =============================================================================
+_BOARD_WRITER = None
+
+
+def board_writer():
+    global _BOARD_WRITER
+    if _BOARD_WRITER is None:
+        with _WIDE_LOCK:
+            if _BOARD_WRITER is None:
+                from quote_board import BoardWriter
+
+                _BOARD_WRITER = BoardWriter(QUOTE_BOARD, STORAGE_MARKETS)
+    return _BOARD_WRITER
+
+
+def publish_quotes(rows, tick):
+    # nan rows are skipped, the board keeps the last good quote and its age
+    writer = board_writer()
+    tick_ns = int(tick * 1e9)
+    for bid_ask in rows:
+        if bid_ask.get("quality") == MISSING:
+            continue
+        writer.publish(
+            bid_ask["market"],
+            bid_ask["bid_price"],
+            bid_ask["bid_size"],
+            bid_ask["ask_price"],
+            bid_ask["ask_size"],
+            tick_ns,
+            bid_ask.get("received", tick),
+            bid_ask.get("quality", 0),
+        )
+
+
+# =============================================================================
+# DEPTH WRITER, BUILT ON FIRST USE (ONLY WHEN DEPTH_LEVELS > 0)
+# =============================================================================
+_DEPTH_WRITER = None
+
+
+def depth_writer():
+    global _DEPTH_WRITER
+    if _DEPTH_WRITER is None:
+        with _WIDE_LOCK:
+            if _DEPTH_WRITER is None:
+                from depth import DepthWriter
+
+                _DEPTH_WRITER = DepthWriter(S3, BUCKET_NAME, MARKETS, DEPTH_LEVELS)
+    return _DEPTH_WRITER
+
+
+def flush_depth_writer():
+    if _DEPTH_WRITER is not None:
+        _DEPTH_WRITER.flush()
+
+
+# =============================================================================
+# FETCH CONFIG
+# =============================================================================
+# one bucket for every request to api.dydx.exchange
+DYDX_BUCKET = TokenBucket(
+    rate=float(os.getenv("DYDX_RATE_LIMIT", 15)),
+    capacity=float(os.getenv("DYDX_RATE_BURST", len(MARKETS))),
+)
+# the request and the parsing for every dYdX book, tick sizes for grading
+DYDX = DydxAdapter(DYDX_URL, DYDX_BUCKET, load_market_params)
+FETCH_CONCURRENCY = int(os.getenv("FETCH_CONCURRENCY", 8))
+TICK_DEADLINE = float(os.getenv("TICK_DEADLINE", 10))
 
 # =============================================================================
 # DISCORD ALERT
 # =============================================================================
-DSC_URL = "https://discord.com/api/webhooks/1065988769095880754/2g1CGYTv7iNFvJvohzc4WZ5JAgbpF0zinEnAOOX8LVUmgqxolvZ5OY0c-T1xLwcjL4cM"
+DSC_URL = os.getenv(
+    "DISCORD_WEBHOOK_URL",
+    "https://discord.com/api/webhooks/1065988769095880754/2g1CGYTv7iNFvJvohzc4WZ5JAgbpF0zinEnAOOX8LVUmgqxolvZ5OY0c-T1xLwcjL4cM",
+)
 DSC_HEADERS = {"Content-Type": "application/json"}
 DSC_SEPARATOR = "======================================================"
 
@@ -110,7 +291,7 @@ DSC_SEPARATOR = "======================================================"
 def ping_discord(msg):
     payload = handle_type_of_msg(msg)
     payload = {"content": payload}
-    res = requests.post(DSC_URL, data=json.dumps(payload), headers=DSC_HEADERS)
+    res = http_client.post(DSC_URL, data=json.dumps(payload), headers=DSC_HEADERS)
     return res
 
 
@@ -123,72 +304,140 @@ def handle_type_of_msg(msg):
     return f"{DSC_SEPARATOR}\n{formated}{DSC_SEPARATOR}"
 
 
+# fetch errors go through here: batched, deduplicated, sent off the hot path
+ALERTS = AlertQueue(
+    ping_discord,
+    batch_interval=float(os.getenv("ALERT_BATCH_INTERVAL", 5)),
+    cooldown=float(os.getenv("ALERT_COOLDOWN", 300)),
+).start()
+
+
 # =============================================================================
 # EXECUTION
 # =============================================================================
 def main():
-    with concurrent.futures.ThreadPoolExecutor() as executor:
-        result = executor.map(get_bid_ask_from_dydx_for_market, MARKETS)
-
-    now_s, today = create_relevant_date_strings()
-    for bid_ask in result:
-        if bid_ask is None:
-            print(f"Not saving anything for {bid_ask}")
-            continue
-        bid_ask = add_mid_to_bid_ask(bid_ask)
-        push_bid_ask_to_s3(bid_ask, now_s, today)
+    load_market_params()
+    load_rolling_state()
+    with METRICS.timer("tick"):
+        # other venues are fetched alongside, not after, dYdX
+        others = None
+        if VENUE_ADAPTERS:
+            others = VENUE_POOL.submit(fetch_venues, VENUE_ADAPTERS, TICK_DEADLINE)
+        # markets that miss TICK_DEADLINE come back as nan rows
+        with METRICS.timer("fetch_batch"):
+            result = SCHEDULER.run(MARKETS)
+        if others is not None:
+            result += others.result()
+
+        now = dt.datetime.now(dt.timezone.utc)
+        now_s, today = create_relevant_date_strings(now)
+        rows = [add_mid_to_bid_ask(bid_ask) for bid_ask in result]
+        if QUOTE_BOARD:
+            publish_quotes(rows, now.timestamp())
+        if DEPTH_LEVELS:
+            with METRICS.timer("depth"):
+                store_depth(rows, now_s, today)
+        with METRICS.timer("store"):
+            store_bid_asks(rows, now_s, today)
+    save_rolling_state()
+
+    finished_day = detect_day_rollover(today)
+    if finished_day is not None:
+        # the tick is already stored, the process just won't exit until done
+        threading.Thread(target=roll_over_day, args=(finished_day,)).start()
 
 
 # =============================================================================
 # FETCH FROM EXCHANGE FOR market
 # =============================================================================
 def get_bid_ask_from_dydx_for_market(market):
-    counter = 0
-    while counter < 10:
-        try:
-            res = requests.get(f"{DYDX_URL}/orderbook/{market}")
-            orderbook = res.json()
-            bid_ask = extract_top_of_orderbook(market, orderbook)
-            bid_ask = check_if_bid_ask_proper(bid_ask)
-            return bid_ask
-        except Exception as e:
-            print(f"Failed fetching data for market: {market}")
-            ping_discord(e)
-            traceback.print_exc()
-            time.sleep(0.3)
-            counter += 1
+    return SCHEDULER.fetch_with_retry(market)
+
+
+# =============================================================================
+# THE OTHER VENUES, ONE THREAD PER VENUE, nan ROWS FOR WHAT DIDN'T ARRIVE
+# =============================================================================
+def fetch_venues(adapters, timeout, grade=True):
+    futures = [VENUE_POOL.submit(fetch_venue, a, timeout, grade) for a in adapters]
+    return [row for future in futures for row in future.result()]
+
+
+def fetch_venue(adapter, timeout, grade=True):
+    try:
+        with METRICS.timer("http_fetch", market=adapter.name):
+            quotes = fetch_quotes(adapter, MARKETS, timeout)
+    except Exception as e:
+        report_fetch_error(adapter.name, e)
+        quotes = {}
+    rows = venue_rows(adapter.name, MARKETS, quotes)
+    return grade_venue_rows(rows) if grade else rows
+
+
+def grade_venue_rows(rows):
+    # no tick size for other venues, their spreads are only judged relatively
+    for bid_ask in rows:
+        if "quality" not in bid_ask:
+            grade_bid_ask(bid_ask["market"], bid_ask)
+    return rows
+
+
+# =============================================================================
+# ONE ATTEMPT, RETRIES / BACKOFF / DEADLINE ARE UP TO THE SCHEDULER
+# =============================================================================
+def fetch_bid_ask(market, timeout=None):
+    bid_ask = fetch_top_of_book(market, timeout)
+    with METRICS.timer("check_bid_ask", market=market):
+        return check_if_bid_ask_proper(bid_ask)
+
+
+def fetch_top_of_book(market, timeout=None):
+    # ungraded, sharding.py grades in the merger
+    with METRICS.timer("http_fetch", market=market):
+        ((url, params, _),) = DYDX.requests([market])
+        res = http_client.get(url, params=params, timeout=timeout)
+    if res.status_code == 429:
+        raise RateLimited(retry_after_from_response(res))
+    res.raise_for_status()
+    with METRICS.timer("json_decode", market=market):
+        orderbook = res.json()
+    with METRICS.timer("top_of_book", market=market):
+        bid_ask = extract_top_of_orderbook(market, orderbook)
+    return attach_levels(bid_ask, orderbook)
+
+
+def report_fetch_error(market, e):
+    print(f"Failed fetching data for market: {market}")
+    METRICS.inc("fetch_errors", market=market, error=type(e).__name__)
+    ALERTS.submit(e, market)
+    traceback.print_exc()
 
 
 # =============================================================================
 # EXTRACT BEST BID AND ASKS
 # =============================================================================
 def extract_top_of_orderbook(market, orderbook):
-    asks = process_orderbook_to_df(orderbook, "asks")
-    bids = process_orderbook_to_df(orderbook, "bids")
+    return DYDX.parse([market], orderbook)[market].as_dict()
 
-    best_ask = asks.iloc[asks["price"].idxmin()]
-    best_bid = bids.iloc[bids["price"].idxmax()]
-    return {
-        "market": market,
-        "ask_price": best_ask["price"],
-        "ask_size": best_ask["size"],
-        "bid_price": best_bid["price"],
-        "bid_size": best_bid["size"],
-    }
+
+# =============================================================================
+# KEEP THE RAW TOP LEVELS FOR store_depth, ONLY IN DEPTH MODE
+# =============================================================================
+def attach_levels(bid_ask, orderbook):
+    if DEPTH_LEVELS:
+        bid_ask["levels"] = DYDX.levels(orderbook, DEPTH_LEVELS)
+    return bid_ask
 
 
 # =============================================================================
-# ENSURE THAT BID - ASK DIFF ISN'T TOO BIG
+# FLAG, DON'T REFETCH: A LOOSE / CROSSED / STALE BOOK IS STORED WITH ITS
+# `quality` BITS SET (see quality.py), A RETRY WOULD MOSTLY GET THE SAME BOOK
 # =============================================================================
 def check_if_bid_ask_proper(bid_ask):
     market = bid_ask["market"]
-    params = MARKET_PARAMS[market]
-    diff = determine_tick_diff(params, bid_ask)
-    if diff < 10:
-        return bid_ask
-    else:
-        print("bid_ask", bid_ask, "diff: ", diff)
-        raise Exception("Orderbook too loose.")
+    flags = grade_bid_ask(market, bid_ask, DYDX.tick_size(market))
+    if flags:
+        print(f"{market} flagged {flag_names(flags)}: {bid_ask}")
+    return bid_ask
 
 
 # =============================================================================
@@ -201,70 +450,65 @@ def add_mid_to_bid_ask(bid_ask):
 
 
 # =============================================================================
-# PUSH DATA TO S3, MAKE NEW FILE IF NEW DAY
+# ALL MARKETS' LEVELS IN ONE VECTORIZED PASS, nan ROWS HAVE NONE
 # =============================================================================
-def push_bid_ask_to_s3(bid_ask, now_s, today):
-    market = bid_ask.pop("market")
-    bid_ask["timestamp"] = now_s
-    filepath = f"{market}/{market}_{today}.csv"
-    bid_ask = convert_bid_ask_to_df(bid_ask)
-
-    if check_if_file_exists_in_s3(filepath):
-        append_bid_ask_to_existing_csv(bid_ask, filepath)
-    else:
-        # create new CSV
-        save_df_to_csv(bid_ask, filepath)
+def store_depth(rows, now_s, today):
+    books = {bid_ask["market"]: bid_ask.pop("levels", None) for bid_ask in rows}
+    try:
+        depth_writer().add(books, now_s, today)
+    except Exception as e:
+        print(f"Failed storing depth: {e}")
 
 
 # =============================================================================
-# APPEND TO EXISTING .CSV
+# HAND A TICK'S ROWS TO THE CONFIGURED STORAGE
 # =============================================================================
-def append_bid_ask_to_existing_csv(bid_ask, filepath):
-    obj = S3.get_object(Bucket=BUCKET_NAME, Key=filepath)
-    data = obj["Body"].read().decode("utf-8")
-    df = pd.read_csv(io.StringIO(data))
-    df = pd.concat([df, bid_ask], ignore_index=True)
-    save_df_to_csv(df, filepath)
+def store_bid_asks(rows, now_s, today):
+    if STORAGE_MODE == "wide":
+        wide_writer().add(rows, now_s, today)
+        return
+    if RECORD_CHANGES_ONLY:
+        changed = CHANGES.filter(rows, now_s)
+        METRICS.inc("rows_unchanged", len(rows) - len(changed))
+        rows = changed
+    for bid_ask in rows:
+        try:
+            store_bid_ask(bid_ask, now_s, today)
+        except Exception as e:
+            print(f"Failed storing {bid_ask}: {e}")
 
 
-# =============================================================================
-# Create a new csv and append data
-# =============================================================================
-def save_df_to_csv(df, filepath):
-    df = df.set_index("timestamp")
-    csv_buffer = io.StringIO()
-    df.to_csv(csv_buffer)
-    print("Not saving for testing")
-    # res = S3.put_object(Bucket=BUCKET_NAME, Key=filepath, Body=csv_buffer.getvalue())
-    # print(
-    #     f"{filepath} saved with status code: {res['ResponseMetadata']['HTTPStatusCode']}"
-    # )
+def store_bid_ask(bid_ask, now_s, today):
+    if STORAGE_MODE == "wal":
+        append_bid_ask_to_wal(bid_ask, now_s, today)
+    else:
+        push_bid_ask_to_s3(bid_ask, now_s, today)
 
 
 # =============================================================================
-#
-# HELPERS
-#
+# APPEND TO THE LOCAL WRITE-AHEAD LOG, NO NETWORK ON THE HOT PATH
 # =============================================================================
+def append_bid_ask_to_wal(bid_ask, now_s, today):
+    market = bid_ask.pop("market")
+    bid_ask["timestamp"] = now_s
+    WAL.append(market, today, bid_ask)
 
 
 # =============================================================================
-# dYdX returns values as strings
+# PUSH DATA TO S3 AS AN IMMUTABLE SEGMENT, COMPACTED INTO THE DAILY FILE LATER
 # =============================================================================
-def process_orderbook_to_df(orderbook, _type):
-    df = pd.DataFrame(orderbook[_type])
-    df["price"] = pd.to_numeric(df["price"])
-    df["size"] = pd.to_numeric(df["size"])
-    return df
+def push_bid_ask_to_s3(bid_ask, now_s, today):
+    market = bid_ask.pop("market")
+    bid_ask["timestamp"] = now_s
+    seg_id = segment_id(now_s)
+    write_segment_rows(S3, BUCKET_NAME, market, today, [bid_ask], CSV_HEADER, seg_id)
 
 
 # =============================================================================
-# Determine tick difference between bid, ask, to make sure orderbook is proper
+#
+# HELPERS
+#
 # =============================================================================
-def determine_tick_diff(params, bid_ask):
-    ask, bid = bid_ask["ask_price"], bid_ask["bid_price"]
-    ticks = round((ask - bid) / params["price_rounder"], 3)
-    return abs(ticks)
 
 
 # =============================================================================
@@ -273,10 +517,11 @@ def determine_tick_diff(params, bid_ask):
 def create_nan_bid_ask_dict(market) -> dict:
     return {
         "market": market,
-        "ask_price": np.nan,
-        "ask_size": np.nan,
-        "bid_price": np.nan,
-        "bid_size": np.nan,
+        "ask_price": float("nan"),
+        "ask_size": float("nan"),
+        "bid_price": float("nan"),
+        "bid_size": float("nan"),
+        "quality": MISSING,
     }
 
 
@@ -304,20 +549,97 @@ def convert_dict_to_csv_row(d):
 # CONVERT THE BID ASK TO A DATAFRAME
 # =============================================================================
 def convert_bid_ask_to_df(bid_ask):
+    import pandas as pd
+
     df = pd.DataFrame([bid_ask])
     df = df[CSV_HEADER]
     return df
 
 
+# =============================================================================
+# SCHEDULER, NEEDS THE FUNCTIONS ABOVE
+# =============================================================================
+SCHEDULER = FetchScheduler(
+    fetch_bid_ask,
+    create_nan_bid_ask_dict,
+    DYDX_BUCKET,
+    max_workers=FETCH_CONCURRENCY,
+    deadline=TICK_DEADLINE,
+    on_error=report_fetch_error,
+    metrics=METRICS,
+)
+
+
+VENUE_ADAPTERS = [get_adapter(venue) for venue in VENUES]
+VENUE_POOL = None
+if VENUE_ADAPTERS:
+    import concurrent.futures
+
+    VENUE_POOL = concurrent.futures.ThreadPoolExecutor(len(VENUE_ADAPTERS) + 1)
+
+
 # =============================================================================
 # CREATE THE RELEVANT DATE STRINGS
 # =============================================================================
-def create_relevant_date_strings():
-    now = dt.datetime.now(dt.timezone.utc)
+def create_relevant_date_strings(now=None):
+    if now is None:
+        now = dt.datetime.now(dt.timezone.utc)
     now_s = str(now).split("+")[0]
     today = str(now.replace(hour=0, minute=0, second=0, microsecond=0)).split(" ")[0]
     return now_s, today
 
 
+# =============================================================================
+# FIRST TICK OF A NEW UTC DAY, RETURNS THE DAY THAT JUST FINISHED
+# =============================================================================
+_ROLLOVER_LOCK = threading.Lock()
+
+
+def detect_day_rollover(today):
+    # the daemon stores ticks from several threads, only one may see the change
+    with _ROLLOVER_LOCK:
+        try:
+            with open(LAST_DAY_FILE) as f:
+                last_day = f.read().strip()
+        except FileNotFoundError:
+            last_day = None
+        if last_day == today:
+            return None
+        with open(LAST_DAY_FILE, "w") as f:
+            f.write(today)
+    if last_day and last_day < today:
+        return last_day
+    return None
+
+
+# =============================================================================
+# COMPACT THE FINISHED DAY'S SEGMENTS, THEN BUILD ITS BARS
+# =============================================================================
+def roll_over_day(day):
+    from segment_writer import compact_day
+    from bars import compact_bars
+
+    try:
+        if STORAGE_MODE == "wal":
+            from wal import WalFlusher
+
+            # rows `python wal.py` hasn't shipped yet would miss the daily file
+            WalFlusher(WAL, S3, BUCKET_NAME).flush_day(day)
+        if STORAGE_MODE in ("segments", "wal"):
+            compact_day(S3, BUCKET_NAME, STORAGE_MARKETS, day, OUTPUT_FORMAT)
+        compact_bars(S3, BUCKET_NAME, MARKETS, day, OUTPUT_FORMAT)
+    except Exception as e:
+        print(f"Roll-over of {day} failed: {e}")
+        ALERTS.submit(e)
+
+
 if __name__ == "__main__":
-    main()
+    try:
+        main()
+    finally:
+        # one-shot run: send whatever is still queued before exiting
+        flush_wide_writer()
+        flush_depth_writer()
+        ALERTS.stop()
+        if METRICS_JSON:
+            METRICS.dump_json(METRICS_JSON)
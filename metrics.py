@@ -0,0 +1,301 @@
+# =============================================================================
+# IMPORTS
+# =============================================================================
+import os, time, json, bisect, threading
+
+# =============================================================================
+# CONFIG
+# =============================================================================
+PREFIX = "dydx"
+# seconds, upper bounds of the latency buckets (+Inf is implied)
+BUCKETS = [
+    0.00001,
+    0.000025,
+    0.00005,
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+]
+METRICS_PORT = os.getenv("METRICS_PORT")  # unset: no endpoint
+METRICS_JSON = os.getenv("METRICS_JSON")  # unset: no dump
+METRICS_DUMP_INTERVAL = float(os.getenv("METRICS_DUMP_INTERVAL", 60))
+
+
+# =============================================================================
+# ONE LATENCY SERIES: FIXED BUCKETS, SO OBSERVING IS A BISECT AND AN ADD
+# =============================================================================
+class Histogram:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def merge(self, other):
+        for i, c in enumerate(other.counts):
+            self.counts[i] += c
+        self.count += other.count
+        self.sum += other.sum
+        self.max = max(self.max, other.max)
+
+    def quantile(self, q):
+        # linear within the bucket holding the q-th observation, like
+        # prometheus' histogram_quantile
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, c in enumerate(self.counts):
+            if seen + c >= rank and c:
+                lower = self.buckets[i - 1] if i else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else self.max
+                return min(lower + (upper - lower) * (rank - seen) / c, self.max)
+            seen += c
+        return self.max
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "p50": self.quantile(0.5),
+            "p99": self.quantile(0.99),
+            "max": self.max,
+        }
+
+
+# =============================================================================
+# REGISTRY OF STAGE TIMERS AND COUNTERS, LABELLED (market, op, ...)
+# =============================================================================
+class Metrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}  # (name, labels) -> Histogram
+        self.counters = {}  # (name, labels) -> int
+
+    def observe(self, name, seconds, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            hist = self.histograms.get(key)
+            if hist is None:
+                hist = self.histograms[key] = Histogram()
+            hist.observe(seconds)
+
+    def inc(self, name, n=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + n
+
+    def timer(self, name, **labels):
+        return Timer(self, name, labels)
+
+    def reset(self):
+        with self.lock:
+            self.histograms = {}
+            self.counters = {}
+
+    # =========================================================================
+    # OUTPUT
+    # =========================================================================
+    def snapshot(self):
+        with self.lock:
+            histograms = list(self.histograms.items())
+            counters = list(self.counters.items())
+        stages, totals = {}, {}
+        for (name, labels), hist in histograms:
+            series = dict(labels, **hist.summary())
+            stages.setdefault(name, []).append(series)
+            total = totals.setdefault(name, Histogram())
+            total.merge(hist)
+        out = {
+            "time": time.time(),
+            "stages": {name: total.summary() for name, total in totals.items()},
+            "series": stages,
+            "counters": {},
+        }
+        for (name, labels), value in counters:
+            out["counters"].setdefault(name, []).append(dict(labels, value=value))
+        return out
+
+    def prometheus(self):
+        with self.lock:
+            histograms = sorted(self.histograms.items())
+            counters = sorted(self.counters.items())
+        lines = []
+        seen = set()
+        for (name, labels), hist in histograms:
+            metric = f"{PREFIX}_{name}_seconds"
+            if metric not in seen:
+                seen.add(metric)
+                lines.append(f"# TYPE {metric} histogram")
+            cumulative = 0
+            for bound, c in zip(hist.buckets + ["+Inf"], hist.counts):
+                cumulative += c
+                le = labels + (("le", str(bound)),)
+                lines.append(f"{metric}_bucket{render_labels(le)} {cumulative}")
+            lines.append(f"{metric}_sum{render_labels(labels)} {hist.sum}")
+            lines.append(f"{metric}_count{render_labels(labels)} {hist.count}")
+        for (name, labels), value in counters:
+            metric = f"{PREFIX}_{name}_total"
+            if metric not in seen:
+                seen.add(metric)
+                lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric}{render_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def dump_json(self, path):
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.snapshot(), f, indent=1)
+        os.replace(tmp, path)
+
+
+class Timer:
+    __slots__ = ("metrics", "name", "labels", "start")
+
+    def __init__(self, metrics, name, labels):
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        self.metrics.observe(self.name, elapsed, **self.labels)
+        return False
+
+
+def render_labels(labels):
+    if not labels:
+        return ""
+    inner = ",".join(f'{k}="{v}"' for k, v in labels)
+    return "{" + inner + "}"
+
+
+# =============================================================================
+# S3 CLIENT THAT TIMES EVERY CALL, EVERYTHING ELSE PASSES THROUGH
+# =============================================================================
+S3_OPERATIONS = (
+    "head_object",
+    "get_object",
+    "put_object",
+    "list_objects_v2",
+    "delete_objects",
+)
+
+
+class InstrumentedS3:
+    def __init__(self, s3, metrics):
+        self.s3 = s3
+        self.metrics = metrics
+
+    @property
+    def exceptions(self):
+        return self.s3.exceptions
+
+    def __getattr__(self, name):
+        attr = getattr(self.s3, name)
+        if name not in S3_OPERATIONS:
+            return attr
+
+        def call(**kwargs):
+            with self.metrics.timer("s3", op=name):
+                try:
+                    return attr(**kwargs)
+                except Exception:
+                    self.metrics.inc("s3_errors", op=name)
+                    raise
+
+        return call
+
+
+# =============================================================================
+# EXPOSE: /metrics (prometheus text) and /metrics.json ON METRICS_PORT, AND/OR
+# A JSON FILE REWRITTEN EVERY METRICS_DUMP_INTERVAL SECONDS
+# =============================================================================
+def serve(metrics, port, host="127.0.0.1"):
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path == "/metrics":
+                body = metrics.prometheus().encode("utf-8")
+                content_type = "text/plain; version=0.0.4"
+            elif self.path == "/metrics.json":
+                body = json.dumps(metrics.snapshot()).encode("utf-8")
+                content_type = "application/json"
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, int(port)), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"Metrics on http://{host}:{server.server_address[1]}/metrics")
+    return server
+
+
+class JsonDumper:
+    def __init__(self, metrics, path, interval=METRICS_DUMP_INTERVAL):
+        self.metrics = metrics
+        self.path = path
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def run(self):
+        while not self._stop.wait(self.interval):
+            self.dump()
+        self.dump()
+
+    def dump(self):
+        try:
+            self.metrics.dump_json(self.path)
+        except Exception as e:
+            print(f"Failed dumping metrics: {e}")
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+
+# =============================================================================
+# THE PROCESS-WIDE REGISTRY
+# =============================================================================
+METRICS = Metrics()
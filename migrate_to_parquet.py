@@ -0,0 +1,77 @@
+# =============================================================================
+# IMPORTS
+# =============================================================================
+import re, sys
+import concurrent.futures
+from storage_formats import CsvFormat, ParquetFormat
+
+# =============================================================================
+# MIGRATE THE CSV HISTORY TO THE PARTITIONED PARQUET LAYOUT
+#
+#   python migrate_to_parquet.py [--overwrite]
+#
+# Every {market}/{market}_{day}.csv in the bucket gets a Parquet copy under
+# parquet/market={market}/date={day}/. The CSVs are left where they are.
+# =============================================================================
+CSV = CsvFormat()
+PARQUET = ParquetFormat()
+DAILY_CSV = re.compile(
+    r"^(?P<market>[^/]+)/(?P=market)_(?P<day>\d{4}-\d{2}-\d{2})\.csv$"
+)
+
+
+def list_daily_csvs(s3, bucket):
+    found = []
+    kwargs = {"Bucket": bucket}
+    while True:
+        res = s3.list_objects_v2(**kwargs)
+        for obj in res.get("Contents", []):
+            match = DAILY_CSV.match(obj["Key"])
+            if match:
+                found.append((obj["Key"], match["market"], match["day"]))
+        if not res.get("IsTruncated"):
+            break
+        kwargs["ContinuationToken"] = res["NextContinuationToken"]
+    return found
+
+
+def existing_keys(s3, bucket, prefix):
+    keys = set()
+    kwargs = {"Bucket": bucket, "Prefix": prefix}
+    while True:
+        res = s3.list_objects_v2(**kwargs)
+        keys.update(obj["Key"] for obj in res.get("Contents", []))
+        if not res.get("IsTruncated"):
+            break
+        kwargs["ContinuationToken"] = res["NextContinuationToken"]
+    return keys
+
+
+def migrate_one(s3, bucket, key, market, day):
+    obj = s3.get_object(Bucket=bucket, Key=key)
+    df = CSV.deserialize(obj["Body"].read())
+    target = PARQUET.daily_key(market, day)
+    s3.put_object(Bucket=bucket, Key=target, Body=PARQUET.serialize(df))
+    return target
+
+
+def migrate(s3, bucket, overwrite=False, max_workers=8):
+    todo = list_daily_csvs(s3, bucket)
+    if not overwrite:
+        done = existing_keys(s3, bucket, "parquet/")
+        todo = [t for t in todo if PARQUET.daily_key(t[1], t[2]) not in done]
+    print(f"Migrating {len(todo)} daily files to parquet")
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(migrate_one, s3, bucket, *t): t[0] for t in todo}
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                print(f"{futures[future]} -> {future.result()}")
+            except Exception as e:
+                print(f"Failed migrating {futures[future]}: {e}")
+
+
+if __name__ == "__main__":
+    from main import S3, BUCKET_NAME
+
+    migrate(S3, BUCKET_NAME, overwrite="--overwrite" in sys.argv)
@@ -1,3 +1,15 @@
+import os, time
+from venues import DydxAdapter, fetch_quotes
+from quote_board import QuoteBoard
+
+# the puller's live quote board (main.py QUOTE_BOARD), used instead of a REST
+# call while its quote is younger than QUOTE_MAX_AGE seconds and clean
+QUOTE_BOARD = os.getenv("QUOTE_BOARD")
+QUOTE_MAX_AGE = float(os.getenv("QUOTE_MAX_AGE", 5))
+# refetches of a book whose spread is too wide before giving up on it
+MAX_WIDE_RETRIES = int(os.getenv("MAX_WIDE_RETRIES", 5))
+
+
 class DydxHelper:
     def __init__(self, wallet, api_key, api_secret, passphrase, stark, token):
 
@@ -10,6 +22,8 @@ class DydxHelper:
         self.tick_adjust = (
             self.order_params[self.token]["price_rounder"] / 2
         )  # this will put you 1 tick above/below
+        # public books come through the same adapter as the puller's
+        self.venue = DydxAdapter(market_params=lambda: self.order_params)
 
     def get_order_params(self, token):
 
@@ -78,55 +92,68 @@ class DydxHelper:
 
     def tick_diff(self, bid, ask):
 
-        ticks = round((ask - bid) / self.order_params[self.token]["price_rounder"], 3)
+        ticks = round((ask - bid) / self.venue.tick_size(self.token), 3)
         return abs(ticks)
 
-    def get_bid_ask(self):
+    def board_quote(self):
 
-        # timestamp = datetime.datetime.utcnow()
-        # orderbook = self.public_client.public.get_orderbook(market=self.token).data
+        if not QUOTE_BOARD or not os.path.exists(QUOTE_BOARD):
+            return None
+        if getattr(self, "board", None) is None:
+            self.board = QuoteBoard(QUOTE_BOARD)
+        quote = self.board.get(self.token, QUOTE_MAX_AGE)
+        if quote is None or quote.quality:
+            return None
+        return quote
 
-        orderbook = self.client.get_orderbook(self.token)
+    def get_top_of_book(self):
 
-        bids = (
-            pd.DataFrame(orderbook["bids"])
-            .head(1)
-            .rename(columns={"size": "bid_size", "price": "bid_price"})
-        )
-        asks = (
-            pd.DataFrame(orderbook["asks"])
-            .head(1)
-            .rename(columns={"size": "ask_size", "price": "ask_price"})
-        )
-        # mid  = (bids["bid_price"].astype(float) + asks["ask_price"].astype(float)) / 2 # TODO - should upgrade to weighted mid?
+        """
+        Best bid / ask as a TopOfBook: the quote board when it's fresh, else the
+        REST orderbook, refetched (at most MAX_WIDE_RETRIES times) while the
+        spread is 10 ticks or more. The last book is returned if it stays wide.
+        """
 
-        ladder = pd.concat([bids, asks], axis=1)
-        ladder = ladder.astype(float)
-        ladder = ladder.reindex(
-            columns=["bid_price", "bid_size", "ask_price", "ask_size"]
-        )
-        # results["mid_price"] = mid
-        # results.index = [timestamp]
+        top = self.board_quote()
+        if top is not None:
+            return top
 
-        top_bid = ladder["bid_price"].head(1).values[0]
-        top_ask = ladder["ask_price"].head(1).values[0]
+        for attempt in range(MAX_WIDE_RETRIES + 1):
+            # timestamp = datetime.datetime.utcnow()
+            # orderbook = self.public_client.public.get_orderbook(market=self.token).data
 
-        # diff = self.diff_check(top_bid, top_ask)
-        diff = self.tick_diff(top_bid, top_ask)
+            top = fetch_quotes(self.venue, [self.token])[self.token]
 
-        # TODO - want this to be like less than 3 ticks difference?
-        if diff < 10.0:
-            return ladder
+            # diff = self.diff_check(top_bid, top_ask)
+            diff = self.tick_diff(top.bid_price, top.ask_price)
+
+            # TODO - want this to be like less than 3 ticks difference?
+            if diff < 10.0:
+                return top
 
-        else:
             print(
-                f"Bid ask was too far apart for {self.token} on DYDX at bid: {top_bid}, ask: {top_ask}."
+                f"Bid ask was too far apart for {self.token} on DYDX at bid: {top.bid_price}, ask: {top.ask_price}."
             )
             # TODO - send alert.
-            time.sleep(0.50)
-            self.get_bid_ask()
+            if attempt < MAX_WIDE_RETRIES:
+                time.sleep(0.50)
+        return top
+
+    def get_bid_ask(self):
 
-        return ladder
+        """
+        One-row ladder DataFrame (bid_price, bid_size, ask_price, ask_size), as
+        it always returned; get_top_of_book() skips building the frame.
+        """
+
+        import pandas as pd
+
+        top = self.get_top_of_book()
+        ladder = pd.DataFrame(
+            [[top.bid_price, top.bid_size, top.ask_price, top.ask_size]],
+            columns=["bid_price", "bid_size", "ask_price", "ask_size"],
+        )
+        return ladder.astype(float)
 
     def get_mid_price(self):
 
@@ -134,11 +161,8 @@ class DydxHelper:
         Calculates mid price, and makes sure that the bid/ask aren't super far apart.
         """
 
-        ladder = self.get_bid_ask()
-        top_bid = ladder["bid_price"].head(1).values[0]
-        top_ask = ladder["ask_price"].head(1).values[0]
-
-        mid = (top_bid + top_ask) / 2
+        top = self.get_top_of_book()
+        mid = top.mid  # TODO - should upgrade to weighted mid?
         # mid = self.price_rounder(mid) #TODO - round in the long/short part away from that direction.
 
         print(f"\nMid price from Dydx for {self.token}: {mid}")
@@ -0,0 +1,205 @@
+# =============================================================================
+# IMPORTS
+# =============================================================================
+import os, json, math, time, threading
+
+# =============================================================================
+# QUALITY FLAGS, STORED AS A BITMASK IN THE `quality` COLUMN (0 = CLEAN)
+#
+#   crossed  bid >= ask
+#   wide     spread far above the market's usual one (and >= QUALITY_WIDE_TICKS
+#            ticks when the tick size is known, the old "too loose" rule)
+#   jump     mid moved more than QUALITY_JUMP_SIGMAS rolling sigmas since the
+#            last tick (and more than QUALITY_JUMP_FLOOR)
+#   stale    exact same top of book for QUALITY_STALE_SECONDS or longer
+#   thin     top of book size far below the market's usual one
+#   missing  no book at all, the row is nan
+#   backfill the mid came from a backfill source (gap_filler.py), not from a
+#            recorded book; bid / ask stay nan, so it comes with `missing`
+#
+# Rows are never dropped or refetched because of a flag, readers filter on
+# `quality == 0` (or mask the bits they care about).
+# =============================================================================
+CROSSED = 1
+WIDE = 2
+JUMP = 4
+STALE = 8
+THIN = 16
+MISSING = 32
+BACKFILL = 64
+FLAGS = {
+    "crossed": CROSSED,
+    "wide": WIDE,
+    "jump": JUMP,
+    "stale": STALE,
+    "thin": THIN,
+    "missing": MISSING,
+    "backfill": BACKFILL,
+}
+
+QUALITY_ALPHA = float(os.getenv("QUALITY_ALPHA", 0.05))
+QUALITY_WARMUP = int(os.getenv("QUALITY_WARMUP", 20))
+QUALITY_WIDE_TICKS = float(os.getenv("QUALITY_WIDE_TICKS", 10))
+QUALITY_WIDE_FACTOR = float(os.getenv("QUALITY_WIDE_FACTOR", 4))
+QUALITY_JUMP_SIGMAS = float(os.getenv("QUALITY_JUMP_SIGMAS", 8))
+QUALITY_JUMP_FLOOR = float(os.getenv("QUALITY_JUMP_FLOOR", 0.002))
+QUALITY_STALE_SECONDS = float(os.getenv("QUALITY_STALE_SECONDS", 120))
+QUALITY_THIN_FACTOR = float(os.getenv("QUALITY_THIN_FACTOR", 0.01))
+
+
+def flag_names(flags):
+    return [name for name, bit in FLAGS.items() if flags & bit]
+
+
+# =============================================================================
+# ROLLING STATE OF ONE MARKET, O(1) PER UPDATE
+# =============================================================================
+class MarketStats:
+    __slots__ = (
+        "n",
+        "mid",
+        "last_mid",
+        "ret_var",
+        "spread",
+        "size",
+        "book",
+        "changed",
+    )
+
+    def __init__(self):
+        self.n = 0
+        self.mid = None  # EWMA of mid
+        self.last_mid = None
+        self.ret_var = 0.0  # EWMA of squared log returns tick to tick
+        self.spread = None  # EWMA of ask - bid
+        self.size = None  # EWMA of (bid size + ask size) / 2
+        self.book = None  # last (bid, bid size, ask, ask size)
+        self.changed = None  # when `book` last changed
+
+    def as_list(self):
+        return [getattr(self, name) for name in self.__slots__]
+
+    @classmethod
+    def from_list(cls, values):
+        stats = cls()
+        for name, value in zip(cls.__slots__, values):
+            setattr(stats, name, value)
+        if stats.book is not None:
+            stats.book = tuple(stats.book)
+        return stats
+
+
+def ewma(current, value, alpha):
+    return value if current is None else current + alpha * (value - current)
+
+
+# =============================================================================
+# VALIDATOR: grade(key, bid_ask) SETS bid_ask["quality"] AND UPDATES THE STATE
+# =============================================================================
+class QualityValidator:
+    def __init__(
+        self,
+        alpha=QUALITY_ALPHA,
+        warmup=QUALITY_WARMUP,
+        wide_ticks=QUALITY_WIDE_TICKS,
+        wide_factor=QUALITY_WIDE_FACTOR,
+        jump_sigmas=QUALITY_JUMP_SIGMAS,
+        jump_floor=QUALITY_JUMP_FLOOR,
+        stale_seconds=QUALITY_STALE_SECONDS,
+        thin_factor=QUALITY_THIN_FACTOR,
+    ):
+        self.alpha = alpha
+        self.warmup = warmup
+        self.wide_ticks = wide_ticks
+        self.wide_factor = wide_factor
+        self.jump_sigmas = jump_sigmas
+        self.jump_floor = jump_floor
+        self.stale_seconds = stale_seconds
+        self.thin_factor = thin_factor
+        self.stats = {}  # key (a storage market name) -> MarketStats
+        self.lock = threading.Lock()
+
+    def grade(self, key, bid_ask, tick_size=None, now=None):
+        with self.lock:
+            stats = self.stats.get(key)
+            if stats is None:
+                stats = self.stats[key] = MarketStats()
+            flags = self.check(stats, bid_ask, tick_size, now or time.time())
+        bid_ask["quality"] = flags
+        return flags
+
+    def check(self, stats, bid_ask, tick_size, now):
+        bid, ask = bid_ask["bid_price"], bid_ask["ask_price"]
+        bid_size, ask_size = bid_ask["bid_size"], bid_ask["ask_size"]
+        if any(math.isnan(v) for v in (bid, ask, bid_size, ask_size)):
+            return MISSING
+        if bid >= ask:
+            # nothing about a crossed book is worth learning from
+            return CROSSED
+
+        flags = 0
+        warm = stats.n >= self.warmup
+        mid, spread, size = (bid + ask) / 2, ask - bid, (bid_size + ask_size) / 2
+
+        too_many_ticks = tick_size is None or spread / tick_size >= self.wide_ticks
+        if warm:
+            if too_many_ticks and spread > self.wide_factor * stats.spread:
+                flags |= WIDE
+        elif tick_size is not None and too_many_ticks:
+            flags |= WIDE
+
+        ret = 0.0
+        if stats.last_mid:
+            ret = math.log(mid / stats.last_mid)
+            limit = max(self.jump_floor, self.jump_sigmas * math.sqrt(stats.ret_var))
+            if warm and abs(ret) > limit:
+                flags |= JUMP
+
+        if warm and size < self.thin_factor * stats.size:
+            flags |= THIN
+
+        book = (bid, bid_size, ask, ask_size)
+        if book != stats.book:
+            stats.book, stats.changed = book, now
+        elif now - stats.changed >= self.stale_seconds:
+            flags |= STALE
+
+        # a jump still moves the level (a real move isn't flagged twice) but
+        # doesn't inflate the volatility it is measured against
+        if not flags & JUMP:
+            stats.ret_var = ewma(stats.ret_var, ret * ret, self.alpha)
+        stats.mid = ewma(stats.mid, mid, self.alpha)
+        stats.spread = ewma(stats.spread, spread, self.alpha)
+        stats.size = ewma(stats.size, size, self.alpha)
+        stats.last_mid = mid
+        stats.n += 1
+        return flags
+
+    # =========================================================================
+    # STATE ON DISK, SO ONE-SHOT RUNS PICK UP WHERE THE LAST ONE STOPPED
+    # =========================================================================
+    def load(self, path):
+        try:
+            with open(path) as f:
+                saved = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return False
+        self.restore(saved)
+        return True
+
+    def save(self, path):
+        saved = self.state()
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(saved, f)
+        os.replace(tmp, path)
+
+    def state(self):
+        # JSON-able, for load / save and sharding.py's shared copy
+        with self.lock:
+            return {key: stats.as_list() for key, stats in self.stats.items()}
+
+    def restore(self, saved):
+        with self.lock:
+            for key, values in saved.items():
+                self.stats[key] = MarketStats.from_list(values)
@@ -0,0 +1,238 @@
+# =============================================================================
+# IMPORTS
+# =============================================================================
+import os, sys, mmap, time, struct
+from top_of_book import Quote
+
+# =============================================================================
+# LIVE QUOTE BOARD: THE LATEST TOP OF BOOK PER MARKET IN A SHARED MMAP FILE
+#
+# The puller (main.py / daemon.py with QUOTE_BOARD=/dev/shm/dydx-quotes) is
+# the one writer, any number of local processes read it with QuoteBoard, no
+# network involved:
+#
+#   board = QuoteBoard("/dev/shm/dydx-quotes")
+#   board.mid("BTC-USD", max_age=5)
+#
+# Layout, little endian, fixed for a given market list:
+#   magic "DXQB" | u16 version | u16 n_markets | u32 record size | u32 pad
+#   char[NAME_SIZE] * n_markets           market names, nul padded
+#   record * n_markets                    one 64-byte record each
+#
+# record: u64 seq | f64 bid | f64 bid size | f64 ask | f64 ask size
+#         | i64 tick (ns since epoch) | f64 received (unix s) | u32 quality
+#
+# Every record is a seqlock: the writer makes `seq` odd, writes the fields,
+# then makes it even again. A reader retries while `seq` is odd or changed
+# under it, so it never returns half of one update and half of another.
+# `seq` goes through a native u64 memoryview (little endian on x86 / arm), a
+# single aligned 8-byte store / load; struct.pack_into clears its target
+# first and would show readers a 0.
+# =============================================================================
+MAGIC = b"DXQB"
+VERSION = 1
+HEADER = struct.Struct("<4sHHII")
+NAME_SIZE = 32
+SEQ_SIZE = 8
+FIELDS = struct.Struct("<ddddqdI4x")
+RECORD_SIZE = SEQ_SIZE + FIELDS.size  # 64, one cache line
+SPINS = 100  # busy retries before yielding the CPU to a preempted writer
+READ_TIMEOUT = 0.5
+# how often get() looks for a board the writer swapped in, besides on a miss
+REOPEN_CHECK = 1.0
+
+
+def board_size(n_markets):
+    return HEADER.size + NAME_SIZE * n_markets + RECORD_SIZE * n_markets
+
+
+def record_offset(n_markets, i):
+    return HEADER.size + NAME_SIZE * n_markets + RECORD_SIZE * i
+
+
+# =============================================================================
+# WRITER, OWNED BY THE PULLER
+# =============================================================================
+class BoardWriter:
+    def __init__(self, path, markets):
+        self.path = path
+        self.markets = list(markets)
+        self.index = {market: i for i, market in enumerate(self.markets)}
+        self.map = self.open()
+        self.seqs = memoryview(self.map).cast("Q")
+
+    def open(self):
+        size = board_size(len(self.markets))
+        if not self.same_layout(size):
+            # built aside and swapped in, readers never see a half header
+            tmp = f"{self.path}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(self.header())
+                f.write(b"\0" * (size - f.tell()))
+            os.replace(tmp, self.path)
+        fd = os.open(self.path, os.O_RDWR)
+        try:
+            return mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+
+    def header(self):
+        names = b"".join(encode_name(m) for m in self.markets)
+        return HEADER.pack(MAGIC, VERSION, len(self.markets), RECORD_SIZE, 0) + names
+
+    def same_layout(self, size):
+        # same markets: keep the file (and every reader's mapping) as it is
+        try:
+            with open(self.path, "rb") as f:
+                header = f.read(len(self.header()))
+            return header == self.header() and os.path.getsize(self.path) == size
+        except FileNotFoundError:
+            return False
+
+    def publish(self, market, bid, bid_size, ask, ask_size, tick_ns, received, quality):
+        i = self.index.get(market)
+        if i is None:
+            return False
+        offset = record_offset(len(self.markets), i)
+        seq = self.seqs[offset // SEQ_SIZE]
+        seq += seq & 1  # a writer that died mid-update left it odd
+        self.seqs[offset // SEQ_SIZE] = seq + 1
+        FIELDS.pack_into(
+            self.map,
+            offset + SEQ_SIZE,
+            bid,
+            bid_size,
+            ask,
+            ask_size,
+            tick_ns,
+            received,
+            quality,
+        )
+        self.seqs[offset // SEQ_SIZE] = seq + 2
+        return True
+
+    def close(self):
+        self.seqs.release()
+        self.map.close()
+
+
+def encode_name(market):
+    name = market.encode("utf-8")
+    if len(name) > NAME_SIZE:
+        raise Exception(f"Market name too long for the quote board: {market}")
+    return name.ljust(NAME_SIZE, b"\0")
+
+
+# =============================================================================
+# READER LIBRARY, FOR STRATEGY PROCESSES ON THE SAME HOST
+# =============================================================================
+class BoardQuote(Quote):
+    __slots__ = ("tick", "quality")
+
+    def __repr__(self):
+        return f"{super().__repr__()} tick={self.tick} quality={self.quality}"
+
+
+class QuoteBoard:
+    def __init__(self, path):
+        self.path = path
+        self.open()
+
+    def open(self):
+        with open(self.path, "rb") as f:
+            self.inode = os.fstat(f.fileno()).st_ino
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.checked = time.monotonic()
+        self.seqs = memoryview(self.map).cast("Q")
+        magic, version, n, record_size, _ = HEADER.unpack_from(self.map)
+        if magic != MAGIC or version != VERSION or record_size != RECORD_SIZE:
+            raise Exception(f"{self.path} is not a version {VERSION} quote board")
+        names = self.map[HEADER.size : HEADER.size + NAME_SIZE * n]
+        self.markets = [
+            names[i * NAME_SIZE : (i + 1) * NAME_SIZE].rstrip(b"\0").decode("utf-8")
+            for i in range(n)
+        ]
+        self.offsets = {
+            market: record_offset(n, i) for i, market in enumerate(self.markets)
+        }
+
+    def reopen_if_replaced(self):
+        # the writer swaps in a new file when the market list changes
+        self.checked = time.monotonic()
+        if os.stat(self.path).st_ino != self.inode:
+            self.close()
+            self.open()
+            return True
+        return False
+
+    def read(self, market):
+        # raw fields of one consistent update, None before the first one or
+        # for a market this board doesn't have
+        offset = self.offsets.get(market)
+        if offset is None:
+            return None
+        seq = offset // SEQ_SIZE
+        give_up = None
+        while True:
+            for _ in range(SPINS):
+                before = self.seqs[seq]
+                if before & 1:
+                    continue
+                fields = FIELDS.unpack_from(self.map, offset + SEQ_SIZE)
+                after = self.seqs[seq]
+                if before == after:
+                    return fields if before else None
+            if give_up is None:
+                give_up = time.monotonic() + READ_TIMEOUT
+            elif time.monotonic() > give_up:
+                raise Exception(f"Quote board record for {market} kept changing")
+            time.sleep(0)
+
+    def get(self, market, max_age=None):
+        if time.monotonic() - self.checked > REOPEN_CHECK:
+            self.reopen_if_replaced()
+        fields = self.read(market)
+        # a market added since we opened the board is only on the new file
+        if fields is None and self.reopen_if_replaced():
+            fields = self.read(market)
+        if fields is None:
+            return None
+        bid, bid_size, ask, ask_size, tick_ns, received, quality = fields
+        if max_age is not None and time.time() - received > max_age:
+            return None
+        quote = BoardQuote(
+            venue_of(market), market, bid, bid_size, ask, ask_size, received
+        )
+        quote.tick = tick_ns
+        quote.quality = quality
+        return quote
+
+    def mid(self, market, max_age=None):
+        quote = self.get(market, max_age)
+        return None if quote is None else quote.mid
+
+    def snapshot(self, max_age=None):
+        return {market: self.get(market, max_age) for market in self.markets}
+
+    def close(self):
+        self.seqs.release()
+        self.map.close()
+
+
+def venue_of(market):
+    # "BTC-USD" is dYdX, "BTC-USD.binance" another venue, see venues.py
+    return market.split(".", 1)[1] if "." in market else "dydx"
+
+
+# =============================================================================
+# python quote_board.py PATH [MARKET ...]: PRINT WHAT'S ON THE BOARD
+# =============================================================================
+if __name__ == "__main__":
+    board = QuoteBoard(sys.argv[1])
+    for market in sys.argv[2:] or board.markets:
+        quote = board.get(market)
+        if quote is None:
+            print(f"{market}: nothing yet")
+        else:
+            age = time.time() - quote.received
+            print(f"{quote!r} mid={quote.mid} age={age:.3f}s")
@@ -0,0 +1,326 @@
+# =============================================================================
+# IMPORTS
+# =============================================================================
+import os, io, json, hashlib, threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from storage_formats import get_format, parse_timestamps
+from change_filter import expand_to_grid, max_gap
+
+# =============================================================================
+# CONFIG
+# =============================================================================
+# Read path over the daily files:
+#   load("ETH-USD", "2023-01-04 10:00", "2023-01-06 10:05", ["mid"])
+#   load("UMA-USD", "2023-01-04", "2023-01-05", ["mid"], freq="1min")
+#
+# `freq` returns one row per slot, what change-only recording (see
+# change_filter.py) left out filled in from the row in force at the time.
+#
+# Parquet files are indexed by their own row group min/max timestamps. CSV
+# files get a sidecar with the byte offset and first timestamp of every
+# CSV_INDEX_STRIDE-th row:
+#   index/{daily key}.json
+# Either way only the byte ranges covering [start, end) are downloaded, and
+# every downloaded range is kept in a local LRU cache keyed by object ETag.
+CSV_INDEX_STRIDE = 1000
+CACHE_DIR = os.getenv("READER_CACHE_DIR", "cache")
+CACHE_BYTES = int(os.getenv("READER_CACHE_BYTES", 512 * 1024 * 1024))
+
+
+def index_key(key):
+    return f"index/{key}.json"
+
+
+# =============================================================================
+# LOCAL LRU CACHE OF DOWNLOADED BYTE RANGES, ONE FILE PER RANGE
+# =============================================================================
+class ChunkCache:
+    def __init__(self, directory=CACHE_DIR, max_bytes=CACHE_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()  # name -> size, least recently used first
+        self.total = 0
+        os.makedirs(directory, exist_ok=True)
+        names = [n for n in os.listdir(directory) if not n.endswith(".tmp")]
+        for name in sorted(names, key=lambda n: os.path.getmtime(self._path(n))):
+            self.entries[name] = os.path.getsize(self._path(name))
+            self.total += self.entries[name]
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def name(self, bucket, key, etag, start, end):
+        raw = f"{bucket}/{key}|{etag}|{start}-{end}".encode("utf-8")
+        return hashlib.sha1(raw).hexdigest()
+
+    def get(self, name):
+        with self.lock:
+            if name not in self.entries:
+                return None
+            self.entries.move_to_end(name)
+        try:
+            with open(self._path(name), "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            with self.lock:
+                self.total -= self.entries.pop(name, 0)
+            return None
+        os.utime(self._path(name))
+        return data
+
+    def put(self, name, data):
+        if len(data) > self.max_bytes:
+            return
+        tmp = f"{self._path(name)}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, self._path(name))
+        with self.lock:
+            self.total += len(data) - self.entries.pop(name, 0)
+            self.entries[name] = len(data)
+            while self.total > self.max_bytes:
+                old, size = self.entries.popitem(last=False)
+                self.total -= size
+                try:
+                    os.remove(self._path(old))
+                except FileNotFoundError:
+                    pass
+
+
+# =============================================================================
+# ONE S3 OBJECT, READ BY BYTE RANGE THROUGH THE CACHE
+# =============================================================================
+class RangedObject:
+    def __init__(self, s3, bucket, key, etag, size, cache=None):
+        self.s3 = s3
+        self.bucket = bucket
+        self.key = key
+        self.etag = etag
+        self.size = size
+        self.cache = cache
+
+    def read_range(self, start, end):
+        # inclusive end, like the HTTP Range header
+        end = min(end, self.size - 1)
+        if end < start:
+            return b""
+        name = None
+        if self.cache is not None:
+            name = self.cache.name(self.bucket, self.key, self.etag, start, end)
+            data = self.cache.get(name)
+            if data is not None:
+                return data
+        obj = self.s3.get_object(
+            Bucket=self.bucket, Key=self.key, Range=f"bytes={start}-{end}"
+        )
+        data = obj["Body"].read()
+        if name is not None:
+            self.cache.put(name, data)
+        return data
+
+
+class RangedFile(io.RawIOBase):
+    # seekable file over a RangedObject, so pyarrow can pull just the footer
+    # and the column chunks it needs
+    def __init__(self, obj):
+        self.obj = obj
+        self.position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            self.position = offset
+        elif whence == io.SEEK_CUR:
+            self.position += offset
+        else:
+            self.position = self.obj.size + offset
+        return self.position
+
+    def read(self, n=-1):
+        if n is None or n < 0:
+            n = self.obj.size - self.position
+        data = self.obj.read_range(self.position, self.position + n - 1)
+        self.position += len(data)
+        return data
+
+    def readinto(self, buffer):
+        data = self.read(len(buffer))
+        buffer[: len(data)] = data
+        return len(data)
+
+
+# =============================================================================
+# CSV INDEX: BYTE OFFSET + FIRST TIMESTAMP OF EVERY `stride`-TH ROW
+# =============================================================================
+def build_csv_index(data, etag, stride=CSV_INDEX_STRIDE):
+    newlines = np.flatnonzero(np.frombuffer(data, dtype=np.uint8) == ord("\n"))
+    header_end = int(newlines[0]) + 1 if len(newlines) else len(data)
+    starts = newlines + 1
+    starts = starts[starts < len(data)][::stride]
+    first = [data[s : data.index(b",", s)].decode("utf-8") for s in starts]
+    ts = parse_timestamps(pd.Series(first, dtype=object)).astype("datetime64[ns]")
+    return {
+        "etag": etag,
+        "size": len(data),
+        "header": data[:header_end].decode("utf-8"),
+        "offsets": [int(s) for s in starts],
+        "timestamps": ts.astype("int64").tolist(),
+    }
+
+
+def write_csv_index(s3, bucket, key, data, etag):
+    index = build_csv_index(data, etag)
+    s3.put_object(Bucket=bucket, Key=index_key(key), Body=json.dumps(index))
+    return index
+
+
+def csv_byte_range(index, start, end):
+    # rows are sorted, chunk i holds the rows from offsets[i] up to offsets[i+1]
+    timestamps = np.asarray(index["timestamps"], dtype=np.int64)
+    offsets = index["offsets"]
+    if not len(offsets):
+        return None
+    first = max(np.searchsorted(timestamps, start.value, "right") - 1, 0)
+    last = np.searchsorted(timestamps, end.value, "left")
+    if last <= first:
+        return None
+    stop = offsets[last] - 1 if last < len(offsets) else index["size"] - 1
+    return offsets[first], stop
+
+
+# =============================================================================
+# READER
+# =============================================================================
+class Reader:
+    def __init__(self, s3, bucket, fmt, cache=None):
+        self.s3 = s3
+        self.bucket = bucket
+        self.fmt = fmt
+        self.cache = cache
+        self.indexes = {}  # (key, etag) -> csv index
+
+    def load(self, market, start, end, columns=None, freq=None, gap=None):
+        if freq is None:
+            return self.load_rows(market, start, end, columns)
+        # the row in force at `start` can be up to `gap` older than it
+        gap = max_gap() if gap is None else gap
+        start, end = pd.Timestamp(start), pd.Timestamp(end)
+        rows = self.load_rows(market, start - pd.Timedelta(seconds=gap), end, columns)
+        return expand_to_grid(rows, start, end, freq, gap)
+
+    def load_rows(self, market, start, end, columns=None):
+        start, end = pd.Timestamp(start), pd.Timestamp(end)
+        if columns is not None:
+            columns = ["timestamp"] + [c for c in columns if c != "timestamp"]
+        frames = []
+        for day in days_between(start, end):
+            obj = self.open(self.fmt.daily_key(market, day))
+            if obj is None:
+                continue
+            if self.fmt.name == "parquet":
+                frames.append(read_parquet_range(obj, start, end, columns))
+            elif self.fmt.name == "csv":
+                frames.append(self.read_csv_range(obj, start, end, columns))
+            else:
+                # a compact day is small, read whole, decoding skips columns
+                data = obj.read_range(0, obj.size - 1)
+                frames.append(self.fmt.deserialize(data, columns))
+        frames = [df for df in frames if len(df)]
+        if not frames:
+            return pd.DataFrame(columns=columns or ["timestamp"])
+        df = pd.concat(frames, ignore_index=True)
+        df["timestamp"] = parse_timestamps(df["timestamp"]).astype("datetime64[ns]")
+        df = df[(df["timestamp"] >= start) & (df["timestamp"] < end)]
+        return df.sort_values("timestamp").reset_index(drop=True)
+
+    def open(self, key):
+        try:
+            head = self.s3.head_object(Bucket=self.bucket, Key=key)
+        except self.s3.exceptions.ClientError:
+            return None
+        return RangedObject(
+            self.s3, self.bucket, key, head["ETag"], head["ContentLength"], self.cache
+        )
+
+    # =========================================================================
+    # CSV
+    # =========================================================================
+    def csv_index(self, obj):
+        index = self.indexes.get((obj.key, obj.etag))
+        if index is not None:
+            return index
+        try:
+            res = self.s3.get_object(Bucket=self.bucket, Key=index_key(obj.key))
+            index = json.loads(res["Body"].read())
+        except self.s3.exceptions.NoSuchKey:
+            index = None
+        if index is None or index["etag"] != obj.etag:
+            # written before indexing existed or rewritten since (gap repair),
+            # one full read to (re)build it
+            data = obj.read_range(0, obj.size - 1)
+            index = write_csv_index(self.s3, self.bucket, obj.key, data, obj.etag)
+        self.indexes[(obj.key, obj.etag)] = index
+        return index
+
+    def read_csv_range(self, obj, start, end, columns):
+        index = self.csv_index(obj)
+        byte_range = csv_byte_range(index, start, end)
+        if byte_range is None:
+            return pd.DataFrame(columns=columns)
+        body = index["header"].encode("utf-8") + obj.read_range(*byte_range)
+        return pd.read_csv(io.BytesIO(body), usecols=columns)
+
+
+# =============================================================================
+# PARQUET: ROW GROUPS WHOSE TIMESTAMP MIN/MAX OVERLAP [start, end)
+# =============================================================================
+def read_parquet_range(obj, start, end, columns):
+    import pyarrow.parquet as pq
+
+    pf = pq.ParquetFile(RangedFile(obj))
+    meta = pf.metadata
+    ts_col = meta.schema.names.index("timestamp")
+    groups = []
+    for i in range(meta.num_row_groups):
+        stats = meta.row_group(i).column(ts_col).statistics
+        if stats is None or not stats.has_min_max:
+            groups.append(i)
+        elif pd.Timestamp(stats.max) >= start and pd.Timestamp(stats.min) < end:
+            groups.append(i)
+    if not groups:
+        return pd.DataFrame(columns=columns)
+    return pf.read_row_groups(groups, columns=columns).to_pandas()
+
+
+# =============================================================================
+# HELPERS
+# =============================================================================
+def days_between(start, end):
+    # every UTC day touched by [start, end)
+    last = (end - pd.Timedelta(1, "ns")).normalize()
+    return [str(d.date()) for d in pd.date_range(start.normalize(), last, freq="D")]
+
+
+_READER = None
+
+
+def load(market, start, end, columns=None, freq=None, gap=None):
+    global _READER
+    if _READER is None:
+        from aws import create_s3_client
+        from constants import BUCKET_NAME
+
+        fmt = get_format(os.getenv("OUTPUT_FORMAT", "csv"))
+        _READER = Reader(create_s3_client(), BUCKET_NAME, fmt, ChunkCache())
+    return _READER.load(market, start, end, columns, freq, gap)
@@ -0,0 +1,463 @@
+# =============================================================================
+# IMPORTS
+# =============================================================================
+import os, sys, json, time, random, asyncio, tempfile, threading
+import concurrent.futures
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# =============================================================================
+# RECORD dYdX TRAFFIC, THEN REPLAY IT AGAINST main / daemon OFFLINE
+#
+#   python replay.py record DIR [--ticks=60] [--interval=1]
+#   python replay.py record-ws DIR [--seconds=60]
+#   python replay.py synth DIR [--ticks=60] [--levels=20]
+#   python replay.py run DIR [--ticks=100] [--mode=main|daemon]
+#       [--interval=1] [--latency=0] [--storage=segments|wal|wide]
+#       [--json=report.json]
+#
+# A recording is the raw response bodies:
+#   DIR/markets.json
+#   DIR/orderbook/{market}/{tick:06d}.json
+# `synth` writes random-walk books in the same layout when there's no
+# network. `run` serves the recording from a local stub server, points
+# DYDX_URL and the Discord webhook at it, swaps S3 for MemoryS3 and drives
+# the real code, then reports ticks/sec, per-stage latency and bytes moved.
+# The dYdX token bucket still applies; DYDX_RATE_LIMIT=10000 measures the
+# code alone.
+# =============================================================================
+LIVE_URL = "https://api.dydx.exchange/v3"
+
+
+def option(name, default=None):
+    for arg in sys.argv[1:]:
+        if arg.startswith(f"--{name}="):
+            return arg.split("=", 1)[1]
+    return default
+
+
+def save(path, body):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(body)
+
+
+# =============================================================================
+# RECORD
+# =============================================================================
+def record(out_dir, markets, ticks, interval, base_url=LIVE_URL):
+    import http_client
+
+    res = http_client.get(f"{base_url}/markets")
+    res.raise_for_status()
+    save(os.path.join(out_dir, "markets.json"), res.content)
+
+    def fetch(market, tick):
+        res = http_client.get(f"{base_url}/orderbook/{market}")
+        if res.ok:
+            save(book_path(out_dir, market, tick), res.content)
+        else:
+            print(f"{market} tick {tick}: {res.status_code}, not recorded")
+
+    with concurrent.futures.ThreadPoolExecutor(8) as executor:
+        for tick in range(ticks):
+            started = time.monotonic()
+            list(executor.map(fetch, markets, [tick] * len(markets)))
+            print(f"Recorded tick {tick + 1}/{ticks}")
+            time.sleep(max(0.0, interval - (time.monotonic() - started)))
+
+
+def book_path(out_dir, market, tick):
+    return os.path.join(out_dir, "orderbook", market, f"{tick:06d}.json")
+
+
+# =============================================================================
+# SYNTHESIZE, SAME SHAPES AS THE REAL API
+# =============================================================================
+def synthesize(out_dir, markets, ticks, levels=20, seed=0):
+    rng = random.Random(seed)
+    params = {}
+    for market in markets:
+        params[market] = {
+            "tickSize": "0.01",
+            "stepSize": "0.001",
+            "minOrderSize": "0.01",
+        }
+    body = json.dumps({"markets": params}).encode("utf-8")
+    save(os.path.join(out_dir, "markets.json"), body)
+
+    for market in markets:
+        mid = rng.uniform(1, 2000)
+        for tick in range(ticks):
+            mid = max(1.0, mid + rng.gauss(0, 0.2))
+            best_bid = round(mid - 0.01 * rng.randint(1, 4), 2)
+            best_ask = round(best_bid + 0.01 * rng.randint(1, 4), 2)
+            book = {
+                "bids": [
+                    {"price": f"{best_bid - 0.01 * i:.2f}", "size": size(rng)}
+                    for i in range(levels)
+                ],
+                "asks": [
+                    {"price": f"{best_ask + 0.01 * i:.2f}", "size": size(rng)}
+                    for i in range(levels)
+                ],
+            }
+            save(book_path(out_dir, market, tick), json.dumps(book).encode("utf-8"))
+
+
+def size(rng):
+    return f"{rng.uniform(0.01, 500):.3f}"
+
+
+# =============================================================================
+# STUB SERVER, EACH MARKET CYCLES THROUGH ITS RECORDED BOOKS
+# =============================================================================
+class Recording:
+    def __init__(self, directory):
+        with open(os.path.join(directory, "markets.json"), "rb") as f:
+            self.markets = f.read()
+        self.books = {}
+        book_dir = os.path.join(directory, "orderbook")
+        for market in sorted(os.listdir(book_dir)):
+            bodies = []
+            for name in sorted(os.listdir(os.path.join(book_dir, market))):
+                with open(os.path.join(book_dir, market, name), "rb") as f:
+                    bodies.append(f.read())
+            self.books[market] = bodies
+        self.position = {market: 0 for market in self.books}
+        self.lock = threading.Lock()
+
+    def next_book(self, market):
+        bodies = self.books.get(market)
+        if not bodies:
+            return None
+        with self.lock:
+            i = self.position[market]
+            self.position[market] = (i + 1) % len(bodies)
+        return bodies[i]
+
+
+class StubServer:
+    # `faults` injects failures per market, used up one request at a time:
+    #   {"BTC-USD": [{"status": 429, "retry_after": 2}, {"latency": 1.5}]}
+    # a fault without "status" is a normal answer after its "latency"
+    def __init__(self, recording, latency=0.0, host="127.0.0.1", faults=None):
+        self.recording = recording
+        self.latency = latency
+        self.faults = {market: list(f) for market, f in (faults or {}).items()}
+        self.requests = 0
+        self.bytes_out = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.request_times = []
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, 0), self.handler())
+        self.server.daemon_threads = True
+        self.url = f"http://{host}:{self.server.server_address[1]}"
+
+    def next_fault(self, market):
+        with self.lock:
+            faults = self.faults.get(market)
+            return faults.pop(0) if faults else {}
+
+    def handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive, like the real API
+
+            def do_GET(self):
+                with stub.lock:
+                    stub.in_flight += 1
+                    stub.max_in_flight = max(stub.max_in_flight, stub.in_flight)
+                    stub.request_times.append(time.monotonic())
+                try:
+                    self.answer()
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # the client hit its deadline and hung up
+                finally:
+                    with stub.lock:
+                        stub.in_flight -= 1
+
+            def answer(self):
+                path = self.path.split("?")[0]
+                market = None
+                if path.startswith("/v3/orderbook/"):
+                    market = path[len("/v3/orderbook/") :]
+                fault = stub.next_fault(market) if market else {}
+                latency = fault.get("latency", stub.latency)
+                if latency:
+                    time.sleep(latency)
+                if "status" in fault:
+                    headers = {}
+                    if fault.get("retry_after") is not None:
+                        headers["Retry-After"] = str(fault["retry_after"])
+                    self.reply(fault["status"], b"{}", headers)
+                    return
+                body = None
+                if path == "/v3/markets":
+                    body = stub.recording.markets
+                elif market is not None:
+                    body = stub.recording.next_book(market)
+                self.reply(200 if body is not None else 404, body or b"{}")
+
+            def do_POST(self):
+                # discord webhook
+                self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                self.reply(204, b"")
+
+            def reply(self, status, body, headers=None):
+                with stub.lock:
+                    stub.requests += 1
+                    stub.bytes_out += len(body)
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+
+
+# =============================================================================
+# FAKE dYdX WEBSOCKET, PLAYS SCRIPTED v3_orderbook MESSAGES
+#
+# `scripts` is one {market: [message, ...]} per connection (the last one is
+# reused for any further connection); a market's first message is normally
+# its "subscribed" snapshot, the rest "channel_data" deltas. A subscribe for
+# a market gets that market's messages in order. With `drop_after=N` the
+# first connection is closed after N messages, so a client has to reconnect
+# and resync. Runs its own event loop in a thread, like StubServer.
+#
+# Recorded sessions live next to the REST recording:
+#   DIR/ws/{market}.jsonl     raw messages as received, one per line
+# =============================================================================
+class FakeWsServer:
+    def __init__(self, scripts, drop_after=None, host="127.0.0.1"):
+        self.scripts = scripts
+        self.drop_after = drop_after
+        self.host = host
+        self.connections = 0
+        self.sent = 0
+        self.url = None
+        self.loop = None
+        self.server = None
+        self.ready = threading.Event()
+
+    @classmethod
+    def from_recording(cls, directory, **kwargs):
+        return cls([read_ws_recording(directory)], **kwargs)
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        self.ready.wait(5)
+        return self
+
+    def serve_forever(self):
+        import websockets
+
+        async def serve():
+            self.server = await websockets.serve(self.handle, self.host, 0)
+            port = list(self.server.sockets)[0].getsockname()[1]
+            self.url = f"ws://{self.host}:{port}"
+            self.ready.set()
+            await self.server.wait_closed()
+
+        self.loop = asyncio.new_event_loop()
+        self.loop.run_until_complete(serve())
+
+    async def handle(self, ws, path=None):
+        number = self.connections
+        self.connections += 1
+        script = self.scripts[min(number, len(self.scripts) - 1)]
+        sent = 0
+        async for raw in ws:
+            request = json.loads(raw)
+            if request.get("type") != "subscribe":
+                continue
+            for message in script.get(request["id"], []):
+                if number == 0 and self.drop_after is not None:
+                    if sent >= self.drop_after:
+                        await ws.close()
+                        return
+                await ws.send(json.dumps(message))
+                sent += 1
+                self.sent += 1
+
+    def stop(self):
+        if self.server is not None:
+            self.loop.call_soon_threadsafe(self.server.close)
+
+
+async def record_ws(out_dir, markets, seconds, url="wss://api.dydx.exchange/v3/ws"):
+    import websockets
+    from ws_stream import OrderbookStream
+
+    os.makedirs(os.path.join(out_dir, "ws"), exist_ok=True)
+    files = {m: open(ws_path(out_dir, m), "w") for m in markets}
+    try:
+        async with websockets.connect(url, max_size=None) as ws:
+            for msg in OrderbookStream(markets, None).subscribe_messages():
+                await ws.send(msg)
+            end = time.time() + seconds
+            while time.time() < end:
+                try:
+                    raw = await asyncio.wait_for(ws.recv(), end - time.time())
+                except asyncio.TimeoutError:
+                    break
+                market = json.loads(raw).get("id")
+                if market in files:
+                    files[market].write(raw.strip() + "\n")
+    finally:
+        for f in files.values():
+            f.close()
+
+
+def ws_path(out_dir, market):
+    return os.path.join(out_dir, "ws", f"{market}.jsonl")
+
+
+def read_ws_recording(directory):
+    script = {}
+    ws_dir = os.path.join(directory, "ws")
+    for name in sorted(os.listdir(ws_dir)):
+        with open(os.path.join(ws_dir, name)) as f:
+            lines = [line for line in f if line.strip()]
+        script[name[: -len(".jsonl")]] = [json.loads(line) for line in lines]
+    return script
+
+
+# =============================================================================
+# RUN
+#
+# Everything main reads at import time comes from the environment, so it's
+# set before main is imported.
+# =============================================================================
+def run_replay(
+    directory, ticks=100, mode="main", interval=1.0, latency=0.0, storage="segments"
+):
+    stub = StubServer(Recording(directory), latency).start()
+    scratch = tempfile.mkdtemp(prefix="replay-")
+    os.environ.update(
+        {
+            "DYDX_URL": f"{stub.url}/v3",
+            "DISCORD_WEBHOOK_URL": f"{stub.url}/webhook",
+            "S3_BACKEND": "memory",
+            "STORAGE_MODE": storage,
+            "WAL_DIR": os.path.join(scratch, "wal"),
+            "LAST_DAY_FILE": os.path.join(scratch, "last_day"),
+            "MARKET_PARAMS_FILE": os.path.join(scratch, "market_params.json"),
+            "QUALITY_STATE_FILE": os.path.join(scratch, "quality_state.json"),
+            "CHANGES_STATE_FILE": os.path.join(scratch, "changes_state.json"),
+        }
+    )
+    import main
+
+    main.METRICS.reset()
+    stub.requests = stub.bytes_out = 0
+    started = time.perf_counter()
+    if mode == "daemon":
+        import daemon
+
+        try:
+            asyncio.run(asyncio.wait_for(daemon.run(interval), ticks * interval))
+        except asyncio.TimeoutError:
+            pass
+    else:
+        for _ in range(ticks):
+            main.main()
+    main.flush_wide_writer()
+    main.flush_depth_writer()
+    elapsed = time.perf_counter() - started
+    main.ALERTS.stop()
+    stub.stop()
+
+    snapshot = main.METRICS.snapshot()
+    s3 = main.S3.s3._get()
+    done = snapshot["stages"].get("tick", {}).get("count", 0)
+    return {
+        "mode": mode,
+        "storage": storage,
+        "markets": len(main.MARKETS),
+        "ticks": done,
+        "seconds": elapsed,
+        "ticks_per_sec": done / elapsed if elapsed else None,
+        "http_requests": stub.requests,
+        "http_bytes": stub.bytes_out,
+        "s3_calls": dict(s3.calls),
+        "s3_bytes_in": s3.bytes_in,
+        "s3_bytes_out": s3.bytes_out,
+        "stages": snapshot["stages"],
+        "counters": {
+            name: sum(s["value"] for s in series)
+            for name, series in snapshot["counters"].items()
+        },
+    }
+
+
+def print_report(report):
+    print(
+        f"{report['ticks']} ticks x {report['markets']} markets "
+        f"({report['mode']}, {report['storage']}) in {report['seconds']:.2f}s: "
+        f"{report['ticks_per_sec']:.2f} ticks/s"
+    )
+    print(
+        f"HTTP: {report['http_requests']} requests, "
+        f"{report['http_bytes'] / 1024:.1f} KiB   "
+        f"S3: {sum(report['s3_calls'].values())} calls, "
+        f"{report['s3_bytes_in'] / 1024:.1f} KiB in, "
+        f"{report['s3_bytes_out'] / 1024:.1f} KiB out"
+    )
+    print(f"{'stage':>15} {'count':>8} {'p50 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for name, s in sorted(report["stages"].items()):
+        print(
+            f"{name:>15} {s['count']:8d} {s['p50'] * 1e3:9.3f} "
+            f"{s['p99'] * 1e3:9.3f} {s['max'] * 1e3:9.3f}"
+        )
+    for name, value in sorted(report["counters"].items()):
+        print(f"{name:>15} {value:8d}")
+
+
+if __name__ == "__main__":
+    command, directory = sys.argv[1], sys.argv[2]
+    ticks = int(option("ticks", 60 if command != "run" else 100))
+    interval = float(option("interval", 1))
+
+    if command == "record":
+        from constants import MARKETS
+
+        record(directory, MARKETS, ticks, interval)
+    elif command == "synth":
+        from constants import MARKETS
+
+        synthesize(directory, MARKETS, ticks, int(option("levels", 20)))
+    elif command == "record-ws":
+        from constants import MARKETS
+
+        asyncio.run(record_ws(directory, MARKETS, float(option("seconds", 60))))
+    elif command == "run":
+        report = run_replay(
+            directory,
+            ticks,
+            option("mode", "main"),
+            interval,
+            float(option("latency", 0)),
+            option("storage", "segments"),
+        )
+        print_report(report)
+        if option("json"):
+            with open(option("json"), "w") as f:
+                json.dump(report, f, indent=1)
+    else:
+        raise Exception(f"Unknown command {command}: record, record-ws, synth or run")
@@ -0,0 +1,139 @@
+# =============================================================================
+# IMPORTS
+# =============================================================================
+import os, sys, math
+import datetime as dt
+from storage_formats import CsvFormat, get_format, parse_timestamps
+
+# =============================================================================
+# CONSTANTS
+# =============================================================================
+# Segments are small immutable objects living next to the daily file:
+#   {market}/{today}/{segment_id}.csv   -> one object per tick (or batch)
+#   {market}/{market}_{today}.csv       -> daily file, built by compaction
+# The daily file's format and key come from storage_formats (csv by default).
+DELETE_BATCH = 1000
+CSV = CsvFormat()
+
+
+# =============================================================================
+# KEYS
+# =============================================================================
+def segment_prefix(market, today):
+    return f"{market}/{today}/"
+
+
+def segment_id(now_s):
+    # "2023-01-04 10:15:30.123456" -> "2023-01-04T101530.123456", sorts by time
+    return now_s.replace(" ", "T").replace(":", "")
+
+
+# =============================================================================
+# WRITE ONE IMMUTABLE SEGMENT, COST DOESN'T GROW DURING THE DAY
+# =============================================================================
+def write_segment_rows(s3, bucket, market, today, rows, columns, seg_id):
+    # plain CSV with a header, nan as an empty field like pandas writes it
+    lines = [",".join(columns)]
+    lines += [",".join(csv_value(row[col]) for col in columns) for row in rows]
+    body = "\n".join(lines) + "\n"
+    return put_segment(s3, bucket, market, today, body, seg_id)
+
+
+def csv_value(value):
+    if isinstance(value, float) and math.isnan(value):
+        return ""
+    return str(value)
+
+
+def put_segment(s3, bucket, market, today, body, seg_id):
+    key = f"{segment_prefix(market, today)}{seg_id}.csv"
+    s3.put_object(Bucket=bucket, Key=key, Body=body)
+    return key
+
+
+# =============================================================================
+# LIST ALL SEGMENTS OF A MARKET FOR A DAY
+# =============================================================================
+def list_segments(s3, bucket, market, today):
+    keys = []
+    kwargs = {"Bucket": bucket, "Prefix": segment_prefix(market, today)}
+    while True:
+        res = s3.list_objects_v2(**kwargs)
+        keys += [obj["Key"] for obj in res.get("Contents", [])]
+        if not res.get("IsTruncated"):
+            break
+        kwargs["ContinuationToken"] = res["NextContinuationToken"]
+    return sorted(keys)
+
+
+# =============================================================================
+# MERGE SEGMENTS INTO THE DAILY FILE, THEN DROP THE SEGMENTS
+# =============================================================================
+def compact_segments(s3, bucket, market, today, fmt=CSV, delete=True):
+    import pandas as pd
+    from reader import write_csv_index
+
+    keys = list_segments(s3, bucket, market, today)
+    if not keys:
+        return None
+
+    filepath = fmt.daily_key(market, today)
+    frames = [read_object(s3, bucket, key, CSV) for key in keys]
+    existing = read_object_if_exists(s3, bucket, filepath, fmt)
+    if existing is not None:
+        frames.insert(0, existing)
+
+    df = pd.concat(frames, ignore_index=True)
+    df["timestamp"] = parse_timestamps(df["timestamp"])
+    df = df.drop_duplicates(subset="timestamp", keep="last")
+    df = df.sort_values("timestamp")
+
+    body = fmt.serialize(df, market)
+    res = s3.put_object(Bucket=bucket, Key=filepath, Body=body)
+    if fmt.name == "csv":
+        write_csv_index(s3, bucket, filepath, body, res["ETag"])
+    print(f"{filepath} compacted from {len(keys)} segments")
+
+    if delete:
+        delete_keys(s3, bucket, keys)
+    return filepath
+
+
+# =============================================================================
+# HELPERS
+# =============================================================================
+def read_object(s3, bucket, key, fmt):
+    obj = s3.get_object(Bucket=bucket, Key=key)
+    return fmt.deserialize(obj["Body"].read())
+
+
+def read_object_if_exists(s3, bucket, key, fmt):
+    try:
+        return read_object(s3, bucket, key, fmt)
+    except s3.exceptions.NoSuchKey:
+        return None
+
+
+def delete_keys(s3, bucket, keys):
+    for i in range(0, len(keys), DELETE_BATCH):
+        batch = [{"Key": key} for key in keys[i : i + DELETE_BATCH]]
+        s3.delete_objects(Bucket=bucket, Delete={"Objects": batch, "Quiet": True})
+
+
+# =============================================================================
+# COMPACT A FINISHED DAY FOR EVERY MARKET
+# =============================================================================
+def compact_day(s3, bucket, markets, today, fmt=CSV):
+    for market in markets:
+        compact_segments(s3, bucket, market, today, fmt)
+
+
+if __name__ == "__main__":
+    from main import S3, BUCKET_NAME, MARKETS
+
+    if len(sys.argv) > 1:
+        day = sys.argv[1]
+    else:
+        day = str(dt.datetime.now(dt.timezone.utc).date() - dt.timedelta(days=1))
+    fmt = get_format(os.getenv("OUTPUT_FORMAT", "csv"))
+    compact_day(S3, BUCKET_NAME, MARKETS, day, fmt)
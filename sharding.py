@@ -0,0 +1,404 @@
+# =============================================================================
+# IMPORTS
+# =============================================================================
+import os, sys, json, math, time, socket, bisect, hashlib, sqlite3, threading
+import datetime as dt
+import main
+from constants import MARKETS
+from fetch_scheduler import FetchScheduler
+from metrics import METRICS
+
+# =============================================================================
+# SHARDED PULLER: N WORKERS, EACH FETCHING ITS OWN SLICE OF THE MARKETS
+#
+#   python sharding.py --worker=NAME [--interval=1]   one worker, any node
+#   python sharding.py --workers=3 [--interval=1]     N workers on this host
+#   python sharding.py --status
+#
+# Workers hold leases in a shared table (SHARD_DB, SQLite standing in for a
+# coordination service; every node must see the same file). Every tick a
+# worker renews its lease, builds a consistent-hash ring over the workers
+# whose lease is live and fetches the markets (and venues, see venues.py) the
+# ring gives it. A worker that stops renewing drops out of every ring after
+# SHARD_LEASE_TTL, and its markets move to the others; adding or removing one
+# worker only moves ~1/N of the markets.
+#
+# Ticks sit on the same wall-clock grid as daemon.py, so every worker stamps
+# a tick with the same time (nodes need NTP synced clocks). Workers post their
+# rows per tick to the table; the live worker with the lowest name merges a
+# tick once every market is in, or SHARD_MERGE_GRACE after it was due, fills
+# what's missing with nan rows and stores it through main, as one tick with
+# every market. Workers post ungraded rows: `quality` and the change-only
+# filter depend on every earlier tick of a market, so they run in the merger,
+# on rolling state kept in the table that whichever worker merges next picks
+# up.
+# =============================================================================
+SHARD_DB = os.getenv("SHARD_DB", ".shards.sqlite")
+SHARD_INTERVAL = float(os.getenv("SHARD_INTERVAL", 1.0))
+SHARD_LEASE_TTL = float(os.getenv("SHARD_LEASE_TTL", 10))
+SHARD_MERGE_GRACE = float(os.getenv("SHARD_MERGE_GRACE", 2.0))
+SHARD_VNODES = 64
+KEEP_MERGED_SECONDS = 3600
+
+
+def option(name, default=None):
+    for arg in sys.argv[1:]:
+        if arg.startswith(f"--{name}="):
+            return arg.split("=", 1)[1]
+    return default
+
+
+def next_tick(now, interval):
+    # same grid as daemon.next_tick
+    return (math.floor(now / interval) + 1) * interval
+
+
+def shard_units():
+    # what gets assigned: every dYdX market, and every other venue as a whole
+    # (one batched request covers all its markets)
+    return MARKETS + [f"venue:{adapter.name}" for adapter in main.VENUE_ADAPTERS]
+
+
+# =============================================================================
+# CONSISTENT-HASH RING
+# =============================================================================
+def ring_hash(key):
+    return int.from_bytes(hashlib.md5(key.encode("utf-8")).digest()[:8], "big")
+
+
+class HashRing:
+    def __init__(self, workers, vnodes=SHARD_VNODES):
+        points = sorted(
+            (ring_hash(f"{worker}#{i}"), worker)
+            for worker in workers
+            for i in range(vnodes)
+        )
+        self.hashes = [h for h, _ in points]
+        self.workers = [w for _, w in points]
+
+    def owner(self, key):
+        if not self.hashes:
+            return None
+        i = bisect.bisect(self.hashes, ring_hash(key)) % len(self.hashes)
+        return self.workers[i]
+
+    def owned(self, worker, keys):
+        return [key for key in keys if self.owner(key) == worker]
+
+
+# =============================================================================
+# LEASES AND PER-TICK ROWS, IN ONE SQLITE FILE
+# =============================================================================
+class ShardTable:
+    def __init__(self, path=SHARD_DB, ttl=SHARD_LEASE_TTL):
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(
+            path, timeout=30, isolation_level=None, check_same_thread=False
+        )
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS leases (
+                worker TEXT PRIMARY KEY, host TEXT, expires REAL);
+            CREATE TABLE IF NOT EXISTS ticks (
+                tick REAL, market TEXT, row TEXT, PRIMARY KEY (tick, market));
+            CREATE TABLE IF NOT EXISTS merged (tick REAL PRIMARY KEY);
+            CREATE TABLE IF NOT EXISTS state (name TEXT PRIMARY KEY, value TEXT);
+            """
+        )
+
+    def renew(self, worker, now):
+        with self.lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO leases VALUES (?, ?, ?)",
+                (worker, socket.gethostname(), now + self.ttl),
+            )
+
+    def release(self, worker):
+        with self.lock:
+            self.db.execute("DELETE FROM leases WHERE worker = ?", (worker,))
+
+    def live(self, now):
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT worker FROM leases WHERE expires > ? ORDER BY worker", (now,)
+            ).fetchall()
+        return [worker for (worker,) in rows]
+
+    def leases(self):
+        with self.lock:
+            return self.db.execute(
+                "SELECT worker, host, expires FROM leases ORDER BY worker"
+            ).fetchall()
+
+    def post(self, tick, rows):
+        # a market fetched twice around a hand-over keeps one row per tick
+        with self.lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            merged = self.db.execute(
+                "SELECT 1 FROM merged WHERE tick = ?", (tick,)
+            ).fetchone()
+            if merged is None:
+                self.db.executemany(
+                    "INSERT OR REPLACE INTO ticks VALUES (?, ?, ?)",
+                    [(tick, row["market"], json.dumps(row)) for row in rows],
+                )
+            self.db.execute("COMMIT")
+        return merged is None
+
+    def pending(self):
+        # tick -> rows posted so far
+        with self.lock:
+            counts = self.db.execute(
+                "SELECT tick, COUNT(*) FROM ticks GROUP BY tick ORDER BY tick"
+            ).fetchall()
+        return dict(counts)
+
+    def take(self, tick):
+        # every row of a tick, once: marked merged in the same transaction
+        with self.lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            rows = self.db.execute(
+                "SELECT row FROM ticks WHERE tick = ?", (tick,)
+            ).fetchall()
+            self.db.execute("DELETE FROM ticks WHERE tick = ?", (tick,))
+            self.db.execute("INSERT OR IGNORE INTO merged VALUES (?)", (tick,))
+            self.db.execute(
+                "DELETE FROM merged WHERE tick < ?", (tick - KEEP_MERGED_SECONDS,)
+            )
+            self.db.execute("COMMIT")
+        return [json.loads(row) for (row,) in rows]
+
+    def load_state(self, name):
+        with self.lock:
+            row = self.db.execute(
+                "SELECT value FROM state WHERE name = ?", (name,)
+            ).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def save_state(self, name, value):
+        with self.lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO state VALUES (?, ?)", (name, json.dumps(value))
+            )
+
+    def close(self):
+        self.db.close()
+
+
+# =============================================================================
+# ONE WORKER
+# =============================================================================
+class ShardWorker:
+    def __init__(self, name, table, interval=SHARD_INTERVAL):
+        self.name = name
+        self.table = table
+        self.interval = interval
+        self.owned = None
+        self.scheduler = FetchScheduler(
+            main.fetch_top_of_book,
+            main.create_nan_bid_ask_dict,
+            main.DYDX_BUCKET,
+            max_workers=main.FETCH_CONCURRENCY,
+            deadline=min(main.TICK_DEADLINE, interval),
+            on_error=main.report_fetch_error,
+            metrics=METRICS,
+        )
+
+    def assignment(self, now):
+        self.table.renew(self.name, now)
+        live = self.table.live(now)
+        owned = HashRing(live).owned(self.name, shard_units())
+        if owned != self.owned:
+            print(f"{self.name}: {len(owned)} of {len(shard_units())} units, {live}")
+            if self.owned is not None:
+                METRICS.inc("shard_rebalances", worker=self.name)
+            self.owned = owned
+        return live
+
+    def fetch(self, units):
+        markets = [unit for unit in units if not unit.startswith("venue:")]
+        venues = [unit[len("venue:") :] for unit in units if unit not in markets]
+        adapters = [a for a in main.VENUE_ADAPTERS if a.name in venues]
+        others = None
+        if adapters:
+            others = main.VENUE_POOL.submit(
+                main.fetch_venues, adapters, self.scheduler.deadline, False
+            )
+        with METRICS.timer("fetch_batch"):
+            rows = self.scheduler.run(markets)
+        if others is not None:
+            rows += others.result()
+        return rows
+
+    def tick(self, tick):
+        with METRICS.timer("tick"):
+            live = self.assignment(time.time())
+            rows = self.fetch(self.owned)
+            if not self.table.post(tick, rows):
+                print(f"{self.name}: tick {tick} was already merged, rows dropped")
+                METRICS.inc("shard_late_rows", worker=self.name)
+            if live and live[0] == self.name:
+                self.merge_due(time.time())
+
+    # =========================================================================
+    # MERGE: ONE TICK, EVERY MARKET, STORED ONCE
+    # =========================================================================
+    def merge_due(self, now):
+        # oldest first, and never past a tick still waiting for rows: quality,
+        # the change filter and the day roll-over all expect time to go forward
+        expected = len(main.STORAGE_MARKETS)
+        due = []
+        for tick, count in self.table.pending().items():
+            if count < expected and now < tick + self.interval + SHARD_MERGE_GRACE:
+                break
+            due.append(tick)
+        if not due:
+            return
+        # the last merger may have been another worker, go on from its state
+        self.load_merger_state()
+        try:
+            for tick in due:
+                self.merge(tick)
+        finally:
+            self.save_merger_state()
+
+    def load_merger_state(self):
+        for name, state in merger_state().items():
+            saved = self.table.load_state(name)
+            if saved is not None:
+                state.restore(saved)
+
+    def save_merger_state(self):
+        for name, state in merger_state().items():
+            self.table.save_state(name, state.state())
+
+    def merge(self, tick):
+        with METRICS.timer("merge"):
+            posted = {row["market"]: row for row in self.table.take(tick)}
+            missing = [m for m in main.STORAGE_MARKETS if m not in posted]
+            if missing:
+                print(f"Tick {tick}: nothing from the shards for {missing}")
+                METRICS.inc("shard_rows_missing", len(missing))
+            rows = [
+                posted.get(market) or main.create_nan_bid_ask_dict(market)
+                for market in main.STORAGE_MARKETS
+            ]
+            for bid_ask in rows:
+                if bid_ask.get("levels") is not None:
+                    bid_ask["levels"] = tuple(bid_ask["levels"])
+                grade(bid_ask)
+
+            now = dt.datetime.fromtimestamp(tick, dt.timezone.utc)
+            now_s, today = main.create_relevant_date_strings(now)
+            rows = [main.add_mid_to_bid_ask(bid_ask) for bid_ask in rows]
+            if main.QUOTE_BOARD:
+                main.publish_quotes(rows, tick)
+            if main.DEPTH_LEVELS:
+                main.store_depth(rows, now_s, today)
+            main.store_bid_asks(rows, now_s, today)
+        METRICS.inc("ticks_merged")
+
+        finished_day = main.detect_day_rollover(today)
+        if finished_day is not None:
+            threading.Thread(target=main.roll_over_day, args=(finished_day,)).start()
+
+    # =========================================================================
+    # LOOP, LEASE GIVEN BACK ON THE WAY OUT SO OTHERS TAKE OVER AT ONCE
+    # =========================================================================
+    def run(self, ticks=None):
+        main.load_market_params()
+        tick = next_tick(time.time(), self.interval)
+        done = 0
+        try:
+            while ticks is None or done < ticks:
+                time.sleep(max(0.0, tick - time.time()))
+                try:
+                    self.tick(tick)
+                except Exception as e:
+                    print(f"{self.name}: tick {tick} failed: {e}")
+                    main.ALERTS.submit(e)
+                done += 1
+                tick = next_tick(max(time.time(), tick), self.interval)
+        finally:
+            self.table.release(self.name)
+            main.flush_wide_writer()
+            main.flush_depth_writer()
+
+
+def merger_state():
+    state = {"quality": main.QUALITY}
+    if main.RECORD_CHANGES_ONLY:
+        state["changes"] = main.CHANGES
+    return state
+
+
+def grade(bid_ask):
+    # nan rows come with their `quality` already, like in main.main()
+    if "quality" in bid_ask:
+        return
+    if bid_ask["market"] in main.MARKETS:
+        main.check_if_bid_ask_proper(bid_ask)
+    else:
+        main.grade_bid_ask(bid_ask["market"], bid_ask)
+
+
+def use_worker_files(name):
+    # workers sharing a host mustn't share their last-day marker
+    main.LAST_DAY_FILE = f"{main.LAST_DAY_FILE}.{name}"
+
+
+def run_worker(name, interval=SHARD_INTERVAL, ticks=None):
+    use_worker_files(name)
+    table = ShardTable(SHARD_DB)
+    try:
+        ShardWorker(name, table, interval).run(ticks)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        table.close()
+        main.ALERTS.stop()
+
+
+def print_status():
+    table = ShardTable(SHARD_DB)
+    now = time.time()
+    live = table.live(now)
+    ring = HashRing(live)
+    for worker, host, expires in table.leases():
+        state = "live" if worker in live else "expired"
+        owned = ring.owned(worker, shard_units())
+        left = expires - now
+        print(f"{worker} on {host}: {state} ({left:+.1f}s), {len(owned)} units")
+    print(f"{len(table.pending())} ticks waiting to be merged")
+
+
+if __name__ == "__main__":
+    interval = float(option("interval", SHARD_INTERVAL))
+    ticks = option("ticks")
+    ticks = int(ticks) if ticks else None
+    if "--status" in sys.argv[1:]:
+        print_status()
+    elif option("worker"):
+        run_worker(option("worker"), interval, ticks)
+    else:
+        import multiprocessing
+
+        # spawned, not forked: main's alert thread doesn't survive a fork
+        context = multiprocessing.get_context("spawn")
+        n = int(option("workers", 2))
+        workers = [
+            context.Process(
+                target=run_worker, args=(f"w{i}", interval, ticks), name=f"w{i}"
+            )
+            for i in range(n)
+        ]
+        for worker in workers:
+            worker.start()
+        try:
+            for worker in workers:
+                worker.join()
+        except KeyboardInterrupt:
+            for worker in workers:
+                worker.join()
@@ -0,0 +1,179 @@
+# =============================================================================
+# IMPORTS
+# =============================================================================
+# pandas is imported where it's used: the live snapshot path only needs the
+# key layout from here
+import io
+
+# =============================================================================
+# CONSTANTS
+# =============================================================================
+FLOAT_COLUMNS = ["bid_price", "ask_price", "mid", "bid_size", "ask_size"]
+PRICE_COLUMNS = ["bid_price", "ask_price"]
+SIZE_COLUMNS = ["bid_size", "ask_size"]
+# {market: {"price_rounder": tick size, "order_size": step size}}, the same
+# dict as main.MARKET_PARAMS once main has called set_tick_params
+TICK_PARAMS = {}
+
+
+def set_tick_params(params):
+    global TICK_PARAMS
+    TICK_PARAMS = params
+
+
+# =============================================================================
+# CSV, THE ORIGINAL LAYOUT: {market}/{market}_{today}.csv
+# =============================================================================
+class CsvFormat:
+    name = "csv"
+    extension = "csv"
+
+    def daily_key(self, market, today):
+        return f"{market}/{market}_{today}.{self.extension}"
+
+    def serialize(self, df, market=None):
+        csv_buffer = io.StringIO()
+        df.set_index("timestamp").to_csv(csv_buffer)
+        return csv_buffer.getvalue().encode("utf-8")
+
+    def deserialize(self, data, columns=None):
+        import pandas as pd
+
+        return pd.read_csv(io.BytesIO(data), usecols=columns)
+
+
+# =============================================================================
+# PARQUET, TYPED AND COLUMNAR, PARTITIONED HIVE-STYLE BY MARKET AND DATE:
+#   parquet/market={market}/date={today}/{market}_{today}.parquet
+#
+# Prices and sizes are float64, timestamps are int64 nanoseconds (UTC).
+# Row groups of an hour at 1s, their timestamp min/max is what lets the
+# reader fetch only part of a day.
+# =============================================================================
+class ParquetFormat:
+    name = "parquet"
+    extension = "parquet"
+    compression = "zstd"
+    row_group_size = 3600
+
+    def daily_key(self, market, today):
+        return f"parquet/market={market}/date={today}/{market}_{today}.{self.extension}"
+
+    def serialize(self, df, market=None):
+        buffer = io.BytesIO()
+        to_typed(df).to_parquet(
+            buffer,
+            index=False,
+            compression=self.compression,
+            row_group_size=self.row_group_size,
+        )
+        return buffer.getvalue()
+
+    def deserialize(self, data, columns=None):
+        import pandas as pd
+
+        return pd.read_parquet(io.BytesIO(data), columns=columns)
+
+
+# =============================================================================
+# TICKS, INTEGER TICK / STEP COUNTS (see tick_codec.py):
+#   ticks/{market}/{market}_{today}.dxt
+#
+# Prices are counted in the market's tick size, mid in half ticks, sizes in
+# the step size, all from TICK_PARAMS. A market without params, or a column
+# that isn't on its grid (backfilled mids), falls back to the grid the values
+# actually sit on, so encoding is always lossless.
+# =============================================================================
+class TickFormat:
+    name = "ticks"
+    extension = "dxt"
+
+    def daily_key(self, market, today):
+        return f"ticks/{market}/{market}_{today}.{self.extension}"
+
+    def scales(self, market):
+        params = TICK_PARAMS.get(market)
+        if params is None:
+            return {}, {}
+        tick, step = params["price_rounder"], params["order_size"]
+        scales = {col: tick for col in PRICE_COLUMNS}
+        scales.update({col: step for col in SIZE_COLUMNS})
+        scales["mid"] = tick / 2
+        return scales, {"market": market, "tick_size": tick, "step_size": step}
+
+    def serialize(self, df, market=None):
+        import tick_codec
+
+        timestamps = parse_timestamps(df["timestamp"]).astype("datetime64[ns]")
+        columns = {
+            col: column_values(df[col]) for col in df.columns if col != "timestamp"
+        }
+        scales, meta = self.scales(market)
+        return tick_codec.encode(
+            timestamps.to_numpy().view("int64"), columns, scales, meta
+        )
+
+    def deserialize(self, data, columns=None):
+        import pandas as pd
+        import tick_codec
+
+        timestamps, values, _ = tick_codec.decode(data, columns)
+        df = pd.DataFrame({"timestamp": timestamps.astype("datetime64[ns]")})
+        for name, array in values.items():
+            df[name] = array
+        if columns is not None:
+            df = df[[c for c in columns if c in df.columns]]
+        return df
+
+
+def column_values(series):
+    # text columns that are really numbers (csv read back as object) become
+    # floats, anything else stays as it is
+    import pandas as pd
+
+    if series.dtype.kind in "iufb":
+        return series.to_numpy()
+    numeric = pd.to_numeric(series, errors="coerce")
+    if numeric.notna().sum() == series.notna().sum():
+        return numeric.to_numpy(dtype="float64")
+    return series.to_numpy(dtype=object)
+
+
+# =============================================================================
+# REGISTRY
+# =============================================================================
+FORMATS = {fmt.name: fmt for fmt in (CsvFormat(), ParquetFormat(), TickFormat())}
+
+
+def get_format(name):
+    try:
+        return FORMATS[name]
+    except KeyError:
+        raise Exception(f"Unknown storage format: {name}, one of {list(FORMATS)}")
+
+
+# =============================================================================
+# CAST THE TEXT COLUMNS TO THEIR REAL TYPES
+# =============================================================================
+def to_typed(df):
+    import pandas as pd
+
+    df = df.copy()
+    df["timestamp"] = parse_timestamps(df["timestamp"]).astype("datetime64[ns]")
+    for col in FLOAT_COLUMNS:
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], errors="coerce").astype("float64")
+    return df
+
+
+# =============================================================================
+# TIMESTAMPS COME WITH AND WITHOUT MICROSECONDS (str(datetime) drops ".000000")
+# =============================================================================
+def parse_timestamps(series):
+    import pandas as pd
+
+    try:
+        return pd.to_datetime(series)
+    except ValueError:
+        # newer pandas infers a single format from the first row
+        return pd.to_datetime(series, format="ISO8601")
@@ -0,0 +1,54 @@
+import os, sys
+import pytest
+
+# the modules live at the top of the repo, not in a package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+TEST_MARKETS = ["BTC-USD", "ETH-USD"]
+TEST_PARAMS = {"price_rounder": 1.0, "order_size": 0.001, "min_order": 0.001}
+
+
+# =============================================================================
+# main WITH EVERYTHING THAT REACHES S3, LOCAL FILES OR ROLLING STATE POINTED
+# AT THE TEST: MemoryS3, a WAL and state files under tmp_path, fresh quality /
+# change-filter state, two markets with known params, no alerts sent.
+# Override any global by parametrizing indirectly:
+#   @pytest.mark.parametrize("offline_main", [{"STORAGE_MODE": "wal"}],
+#                            indirect=True)
+# =============================================================================
+@pytest.fixture
+def offline_main(request, tmp_path, monkeypatch):
+    import main
+    from change_filter import ChangeFilter
+    from local_s3 import MemoryS3
+    from quality import QualityValidator
+    from wal import WriteAheadLog
+
+    settings = {
+        "S3": MemoryS3(),
+        "WAL": WriteAheadLog(str(tmp_path / "wal"), main.CSV_HEADER),
+        "STORAGE_MODE": "segments",
+        "RECORD_CHANGES_ONLY": False,
+        "MARKETS": TEST_MARKETS,
+        "STORAGE_MARKETS": TEST_MARKETS,
+        "QUOTE_BOARD": None,
+        "DEPTH_LEVELS": 0,
+        "LAST_DAY_FILE": str(tmp_path / ".last_day"),
+        "MARKET_PARAMS_FILE": str(tmp_path / ".market_params.json"),
+        "QUALITY_STATE_FILE": str(tmp_path / ".quality_state.json"),
+        "CHANGES_STATE_FILE": str(tmp_path / ".changes_state.json"),
+        "QUALITY": QualityValidator(),
+        "CHANGES": ChangeFilter(),
+        "_STATE_LOADED": [],
+        "_WIDE_WRITER": None,
+        "_BOARD_WRITER": None,
+        "_DEPTH_WRITER": None,
+    }
+    settings.update(getattr(request, "param", {}))
+    for name, value in settings.items():
+        monkeypatch.setattr(main, name, value)
+    # filled in place: storage_formats holds on to this very dict
+    for market in TEST_MARKETS:
+        monkeypatch.setitem(main.MARKET_PARAMS, market, dict(TEST_PARAMS))
+    monkeypatch.setattr(main.ALERTS, "submit", lambda *args: None)
+    return main
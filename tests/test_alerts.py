@@ -0,0 +1,138 @@
+import json, time, threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+import main
+from alerts import AlertQueue, MAX_MESSAGE_LENGTH, chunk_lines
+
+
+class DiscordSink:
+    # the webhook: keeps the content of every message posted to it
+    def __init__(self):
+        self.messages = []
+        sink = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers["Content-Length"]))
+                sink.messages.append(json.loads(body)["content"])
+                self.send_response(204)
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}/webhook"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def sink(monkeypatch):
+    sink = DiscordSink()
+    monkeypatch.setattr(main, "DSC_URL", sink.url)
+    yield sink
+    sink.stop()
+
+
+def alerts(**kwargs):
+    # not started: the tests call flush() with their own clock
+    return AlertQueue(main.ping_discord, cooldown=60.0, **kwargs)
+
+
+# =============================================================================
+# ONE LINE PER MARKET + EXCEPTION TYPE, ONE MESSAGE PER FLUSH
+# =============================================================================
+def test_alerts_are_grouped_by_fingerprint(sink):
+    queue = alerts()
+    for _ in range(3):
+        queue.submit(TimeoutError("read timed out"), "BTC-USD")
+    queue.submit(TimeoutError("read timed out"), "ETH-USD")
+    queue.submit(ValueError("bad json"), "BTC-USD")
+    queue.submit("S3 is down")
+    queue.submit("S3 is down")
+    assert queue.flush(now=0.0) == 4
+    assert len(sink.messages) == 1
+    lines = sink.messages[0].splitlines()
+    assert "[BTC-USD] TimeoutError: 3x" in lines
+    assert "[ETH-USD] TimeoutError: 1x" in lines
+    assert "[BTC-USD] ValueError: 1x" in lines
+    assert "S3 is down: 2x" in lines
+
+    assert queue.flush(now=1.0) == 0  # nothing new, nothing sent
+    assert len(sink.messages) == 1
+
+
+# =============================================================================
+# A FINGERPRINT ALREADY SENT IS MUTED FOR THE COOLDOWN, AND COUNTED
+# =============================================================================
+def test_repeats_during_cooldown_are_counted_and_reported_after(sink):
+    queue = alerts()
+    queue.submit(TimeoutError(), "BTC-USD")
+    queue.flush(now=0.0)
+    for _ in range(2):
+        queue.submit(TimeoutError(), "BTC-USD")
+    assert queue.flush(now=10.0) == 0
+    queue.submit(TimeoutError(), "BTC-USD")
+    assert queue.flush(now=30.0) == 0
+    assert len(sink.messages) == 1
+
+    # cooldown over and nothing new: the muted count on its own
+    assert queue.flush(now=61.0) == 1
+    assert "[BTC-USD] TimeoutError: 3x more during cooldown" in sink.messages[-1]
+    assert queue.flush(now=200.0) == 0
+
+
+def test_muted_count_rides_along_with_the_next_alert(sink):
+    queue = alerts()
+    queue.submit(TimeoutError(), "BTC-USD")
+    queue.flush(now=0.0)
+    for _ in range(2):
+        queue.submit(TimeoutError(), "BTC-USD")
+    queue.flush(now=10.0)
+    queue.submit(TimeoutError(), "BTC-USD")
+    assert queue.flush(now=70.0) == 1
+    first = sink.messages[-1].splitlines()[1]
+    assert first == "[BTC-USD] TimeoutError: 1x (+2 muted during cooldown)"
+    assert "more during cooldown" not in sink.messages[-1]
+
+
+# =============================================================================
+# DISCORD CAPS A MESSAGE AT 2000 CHARACTERS
+# =============================================================================
+def test_chunks_stay_under_the_message_limit():
+    lines = [str(i) * 500 for i in range(8)] + ["x" * 5000]
+    chunks = list(chunk_lines(lines))
+    assert all(len(chunk) <= MAX_MESSAGE_LENGTH for chunk in chunks)
+    # three 500 character lines fit in a chunk, the long one is cut
+    assert [len(chunk.splitlines()) for chunk in chunks] == [3, 3, 2, 1]
+    assert chunks[-1] == "x" * (MAX_MESSAGE_LENGTH - 1) + "\n"
+
+
+def test_a_big_batch_is_sent_as_several_messages(sink):
+    queue = alerts()
+    for i in range(100):
+        queue.submit(f"market {i:03d} " + "!" * 80)
+    assert queue.flush(now=0.0) == 100
+    assert len(sink.messages) > 1
+    sent = [line for m in sink.messages for line in m.splitlines()]
+    assert sum(line.endswith(": 1x") for line in sent) == 100
+    # ping_discord's separators around each chunk still fit discord's 2000
+    assert all(len(m) <= 2000 for m in sink.messages)
+
+
+# =============================================================================
+# submit() IS ON THE FETCH PATH: A FULL QUEUE DROPS, NEVER WAITS
+# =============================================================================
+def test_submit_never_blocks_on_a_full_queue(sink):
+    queue = alerts(max_queue=2)
+    started = time.monotonic()
+    for _ in range(1000):
+        queue.submit(TimeoutError(), "BTC-USD")
+    assert time.monotonic() - started < 0.5
+    assert queue.queue.qsize() == 2
+    queue.flush(now=0.0)
+    assert "[BTC-USD] TimeoutError: 2x" in sink.messages[0].splitlines()
@@ -0,0 +1,152 @@
+import json, time, threading
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pandas as pd
+import pytest
+import backfill
+from backfill import KlineBackfill
+
+MINUTE = 60_000
+WINDOW = MINUTE * backfill.KLINE_LIMIT
+START = 28333 * WINDOW  # 2023-11-14, on a window boundary
+END = START + 2 * WINDOW + WINDOW // 2  # three windows, the last one half
+PAGE = 300  # fewer than asked for, so every window takes several pages
+
+
+class FakeKlines:
+    # /klines up to the current minute, PAGE at a time; `faults` are answered
+    # instead, first come first served, `down` windows fail with a 500
+    def __init__(self):
+        self.requests = []
+        self.faults = []
+        self.down = set()
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                query = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query)
+                start = int(query["startTime"][0])
+                end = int(query["endTime"][0])
+                fake.requests.append(start)
+                headers = {}
+                if fake.faults:
+                    status, retry_after = fake.faults.pop(0)
+                    body = {"code": -1003, "msg": "Too many requests."}
+                    headers["Retry-After"] = str(retry_after)
+                elif start - start % WINDOW in fake.down:
+                    status, body = 500, {"msg": "down"}
+                else:
+                    status, body = 200, klines(start, end)
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def klines(start, end):
+    first = -(-start // MINUTE) * MINUTE
+    last = min(end, int(time.time() * 1000))
+    opens = range(first, last + 1, MINUTE)[:PAGE]
+    return [[t, "1", "2", "0.5", str(t // MINUTE), "10", t + MINUTE - 1] for t in opens]
+
+
+@pytest.fixture
+def stub():
+    fake = FakeKlines()
+    yield fake
+    fake.stop()
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    # no real waiting, and the waits are kept to look at
+    sleeps = []
+    monkeypatch.setattr(backfill, "backoff_delay", lambda attempt, base, cap: 0.0)
+    monkeypatch.setattr(backfill.time, "sleep", sleeps.append)
+    return sleeps
+
+
+def downloader(stub, tmp_path):
+    return KlineBackfill(str(tmp_path), workers=2, rate=1000, base_url=stub.url)
+
+
+def minutes(df):
+    return ((df["timestamp"] - pd.Timestamp(0)) // pd.Timedelta("1min")).tolist()
+
+
+# =============================================================================
+# SHORT PAGES ARE FOLLOWED UP TO THE END OF EACH WINDOW
+# =============================================================================
+def test_windows_are_paged_through(stub, tmp_path, sleeps):
+    klines_dl = downloader(stub, tmp_path)
+    assert klines_dl.run(["BTC-USD"], START, END) == 2500
+    # 1000 + 1000 + 500 klines at PAGE a request
+    assert len(stub.requests) == 4 + 4 + 2
+    df = klines_dl.load("BTC-USD", START, END)
+    assert minutes(df) == list(range(START // MINUTE, END // MINUTE))
+    assert df["close"].tolist() == minutes(df)
+    assert len(klines_dl.completed("BTCBUSD")) == 3
+
+
+# =============================================================================
+# 429 / 418: WAIT AS LONG AS Retry-After SAYS, THEN GO ON
+# =============================================================================
+def test_rate_limits_wait_for_retry_after(stub, tmp_path, sleeps):
+    stub.faults = [(429, 2), (418, 7)]
+    klines_dl = downloader(stub, tmp_path)
+    klines_dl.workers = 1
+    assert klines_dl.run(["BTC-USD"], START, START + WINDOW) == 1000
+    assert sleeps == [2.0, 7.0]
+
+
+# =============================================================================
+# AN INTERRUPTED RUN PICKS UP WHERE IT STOPPED
+# =============================================================================
+def test_rerun_only_fetches_what_is_missing(stub, tmp_path, sleeps):
+    stub.down = {START + WINDOW}
+    klines_dl = downloader(stub, tmp_path)
+    assert klines_dl.run(["BTC-USD"], START, END) == 1500
+    assert klines_dl.completed("BTCBUSD") == {
+        (START, START + WINDOW),
+        (START + 2 * WINDOW, END),
+    }
+
+    stub.down = set()
+    stub.requests.clear()
+    rerun = downloader(stub, tmp_path)
+    assert rerun.run(["BTC-USD"], START, END) == 1000
+    assert all(START + WINDOW <= t < START + 2 * WINDOW for t in stub.requests)
+    assert len(rerun.load("BTC-USD", START, END)) == 2500
+
+
+# =============================================================================
+# A WINDOW REACHING UP TO NOW ISN'T DONE, ITS LAST KLINE IS STILL OPEN
+# =============================================================================
+def test_window_with_an_open_kline_is_fetched_again(stub, tmp_path, sleeps):
+    now = int(time.time() * 1000)
+    start = now - now % MINUTE - 10 * MINUTE
+    klines_dl = downloader(stub, tmp_path)
+    assert klines_dl.run(["BTC-USD"], start, start + 20 * MINUTE) >= 10
+    assert klines_dl.completed("BTCBUSD") == set()
+
+    stub.requests.clear()
+    klines_dl.run(["BTC-USD"], start, start + 20 * MINUTE)
+    assert stub.requests[0] == start
+
+    # the closed part on its own is done for good
+    klines_dl.run(["BTC-USD"], start, start + 5 * MINUTE)
+    assert klines_dl.completed("BTCBUSD") == {(start, start + 5 * MINUTE)}
@@ -0,0 +1,81 @@
+import pandas as pd
+import pytest
+from bars import compute_bars
+
+DAY = "2024-01-01"
+
+
+def frame(rows):
+    # (time of day, bid, ask, bid_size)
+    return pd.DataFrame(
+        {
+            "timestamp": [f"{DAY} {t}" for t, _, _, _ in rows],
+            "bid_price": [bid for _, bid, _, _ in rows],
+            "ask_price": [ask for _, _, ask, _ in rows],
+            "bid_size": [size for _, _, _, size in rows],
+            "ask_size": [1.0] * len(rows),
+            "mid": [(bid + ask) / 2 for _, bid, ask, _ in rows],
+        }
+    )
+
+
+def bar(bars, t):
+    return bars.set_index("timestamp").loc[pd.Timestamp(f"{DAY} {t}")]
+
+
+# =============================================================================
+# A HOLD THAT CROSSES A BUCKET EDGE IS SPLIT BETWEEN BOTH BUCKETS
+# =============================================================================
+def test_hold_is_split_at_bucket_edges():
+    df = frame([("00:00:50", 99, 101, 1.0), ("00:01:10", 99, 103, 2.0)])
+    bars = compute_bars(df, DAY, "1min", max_hold=60)
+    # 00:01 bucket: 10s of the first quote, then 50s of the second
+    assert bar(bars, "00:01:00")["spread"] == pytest.approx((10 * 2 + 50 * 4) / 60)
+    assert bar(bars, "00:01:00")["bid_size"] == pytest.approx((10 * 1 + 50 * 2) / 60)
+    assert bar(bars, "00:00:00")["spread"] == pytest.approx(2)
+
+
+# =============================================================================
+# A GAP OR THE END OF THE DAY DOESN'T KEEP WEIGHTING THE LAST QUOTE
+# =============================================================================
+def test_hold_is_capped():
+    df = frame(
+        [("00:00:00", 99, 101, 1.0), ("00:00:30", 99, 103, 2.0), ("23:59:30", 0, 0, 0)]
+    )
+    bars = compute_bars(df, DAY, "1h", max_hold=10)
+    # 10s of each, not 30s of the first and the rest of the hour of the second
+    assert bar(bars, "00:00:00")["spread"] == pytest.approx(3)
+    assert bar(bars, "00:00:00")["bid_size"] == pytest.approx(1.5)
+
+
+def test_default_cap_is_the_sampling_interval():
+    rows = [(f"00:00:{s:02d}", 99, 101, 1.0) for s in range(0, 30, 10)]
+    rows += [("00:10:00", 99, 109, 1.0), ("00:10:10", 99, 101, 1.0)]
+    bars = compute_bars(frame(rows), DAY, "1h")
+    # 40s at spread 2 (four quotes held 10s each), 10s at spread 10
+    assert bar(bars, "00:00:00")["spread"] == pytest.approx((40 * 2 + 10 * 10) / 50)
+
+
+# =============================================================================
+# QUIET BUCKETS ON CHANGE-ONLY DAYS CARRY THE QUOTE THAT WAS HELD
+# =============================================================================
+def test_quiet_buckets_hold_the_last_quote():
+    df = frame([("00:00:10", 99, 101, 1.0), ("00:03:30", 101, 103, 2.0)])
+    bars = compute_bars(df, DAY, "1min", max_hold=300)
+    times = list(bars["timestamp"].dt.strftime("%H:%M"))
+    # the second quote is held past its own bucket too, up to 00:08:30
+    assert times == [f"00:0{m}" for m in range(9)]
+    quiet = bar(bars, "00:02:00")
+    assert quiet[["open", "high", "low", "close"]].tolist() == [100] * 4
+    assert quiet["samples"] == 0
+    assert quiet["spread"] == pytest.approx(2)
+    assert bar(bars, "00:03:00")["open"] == 102
+    assert bar(bars, "00:03:00")["spread"] == pytest.approx(2)
+
+
+def test_no_quiet_buckets_past_the_hold():
+    df = frame([("00:00:10", 99, 101, 1.0), ("00:03:30", 101, 103, 2.0)])
+    bars = compute_bars(df, DAY, "1min", max_hold=60)
+    times = list(bars["timestamp"].dt.strftime("%H:%M"))
+    assert times == ["00:00", "00:01", "00:03", "00:04"]
+    assert bar(bars, "00:01:00")["samples"] == 0
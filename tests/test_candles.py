@@ -0,0 +1,86 @@
+import datetime as dt
+import pandas as pd
+from candles import CandleIngestor, CandleIndex, candles_daily_key
+from local_s3 import MemoryS3
+
+BUCKET = "test"
+
+
+def ts(s):
+    return dt.datetime.fromisoformat(s).replace(tzinfo=dt.timezone.utc).timestamp()
+
+
+def candle(started, updated, close):
+    return {
+        "startedAt": f"{started}.000Z",
+        "updatedAt": f"{updated}.000Z",
+        "open": "1",
+        "high": "2",
+        "low": "1",
+        "close": str(close),
+        "baseTokenVolume": "1",
+        "usdVolume": "1",
+        "trades": "1",
+        "startingOpenInterest": "1",
+    }
+
+
+class FlakyS3(MemoryS3):
+    def __init__(self):
+        super().__init__()
+        self.fail = 0
+
+    def put_object(self, Bucket, Key, Body):
+        if self.fail:
+            self.fail -= 1
+            raise Exception("S3 is down")
+        return super().put_object(Bucket, Key, Body)
+
+
+def ingestor(s3, candles):
+    ing = CandleIngestor(s3, BUCKET, markets=["BTC-USD"], index=CandleIndex("1MIN"))
+    ing.scheduler.fetch = lambda market, timeout: candles[market]
+    return ing
+
+
+def daily(s3, market, day):
+    key = candles_daily_key("1MIN", market, day)
+    return pd.read_csv(s3.get_object(Bucket=BUCKET, Key=key)["Body"], dtype=str)
+
+
+# =============================================================================
+# A FAILED WRITE DOESN'T MARK THE REVISION AS SEEN
+# =============================================================================
+def test_failed_write_is_retried_next_poll():
+    s3 = FlakyS3()
+    candles = {"BTC-USD": [candle("2024-01-01T10:00:00", "2024-01-01T10:00:30", 5)]}
+    ing = ingestor(s3, candles)
+
+    s3.fail = 1
+    assert ing.poll(ts("2024-01-01 10:00:40")) == 0
+    assert not ing.index.open
+    assert ing.poll(ts("2024-01-01 10:00:50")) == 1
+    assert list(ing.index.open) == [("BTC-USD", "2024-01-01T10:00:00.000Z")]
+    assert ing.poll(ts("2024-01-01 10:00:55")) == 0
+
+
+# =============================================================================
+# EVERY FINISHED DAY SINCE THE LAST COMPACTION, NOT ONLY YESTERDAY
+# =============================================================================
+def test_days_missed_while_down_are_compacted():
+    s3 = MemoryS3()
+    candles = {
+        "BTC-USD": [
+            candle("2024-01-01T23:58:00", "2024-01-01T23:58:59", 1),
+            candle("2024-01-01T23:59:00", "2024-01-01T23:59:59", 2),
+        ]
+    }
+    ing = ingestor(s3, candles)
+    ing.poll(ts("2024-01-02 00:00:05"))
+    assert ing.index.compacted is None  # 01-01 still open
+
+    # back three days later: 01-01 settled long ago, 01-02 and 01-03 are empty
+    candles["BTC-USD"] = [candle("2024-01-05T00:00:00", "2024-01-05T00:00:10", 3)]
+    ing.poll(ts("2024-01-05 00:00:20"))
+    assert ing.index.compacted == "2024-01-04"
+    assert list(daily(s3, "BTC-USD", "2024-01-01")["close"]) == ["1", "2"]
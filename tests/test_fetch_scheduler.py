@@ -0,0 +1,184 @@
+import time, asyncio
+import pytest
+import http_client
+from fetch_scheduler import (
+    FetchScheduler,
+    TokenBucket,
+    RateLimited,
+    retry_after_from_response,
+    next_retry,
+)
+from metrics import Metrics
+from replay import StubServer, Recording, synthesize
+
+MARKETS = ["BTC-USD", "ETH-USD", "SOL-USD", "LINK-USD", "AVAX-USD", "DOGE-USD"]
+
+
+@pytest.fixture(scope="module")
+def recording(tmp_path_factory):
+    directory = tmp_path_factory.mktemp("recording")
+    synthesize(str(directory), MARKETS, ticks=3, levels=3)
+    return str(directory)
+
+
+@pytest.fixture
+def stub(recording):
+    servers = []
+
+    def start(latency=0.0, faults=None):
+        server = StubServer(Recording(recording), latency, faults=faults).start()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.stop()
+
+
+def fetcher(server):
+    # what main.fetch_bid_ask does, minus parsing
+    def fetch(market, timeout):
+        res = http_client.get(f"{server.url}/v3/orderbook/{market}", timeout=timeout)
+        if res.status_code == 429:
+            raise RateLimited(retry_after_from_response(res))
+        res.raise_for_status()
+        return {"market": market, "book": res.json()}
+
+    return fetch
+
+
+def scheduler(server, metrics, **kwargs):
+    kwargs.setdefault("bucket", TokenBucket(10000))
+    return FetchScheduler(
+        fetcher(server),
+        lambda market: {"market": market, "book": None},
+        metrics=metrics,
+        **kwargs,
+    )
+
+
+def counter(metrics, name, market=None):
+    series = metrics.snapshot()["counters"].get(name, [])
+    return sum(s["value"] for s in series if market is None or s["market"] == market)
+
+
+# =============================================================================
+# RETRY-AFTER AND BACKOFF
+# =============================================================================
+def test_retry_after_is_waited_out(stub):
+    server = stub(faults={"BTC-USD": [{"status": 429, "retry_after": 0.4}]})
+    metrics = Metrics()
+    started = time.monotonic()
+    rows = scheduler(server, metrics, base_backoff=0.001, deadline=5).run(["BTC-USD"])
+    elapsed = time.monotonic() - started
+    assert rows[0]["book"] is not None
+    assert elapsed >= 0.4
+    assert counter(metrics, "retries") == 1
+    assert server.requests == 2
+
+
+def test_retry_after_past_the_deadline_gives_up_at_once(stub):
+    server = stub(faults={"BTC-USD": [{"status": 429, "retry_after": 60}]})
+    metrics = Metrics()
+    started = time.monotonic()
+    rows = scheduler(server, metrics, deadline=1.0).run(["BTC-USD"])
+    assert time.monotonic() - started < 0.5
+    assert rows[0]["book"] is None
+    assert counter(metrics, "deadline_missed") == 1
+    assert counter(metrics, "retries") == 0
+
+
+def test_backoff_between_failures_and_none_after_the_last(stub):
+    server = stub(faults={"BTC-USD": [{"status": 500}] * 10})
+    metrics = Metrics()
+    started = time.monotonic()
+    sched = scheduler(
+        server, metrics, max_retries=3, base_backoff=0.05, max_backoff=0.1, deadline=5
+    )
+    rows = sched.run(["BTC-USD"])
+    assert rows[0]["book"] is None
+    assert server.requests == 3
+    # two backoffs of at most 0.1s, nothing after the third failure
+    assert time.monotonic() - started < 0.5
+    assert counter(metrics, "retries") == 2
+    assert counter(metrics, "retries_exhausted") == 1
+    assert counter(metrics, "deadline_missed") == 0
+
+
+def test_next_retry_policy():
+    assert next_retry(RateLimited(3), 0, 5, 0.1, 1.0, deadline=10, now=0) == (3, None)
+    assert next_retry(RateLimited(30), 0, 5, 0.1, 1.0, deadline=10, now=0) == (
+        None,
+        "deadline_missed",
+    )
+    assert next_retry(Exception(), 4, 5, 0.1, 1.0) == (None, "retries_exhausted")
+    delay, gave_up = next_retry(Exception(), 3, 5, 0.1, 1.0)
+    assert gave_up is None and 0 <= delay <= 0.8
+
+
+# =============================================================================
+# PER-TICK DEADLINE: A SLOW MARKET BECOMES A NAN ROW, THE REST ARE ON TIME
+# =============================================================================
+def test_slow_market_turns_into_a_missing_row(stub):
+    server = stub(faults={"ETH-USD": [{"latency": 3}]})
+    metrics = Metrics()
+    started = time.monotonic()
+    rows = scheduler(server, metrics, deadline=0.5).run(MARKETS)
+    elapsed = time.monotonic() - started
+    assert elapsed < 1.0
+    assert [row["market"] for row in rows] == MARKETS
+    missing = [row["market"] for row in rows if row["book"] is None]
+    assert missing == ["ETH-USD"]
+    assert counter(metrics, "deadline_missed", "ETH-USD") == 1
+
+
+# =============================================================================
+# CONCURRENCY CAP AND TOKEN BUCKET RATE
+# =============================================================================
+def test_concurrency_is_capped(stub):
+    server = stub(latency=0.1)
+    rows = scheduler(server, Metrics(), max_workers=2, deadline=5).run(MARKETS)
+    assert all(row["book"] is not None for row in rows)
+    assert server.max_in_flight == 2
+
+
+def test_token_bucket_paces_requests(stub):
+    server = stub()
+    rate = 10.0
+    sched = scheduler(server, Metrics(), bucket=TokenBucket(rate, 1), deadline=5)
+    rows = sched.run(MARKETS)
+    assert all(row["book"] is not None for row in rows)
+    times = sorted(server.request_times)
+    # one token up front, then one every 1 / rate seconds
+    assert times[-1] - times[0] >= (len(MARKETS) - 1) / rate * 0.9
+
+
+def test_token_bucket_reserve():
+    bucket = TokenBucket(rate=4, capacity=2)
+    waits = [bucket.reserve() for _ in range(4)]
+    assert waits[:2] == [0.0, 0.0]
+    assert waits[2] == pytest.approx(0.25, abs=0.01)
+    assert waits[3] == pytest.approx(0.5, abs=0.01)
+
+
+# =============================================================================
+# daemon.py GOES BY THE SAME POLICY
+# =============================================================================
+def test_daemon_fetch_does_not_sleep_past_the_deadline(stub, monkeypatch):
+    aiohttp = pytest.importorskip("aiohttp")
+    import daemon
+
+    server = stub(faults={"BTC-USD": [{"status": 429, "retry_after": 60}]})
+    monkeypatch.setattr(daemon.DYDX, "base_url", f"{server.url}/v3")
+    monkeypatch.setattr(daemon.ALERTS, "submit", lambda *args: None)
+    daemon.METRICS.reset()
+
+    async def go():
+        async with aiohttp.ClientSession() as session:
+            return await daemon.fetch_bid_ask(session, "BTC-USD", time.time() + 1.0)
+
+    started = time.monotonic()
+    row = asyncio.run(go())
+    assert time.monotonic() - started < 0.5
+    assert row["quality"] == daemon.main.MISSING
+    assert counter(daemon.METRICS, "deadline_missed") == 1
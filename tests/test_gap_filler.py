@@ -0,0 +1,40 @@
+import numpy as np
+import pandas as pd
+from gap_filler import merge_backfill
+from quality import MISSING, BACKFILL
+
+
+def recorded_day():
+    nan = float("nan")
+    return pd.DataFrame(
+        {
+            "timestamp": ["2023-01-01 00:00:00", "2023-01-01 00:01:00"],
+            "bid_price": [1.0, nan],
+            "ask_price": [2.0, nan],
+            "mid": [1.5, nan],
+            "bid_size": [1.0, nan],
+            "ask_size": [1.0, nan],
+            "quality": [2, MISSING],
+        }
+    )
+
+
+def source():
+    timestamps = pd.date_range("2023-01-01", periods=4, freq="1min")
+    return pd.DataFrame({"timestamp": timestamps, "mid": [9.0, 9.1, 9.2, 9.3]})
+
+
+def test_backfilled_rows_are_flagged_and_quality_stays_int():
+    slots = pd.DatetimeIndex(["2023-01-01 00:01:00", "2023-01-01 00:02:00"])
+    out, added = merge_backfill(recorded_day(), source(), slots)
+    assert added == 1
+    assert out["quality"].dtype == np.int64
+    assert out["quality"].tolist() == [2, MISSING | BACKFILL, MISSING | BACKFILL]
+    assert out["mid"].tolist() == [1.5, 9.1, 9.2]
+
+
+def test_days_without_a_quality_column_get_one():
+    df = recorded_day().drop(columns="quality")
+    slots = pd.DatetimeIndex(["2023-01-01 00:02:00"])
+    out, _ = merge_backfill(df, source(), slots)
+    assert out["quality"].tolist() == [0, MISSING | BACKFILL, MISSING | BACKFILL]
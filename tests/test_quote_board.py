@@ -0,0 +1,40 @@
+import quote_board
+from quote_board import BoardWriter, QuoteBoard
+
+
+def publish(writer, market, mid):
+    writer.publish(market, mid - 1, 1.0, mid + 1, 2.0, 0, 0.0, 0)
+
+
+def test_unknown_market_is_none(tmp_path):
+    path = str(tmp_path / "board")
+    writer = BoardWriter(path, ["BTC-USD"])
+    board = QuoteBoard(path)
+    assert board.read("NOPE-USD") is None
+    assert board.get("NOPE-USD") is None
+    assert board.mid("NOPE-USD") is None
+    assert board.get("BTC-USD") is None  # nothing published yet
+    publish(writer, "BTC-USD", 100.0)
+    assert board.mid("BTC-USD") == 100.0
+
+
+def test_reader_follows_a_replaced_board(tmp_path, monkeypatch):
+    path = str(tmp_path / "board")
+    old = BoardWriter(path, ["BTC-USD"])
+    publish(old, "BTC-USD", 100.0)
+    board = QuoteBoard(path)
+    assert board.mid("BTC-USD") == 100.0
+
+    # a new market list swaps in a new file
+    new = BoardWriter(path, ["BTC-USD", "ETH-USD"])
+    publish(new, "BTC-USD", 200.0)
+    publish(new, "ETH-USD", 10.0)
+    assert board.mid("ETH-USD") == 10.0  # the miss reopens
+    assert board.mid("BTC-USD") == 200.0
+
+    # and without a miss, once REOPEN_CHECK has passed
+    monkeypatch.setattr(quote_board, "REOPEN_CHECK", 0.0)
+    newer = BoardWriter(path, ["ETH-USD", "BTC-USD"])
+    publish(newer, "BTC-USD", 300.0)
+    assert board.mid("BTC-USD") == 300.0
+    assert board.markets == ["ETH-USD", "BTC-USD"]
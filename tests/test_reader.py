@@ -0,0 +1,181 @@
+import os, json
+import numpy as np
+import pandas as pd
+import pytest
+from local_s3 import MemoryS3
+from reader import (
+    ChunkCache,
+    Reader,
+    build_csv_index,
+    csv_byte_range,
+    index_key,
+    CSV_INDEX_STRIDE,
+)
+from storage_formats import get_format
+
+BUCKET = "test"
+DAY = "2024-01-01"
+ROWS = 3500  # three full index strides and half of one
+
+
+def day_frame(offset=0.0):
+    timestamps = pd.date_range(DAY, periods=ROWS, freq="1s")
+    mid = np.arange(ROWS) + offset
+    return pd.DataFrame(
+        {
+            "timestamp": timestamps.strftime("%Y-%m-%d %H:%M:%S"),
+            "bid_price": mid - 1,
+            "ask_price": mid + 1,
+            "mid": mid,
+        }
+    )
+
+
+def row_time(i):
+    return pd.Timestamp(DAY) + pd.Timedelta(seconds=i)
+
+
+@pytest.fixture
+def day_csv():
+    data = get_format("csv").serialize(day_frame())
+    return data, build_csv_index(data, '"etag"')
+
+
+# =============================================================================
+# WHICH BYTES COVER [start, end)
+# =============================================================================
+def test_index_has_a_row_every_stride(day_csv):
+    data, index = day_csv
+    assert len(index["offsets"]) == 4
+    assert index["header"] == "timestamp,bid_price,ask_price,mid\n"
+    assert index["timestamps"][1] == row_time(CSV_INDEX_STRIDE).value
+    assert data[index["offsets"][1] :].startswith(b"2024-01-01 00:16:40,")
+
+
+def test_range_at_the_start_of_the_day(day_csv):
+    _, index = day_csv
+    offsets = index["offsets"]
+    assert csv_byte_range(index, row_time(0), row_time(10)) == (
+        offsets[0],
+        offsets[1] - 1,
+    )
+    # from before the first row: still the first chunk
+    before = pd.Timestamp("2023-12-31 23:00")
+    assert csv_byte_range(index, before, row_time(10)) == (offsets[0], offsets[1] - 1)
+    # all of it before the first row: nothing
+    assert csv_byte_range(index, before, row_time(0)) is None
+
+
+def test_range_at_the_end_of_the_day(day_csv):
+    _, index = day_csv
+    last = (index["offsets"][3], index["size"] - 1)
+    assert csv_byte_range(index, row_time(ROWS - 5), pd.Timestamp("2024-01-02")) == last
+    # past the last row, the last chunk is read and filtered out
+    assert csv_byte_range(index, row_time(ROWS + 5), row_time(ROWS + 10)) == last
+
+
+def test_range_between_two_strides(day_csv):
+    _, index = day_csv
+    offsets = index["offsets"]
+    # inside one chunk
+    assert csv_byte_range(index, row_time(1200), row_time(1500)) == (
+        offsets[1],
+        offsets[2] - 1,
+    )
+    # across a stride: both chunks
+    assert csv_byte_range(index, row_time(1900), row_time(2100)) == (
+        offsets[1],
+        offsets[3] - 1,
+    )
+    # on the strides exactly: [1000, 2000) is chunk 1 only
+    stride = CSV_INDEX_STRIDE
+    assert csv_byte_range(index, row_time(stride), row_time(2 * stride)) == (
+        offsets[1],
+        offsets[2] - 1,
+    )
+
+
+# =============================================================================
+# READER: ONLY THE RANGE IS DOWNLOADED, A STALE INDEX IS REBUILT
+# =============================================================================
+def store_day(s3, df):
+    fmt = get_format("csv")
+    s3.put_object(
+        Bucket=BUCKET, Key=fmt.daily_key("BTC-USD", DAY), Body=fmt.serialize(df)
+    )
+
+
+def test_reader_downloads_only_the_range(day_csv):
+    s3 = MemoryS3()
+    store_day(s3, day_frame())
+    reader = Reader(s3, BUCKET, get_format("csv"))
+    reader.load("BTC-USD", row_time(0), row_time(1))  # builds the index
+    s3.bytes_out = 0
+
+    df = reader.load("BTC-USD", row_time(1200), row_time(1500), ["mid"])
+    assert df["mid"].tolist() == list(range(1200, 1500))
+    assert df["timestamp"].iloc[0] == row_time(1200)
+    assert s3.bytes_out < len(day_csv[0]) / 3
+
+
+def test_stale_index_is_rebuilt():
+    s3 = MemoryS3()
+    store_day(s3, day_frame())
+    Reader(s3, BUCKET, get_format("csv")).load("BTC-USD", row_time(0), row_time(1))
+    key = index_key(get_format("csv").daily_key("BTC-USD", DAY))
+    old = json.loads(s3.get_object(Bucket=BUCKET, Key=key)["Body"].read())
+
+    # rewritten since (gap repair): longer numbers, every offset moves
+    store_day(s3, day_frame(offset=0.125))
+    df = Reader(s3, BUCKET, get_format("csv")).load(
+        "BTC-USD", row_time(2500), row_time(2503), ["mid"]
+    )
+    assert df["mid"].tolist() == [2500.125, 2501.125, 2502.125]
+    new = json.loads(s3.get_object(Bucket=BUCKET, Key=key)["Body"].read())
+    assert new["offsets"] != old["offsets"]
+    head = s3.head_object(
+        Bucket=BUCKET, Key=get_format("csv").daily_key("BTC-USD", DAY)
+    )
+    assert new["etag"] == head["ETag"] != old["etag"]
+
+
+# =============================================================================
+# LOCAL CACHE: LEAST RECENTLY USED GOES FIRST ONCE max_bytes IS PASSED
+# =============================================================================
+def test_cache_evicts_least_recently_used(tmp_path):
+    cache = ChunkCache(str(tmp_path), max_bytes=250)
+    cache.put("a", b"a" * 100)
+    cache.put("b", b"b" * 100)
+    assert cache.get("a") == b"a" * 100  # a is now the most recent
+    cache.put("c", b"c" * 100)
+    assert cache.get("b") is None
+    assert cache.total == 200
+    assert sorted(os.listdir(tmp_path)) == ["a", "c"]
+
+    cache.put("huge", b"x" * 251)  # never cached, nothing evicted for it
+    assert list(cache.entries) == ["a", "c"]
+
+
+def test_cache_survives_a_restart(tmp_path):
+    cache = ChunkCache(str(tmp_path), max_bytes=250)
+    cache.put("a", b"a" * 100)
+    cache.put("b", b"b" * 100)
+    os.utime(tmp_path / "a", (1, 1))
+    os.utime(tmp_path / "b", (2, 2))
+
+    reopened = ChunkCache(str(tmp_path), max_bytes=250)
+    assert reopened.total == 200
+    reopened.put("c", b"c" * 100)
+    assert list(reopened.entries) == ["b", "c"]
+
+
+def test_reader_reads_through_the_cache(tmp_path):
+    s3 = MemoryS3()
+    store_day(s3, day_frame())
+    cache = ChunkCache(str(tmp_path / "cache"))
+    reader = Reader(s3, BUCKET, get_format("csv"), cache)
+    first = reader.load("BTC-USD", row_time(1200), row_time(1500))
+    gets = s3.calls["get_object"]
+    again = reader.load("BTC-USD", row_time(1200), row_time(1500))
+    pd.testing.assert_frame_equal(first, again)
+    assert s3.calls["get_object"] == gets
@@ -0,0 +1,68 @@
+import threading
+import pytest
+import main
+
+
+def quote(market, mid):
+    return {
+        "market": market,
+        "bid_price": mid - 0.5,
+        "bid_size": 1.0,
+        "ask_price": mid + 0.5,
+        "ask_size": 2.0,
+        "mid": mid,
+        "quality": 0,
+    }
+
+
+WAL_MODE = [{"STORAGE_MODE": "wal"}]
+
+
+def keys(s3):
+    return sorted(key for _, key in s3.objects)
+
+
+# =============================================================================
+# WAL MODE: NOTHING SHIPPED YET, ROLL-OVER STILL ENDS IN A DAILY FILE + BARS
+# =============================================================================
+@pytest.mark.parametrize("offline_main", WAL_MODE, indirect=True)
+def test_wal_day_is_flushed_and_compacted(offline_main):
+    s3 = main.S3
+    for second, mid in enumerate([100.0, 101.0, 102.0]):
+        now_s = f"2024-01-01 23:59:5{second}"
+        main.store_bid_asks([quote(m, mid) for m in main.MARKETS], now_s, "2024-01-01")
+    main.roll_over_day("2024-01-01")
+
+    found = keys(s3)
+    for market in main.MARKETS:
+        daily = main.OUTPUT_FORMAT.daily_key(market, "2024-01-01")
+        assert daily in found
+        df = main.OUTPUT_FORMAT.deserialize(s3.objects[(main.BUCKET_NAME, daily)])
+        assert list(df["mid"]) == [100.0, 101.0, 102.0]
+    assert not [key for key in found if "/wal-" in key]
+    assert any(key.startswith("bars/") for key in found)
+
+
+# =============================================================================
+# daemon.py NOTICES THE NEW DAY ON ITS OWN TICKS
+# =============================================================================
+@pytest.mark.parametrize("offline_main", WAL_MODE, indirect=True)
+def test_daemon_tick_rolls_over(offline_main, monkeypatch):
+    pytest.importorskip("aiohttp")
+    import daemon
+
+    rolled = []
+    done = threading.Event()
+
+    def roll_over_day(day):
+        rolled.append(day)
+        done.set()
+
+    monkeypatch.setattr(main, "roll_over_day", roll_over_day)
+    monkeypatch.setattr(daemon, "DEPTH_LEVELS", 0)
+    rows = [quote(m, 100.0) for m in main.MARKETS]
+    daemon.timed_store([dict(r) for r in rows], "2024-01-01 23:59:59", "2024-01-01")
+    daemon.timed_store([dict(r) for r in rows], "2024-01-02 00:00:00", "2024-01-02")
+    daemon.timed_store([dict(r) for r in rows], "2024-01-02 00:00:01", "2024-01-02")
+    assert done.wait(5)
+    assert rolled == ["2024-01-01"]
@@ -0,0 +1,118 @@
+import pytest
+import main
+import sharding
+from constants import MARKETS
+from quality import QualityValidator
+from sharding import HashRing, ShardTable, ShardWorker, SHARD_MERGE_GRACE
+
+DAY_START = 1704067200.0  # 2024-01-01 00:00 UTC
+
+
+@pytest.fixture
+def table(offline_main, tmp_path):
+    table = ShardTable(str(tmp_path / "shards.sqlite"))
+    yield table
+    table.close()
+
+
+def post(table, tick, mid, markets=None):
+    # what a worker posts: fetched, not graded
+    rows = [
+        {
+            "market": market,
+            "bid_price": mid - 0.5,
+            "bid_size": 1.0,
+            "ask_price": mid + 0.5,
+            "ask_size": 1.0,
+            "received": tick,
+        }
+        for market in markets or main.MARKETS
+    ]
+    assert "quality" not in rows[0]
+    table.post(tick, rows)
+
+
+def test_merger_grades_and_the_next_merger_goes_on_from_its_state(table):
+    first = ShardWorker("w0", table)
+    for i in range(3):
+        post(table, DAY_START + i, 100.0 + i)
+    first.merge_due(DAY_START + 100)
+    stats = main.QUALITY.stats["BTC-USD"]
+    assert stats.n == 3
+
+    # w0 is gone; w1 runs in its own process with fresh rolling state
+    main.QUALITY = QualityValidator()
+    second = ShardWorker("w1", table)
+    post(table, DAY_START + 3, 103.0)
+    second.merge_due(DAY_START + 100)
+    assert main.QUALITY.stats["BTC-USD"].n == 4
+    assert main.QUALITY.stats["BTC-USD"].last_mid == 103.0
+
+    stored = [body.decode() for body in main.S3.objects.values()]
+    assert len(stored) == 4 * len(main.MARKETS)
+    header = stored[0].splitlines()[0].split(",")
+    quality = [
+        body.splitlines()[1].split(",")[header.index("quality")] for body in stored
+    ]
+    assert quality == ["0"] * len(stored)
+
+
+# =============================================================================
+# TICKS ARE MERGED IN ORDER, NEVER PAST ONE STILL WAITING FOR ROWS
+# =============================================================================
+def test_a_complete_tick_waits_for_an_incomplete_earlier_one(table):
+    worker = ShardWorker("w0", table, interval=1.0)
+    post(table, DAY_START, 100.0, markets=["BTC-USD"])  # ETH's worker failed
+    post(table, DAY_START + 1, 101.0)
+    worker.merge_due(DAY_START + 1.5)
+    assert list(table.pending()) == [DAY_START, DAY_START + 1]
+    assert not main.S3.objects
+
+    worker.merge_due(DAY_START + 1.0 + SHARD_MERGE_GRACE)
+    assert not table.pending()
+    assert main.QUALITY.stats["BTC-USD"].last_mid == 101.0
+    assert main.QUALITY.stats["ETH-USD"].n == 1
+
+
+# =============================================================================
+# CONSISTENT HASHING: A WORKER LEAVING ONLY MOVES ITS OWN MARKETS
+# =============================================================================
+def test_removing_a_worker_only_moves_its_markets():
+    workers = ["w0", "w1", "w2", "w3"]
+    before = {m: HashRing(workers).owner(m) for m in MARKETS}
+    after = {m: HashRing(["w0", "w1", "w3"]).owner(m) for m in MARKETS}
+    moved = [m for m in MARKETS if before[m] != after[m]]
+    assert moved == [m for m in MARKETS if before[m] == "w2"]
+    assert moved  # w2 did own something
+    assert set(after.values()) == {"w0", "w1", "w3"}
+
+
+# =============================================================================
+# LEASES: A WORKER THAT STOPS RENEWING HANDS ITS MARKETS TO THE OTHERS
+# =============================================================================
+def test_expired_lease_moves_markets_to_the_live_workers(table):
+    now = 1000.0
+    alive, dead = ShardWorker("w0", table), ShardWorker("w1", table)
+    dead.assignment(now)
+    alive.assignment(now)
+    dead.assignment(now)
+    assert table.live(now) == ["w0", "w1"]
+    units = sharding.shard_units()
+    assert 0 < len(alive.owned) < len(units)
+    assert sorted(alive.owned + dead.owned) == sorted(units)
+
+    # w1 stops renewing; before the TTL it still owns its markets
+    alive.assignment(now + table.ttl - 1)
+    assert len(alive.owned) < len(units)
+    alive.assignment(now + table.ttl + 1)
+    assert table.live(now + table.ttl + 1) == ["w0"]
+    assert alive.owned == units
+
+
+def test_released_lease_hands_over_at_once(table):
+    first, second = ShardWorker("w0", table), ShardWorker("w1", table)
+    first.assignment(1000.0)
+    second.assignment(1000.0)
+    table.release("w1")
+    first.assignment(1001.0)
+    assert first.owned == sharding.shard_units()
@@ -0,0 +1,118 @@
+import numpy as np
+import pandas as pd
+import storage_formats
+import tick_codec
+from storage_formats import TickFormat
+
+NAN = float("nan")
+T0 = 1704067200 * 10**9  # 2024-01-01 00:00 UTC, ns
+
+
+def round_trip(timestamps, columns, scales=None, meta=None):
+    data = tick_codec.encode(timestamps, columns, scales, meta)
+    decoded_ts, decoded, header = tick_codec.decode(data)
+    np.testing.assert_array_equal(decoded_ts, timestamps)
+    assert list(decoded) == list(columns)
+    for name, values in columns.items():
+        np.testing.assert_array_equal(decoded[name], values)
+        assert decoded[name].dtype == np.asarray(values).dtype
+    return {column["name"]: column for column in header["columns"]}
+
+
+def seconds(*offsets):
+    return np.array([T0 + int(s * 10**9) for s in offsets], dtype=np.int64)
+
+
+# =============================================================================
+# QUANTIZED COLUMNS, NaNs KEPT IN PLACE
+# =============================================================================
+def test_nans_survive_the_round_trip():
+    columns = {
+        "bid_price": np.array([99.5, NAN, 100.0, NAN, 98.5]),
+        "mid": np.array([NAN, NAN, NAN, NAN, NAN]),
+    }
+    header = round_trip(seconds(0, 1, 2, 3, 4), columns, {"bid_price": 0.5})
+    assert header["bid_price"]["kind"] == "q"
+    assert header["bid_price"]["scale"] == 0.5
+    assert header["bid_price"]["nulls"] == 1  # five rows, one bitmap byte
+    assert header["mid"]["nulls"] == 1
+
+
+def test_int_columns_come_back_as_ints():
+    quality = np.array([0, 2, 8, 0, 1 << 40], dtype=np.int64)
+    header = round_trip(seconds(0, 1, 2, 3, 4), {"quality": quality})
+    assert header["quality"]["kind"] == "q"
+    assert header["quality"]["int"]
+
+
+# =============================================================================
+# A COLUMN OFF ITS GRID FALLS BACK TO THE GRID IT SITS ON, OR TO RAW FLOATS
+# =============================================================================
+def test_off_grid_columns_fall_back():
+    columns = {
+        # a backfilled mid between half ticks
+        "mid": np.array([100.25, 100.5, 100.37]),
+        "ratio": np.array([np.pi, np.e, 1 / 3]),
+    }
+    header = round_trip(seconds(0, 1, 2), columns, {"mid": 0.5, "ratio": 0.01})
+    assert header["mid"]["kind"] == "q"
+    assert header["mid"]["scale"] == 0.01
+    assert header["mid"]["decimals"] == 2
+    assert header["ratio"]["kind"] == "f8"
+
+
+def test_text_columns_are_json():
+    columns = {"market": np.array(["BTC-USD", None, "ETH-USD"], dtype=object)}
+    header = round_trip(seconds(0, 1, 2), columns)
+    assert header["market"]["kind"] == "json"
+
+
+# =============================================================================
+# TIMESTAMPS: MICROSECONDS WHEN THEY ALLOW IT, EXACT NANOSECONDS OTHERWISE
+# =============================================================================
+def test_timestamps_keep_their_precision():
+    prices = {"bid_price": np.array([1.0, 2.0, 3.0, 4.0])}
+    # irregular, and going backwards
+    micros = T0 + np.array([0, 10**9, 10**9 + 1000, 5 * 10**8], dtype=np.int64)
+    data = tick_codec.encode(micros, prices)
+    assert tick_codec.decode_header(data)["ts_unit"] == 1000
+    round_trip(micros, prices)
+
+    nanos = micros + np.array([1, 999, 0, 7], dtype=np.int64)
+    data = tick_codec.encode(nanos, prices)
+    assert tick_codec.decode_header(data)["ts_unit"] == 1
+    round_trip(nanos, prices)
+
+
+# =============================================================================
+# THE HEADER CARRIES THE SCALES: A TICK SIZE CHANGE DOESN'T TOUCH OLD FILES
+# =============================================================================
+def test_old_files_decode_after_a_tick_size_change(monkeypatch):
+    params = {"price_rounder": 0.5, "order_size": 0.001}
+    monkeypatch.setattr(storage_formats, "TICK_PARAMS", {"BTC-USD": params})
+    df = pd.DataFrame(
+        {
+            "timestamp": ["2024-01-01 00:00:00", "2024-01-01 00:00:01"],
+            "bid_price": [99.5, 100.0],
+            "ask_price": [100.5, 101.0],
+            "mid": [100.0, 100.5],
+            "bid_size": [0.012, 1.5],
+            "ask_size": [0.001, NAN],
+            "quality": np.array([0, 2], dtype=np.int64),
+        }
+    )
+    fmt = TickFormat()
+    data = fmt.serialize(df, "BTC-USD")
+    header = tick_codec.decode_header(data)
+    assert header["meta"]["tick_size"] == 0.5
+    scales = {c["name"]: c.get("scale") for c in header["columns"]}
+    assert scales["bid_price"] == 0.5 and scales["mid"] == 0.25
+
+    # the market moves to a 0.1 tick, then a 7 tick
+    params["price_rounder"] = 0.1
+    out = fmt.deserialize(data)
+    pd.testing.assert_frame_equal(
+        out.drop(columns="timestamp"), df.drop(columns="timestamp")
+    )
+    params["price_rounder"] = 7.0
+    assert fmt.deserialize(data, ["bid_price"])["bid_price"].tolist() == [99.5, 100.0]
@@ -0,0 +1,130 @@
+import json, asyncio, threading
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from venues import (
+    BinanceAdapter,
+    DydxAdapter,
+    ExchangeAdapter,
+    fetch_quotes,
+    fetch_quotes_async,
+)
+
+LISTED = {"BTCBUSD": 100.0, "ETHBUSD": 10.0}
+MARKETS = ["BTC-USD", "NOPE-USD", "ETH-USD"]
+
+
+class FakeBinance:
+    # /ticker/bookTicker with Binance's answer to an unlisted symbol
+    def __init__(self):
+        self.requests = []
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                query = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query)
+                if "symbols" in query:
+                    symbols = json.loads(query["symbols"][0])
+                else:
+                    symbols = query["symbol"]
+                fake.requests.append(symbols)
+                if any(s not in LISTED for s in symbols):
+                    status, body = 400, {"code": -1121, "msg": "Invalid symbol."}
+                else:
+                    status = 200
+                    body = [ticker(s) for s in symbols]
+                    if "symbol" in query:
+                        body = body[0]
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def ticker(symbol):
+    mid = LISTED[symbol]
+    return {
+        "symbol": symbol,
+        "bidPrice": str(mid - 1),
+        "bidQty": "1",
+        "askPrice": str(mid + 1),
+        "askQty": "2",
+    }
+
+
+@pytest.fixture
+def binance():
+    fake = FakeBinance()
+    yield fake
+    fake.stop()
+
+
+def test_unlisted_symbol_falls_back_to_single_requests(binance):
+    adapter = BinanceAdapter(base_url=binance.url)
+    quotes = fetch_quotes(adapter, MARKETS, timeout=5)
+    assert sorted(quotes) == ["BTC-USD", "ETH-USD"]
+    assert quotes["BTC-USD"].bid_price == 99.0
+    assert adapter.unlisted == {"NOPE-USD"}
+
+    # the next tick is one batch again, without the unlisted symbol
+    binance.requests.clear()
+    assert sorted(fetch_quotes(adapter, MARKETS, timeout=5)) == ["BTC-USD", "ETH-USD"]
+    assert binance.requests == [["BTCBUSD", "ETHBUSD"]]
+
+
+def test_unlisted_symbol_async(binance):
+    aiohttp = pytest.importorskip("aiohttp")
+    adapter = BinanceAdapter(base_url=binance.url)
+
+    async def go():
+        async with aiohttp.ClientSession() as session:
+            return await fetch_quotes_async(session, adapter, MARKETS, 5)
+
+    quotes = asyncio.run(go())
+    assert sorted(quotes) == ["BTC-USD", "ETH-USD"]
+    assert adapter.unlisted == {"NOPE-USD"}
+
+
+# =============================================================================
+# dYdX GOES THROUGH THE SAME INTERFACE, WITH ITS LEVELS AND TICK SIZES
+# =============================================================================
+def test_dydx_adapter():
+    params = {"BTC-USD": {"price_rounder": 0.5}}
+    adapter = DydxAdapter("http://dydx/v3", market_params=lambda: params)
+    assert adapter.requests(["BTC-USD", "ETH-USD"]) == [
+        ("http://dydx/v3/orderbook/BTC-USD", None, ["BTC-USD"]),
+        ("http://dydx/v3/orderbook/ETH-USD", None, ["ETH-USD"]),
+    ]
+    book = {
+        "bids": [{"price": "99", "size": "1"}, {"price": "98", "size": "3"}],
+        "asks": [{"price": "101", "size": "2"}, {"price": "102", "size": "4"}],
+    }
+    top = adapter.parse(["BTC-USD"], book)["BTC-USD"]
+    assert (top.bid_price, top.ask_size) == (99.0, 2.0)
+    assert adapter.levels(book, 1) == (book["bids"][:1], book["asks"][:1])
+    assert adapter.tick_size("BTC-USD") == 0.5
+    # venues without either
+    assert BinanceAdapter().levels(book, 1) is None
+    assert BinanceAdapter().tick_size("BTC-USD") is None
+
+
+def test_adapters_must_implement_requests_and_parse():
+    class Half(ExchangeAdapter):
+        def requests(self, markets):
+            return []
+
+    with pytest.raises(TypeError):
+        Half()
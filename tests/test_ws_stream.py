@@ -0,0 +1,222 @@
+import asyncio, json
+import pytest
+import ws_stream
+from ws_stream import OrderBook, OrderbookStream
+from replay import FakeWsServer
+
+
+def snapshot(market, bids, asks, offset=0):
+    return {
+        "type": "subscribed",
+        "channel": "v3_orderbook",
+        "id": market,
+        "contents": {
+            "bids": [{"price": p, "size": s, "offset": str(offset)} for p, s in bids],
+            "asks": [{"price": p, "size": s, "offset": str(offset)} for p, s in asks],
+        },
+    }
+
+
+def delta(market, offset, bids=(), asks=()):
+    return {
+        "type": "channel_data",
+        "channel": "v3_orderbook",
+        "id": market,
+        "contents": {"offset": str(offset), "bids": list(bids), "asks": list(asks)},
+    }
+
+
+# =============================================================================
+# OrderBook: OFFSETS DECIDE, NOT ARRIVAL ORDER
+# =============================================================================
+def test_older_delta_does_not_overwrite_newer_level():
+    book = OrderBook("BTC-USD")
+    book.load_snapshot(snapshot("BTC-USD", [("100", "1")], [("101", "1")])["contents"])
+    book.apply_delta(delta("BTC-USD", 10, bids=[("100", "5")])["contents"])
+    book.apply_delta(delta("BTC-USD", 7, bids=[("100", "2")])["contents"])
+    top = book.top()
+    assert (top.bid_price, top.bid_size) == (100.0, 5.0)
+    assert book.offset == 10
+
+
+def test_stale_delete_does_not_remove_newer_level():
+    book = OrderBook("BTC-USD")
+    book.load_snapshot(snapshot("BTC-USD", [("100", "1")], [("101", "1")])["contents"])
+    book.apply_delta(delta("BTC-USD", 10, bids=[("99", "3")])["contents"])
+    book.apply_delta(delta("BTC-USD", 8, bids=[("99", "0")])["contents"])
+    assert "99" in book.bids
+
+
+def test_snapshot_offsets_guard_against_replayed_deltas():
+    book = OrderBook("BTC-USD")
+    book.load_snapshot(
+        snapshot("BTC-USD", [("100", "1")], [("101", "1")], offset=50)["contents"]
+    )
+    book.apply_delta(delta("BTC-USD", 40, bids=[("100", "0")])["contents"])
+    assert book.top().bid_price == 100.0
+
+
+def test_crossed_book_drops_the_older_side():
+    book = OrderBook("BTC-USD")
+    book.load_snapshot(snapshot("BTC-USD", [("100", "1")], [("101", "1")])["contents"])
+    # a newer bid at 102 crosses the (older) ask at 101
+    book.apply_delta(
+        delta("BTC-USD", 5, bids=[("102", "1")], asks=[("103", "1")])["contents"]
+    )
+    top = book.top()
+    assert top.bid_price == 102.0 and top.ask_price == 103.0
+
+
+def test_deltas_before_snapshot_are_ignored():
+    stream = OrderbookStream(["BTC-USD"], None)
+    assert (
+        stream.handle_message(json.dumps(delta("BTC-USD", 1, bids=[("1", "1")])))
+        is None
+    )
+    assert stream.books["BTC-USD"].top() is None
+
+
+# =============================================================================
+# AGAINST THE FAKE SERVER: RESYNC AFTER A DROPPED CONNECTION
+# =============================================================================
+def run_stream(server, markets, until, timeout=10):
+    samples = []
+
+    async def go():
+        stop = asyncio.Event()
+        stream = OrderbookStream(
+            markets,
+            lambda tops, now: samples.append(tops),
+            url=server.url,
+            mode="change",
+        )
+        task = asyncio.create_task(stream.run(stop))
+        deadline = asyncio.get_running_loop().time() + timeout
+        while not until(stream, samples):
+            if asyncio.get_running_loop().time() > deadline:
+                break
+            await asyncio.sleep(0.01)
+        stop.set()
+        await asyncio.wait_for(task, 5)
+        return stream
+
+    return asyncio.run(go()), samples
+
+
+@pytest.fixture(autouse=True)
+def fast_reconnect(monkeypatch):
+    monkeypatch.setattr(ws_stream, "RECONNECT_DELAY", 0.01)
+
+
+def test_stream_applies_recorded_messages():
+    script = {
+        "ETH-USD": [
+            snapshot("ETH-USD", [("10", "1")], [("11", "1")]),
+            delta("ETH-USD", 1, bids=[("10.5", "2")]),
+            delta("ETH-USD", 2, asks=[("11", "0"), ("10.8", "4")]),
+        ]
+    }
+    server = FakeWsServer([script]).start()
+    try:
+        stream, samples = run_stream(
+            server,
+            ["ETH-USD"],
+            lambda s, _: server.sent == 3 and s.books["ETH-USD"].offset == 2,
+        )
+    finally:
+        server.stop()
+    top = stream.books["ETH-USD"].top()
+    assert (top.bid_price, top.bid_size, top.ask_price, top.ask_size) == (
+        10.5,
+        2.0,
+        10.8,
+        4.0,
+    )
+    assert samples[-1]["ETH-USD"] == top
+
+
+def test_reconnect_resyncs_from_a_fresh_snapshot():
+    first = {
+        "BTC-USD": [
+            snapshot("BTC-USD", [("100", "1"), ("99", "1")], [("101", "1")]),
+            delta("BTC-USD", 3, bids=[("100.5", "7")]),
+            delta("BTC-USD", 4, bids=[("100.6", "7")]),  # never sent, dropped first
+        ]
+    }
+    # after the drop the book moved on; offsets restart lower than before
+    second = {
+        "BTC-USD": [
+            snapshot("BTC-USD", [("90", "2")], [("91", "3")], offset=1),
+            delta("BTC-USD", 2, asks=[("90.5", "1")]),
+        ]
+    }
+    server = FakeWsServer([first, second], drop_after=2).start()
+    try:
+        stream, samples = run_stream(
+            server,
+            ["BTC-USD"],
+            lambda s, _: server.connections == 2
+            and s.books["BTC-USD"].offset == 2
+            and "90.5" in s.books["BTC-USD"].asks,
+        )
+    finally:
+        server.stop()
+    book = stream.books["BTC-USD"]
+    assert server.connections == 2
+    # nothing from before the drop survives the resync
+    assert set(book.bids) == {"90"}
+    assert set(book.asks) == {"90.5", "91"}
+    top = book.top()
+    assert (top.bid_price, top.ask_price, top.ask_size) == (90.0, 90.5, 1.0)
+    assert samples[0]["BTC-USD"].bid_price == 100.0
+
+
+# =============================================================================
+# store_tops: A WS SAMPLE STORES IN EVERY STORAGE MODE, GRADED LIKE REST
+# =============================================================================
+def stored_quality(mode, s3, wal):
+    import io
+    import pandas as pd
+    import main
+    from wide_snapshot import decode_frame, FIELDS
+
+    if mode == "wide":
+        (body,) = s3.objects.values()
+        _, markets, _, values = decode_frame(body)
+        return {m: values[i, 0, FIELDS.index("quality")] for i, m in enumerate(markets)}
+    if mode == "wal":
+        bodies = {m: open(path).read() for m, _, path in wal.files()}
+        header = ",".join(main.CSV_HEADER) + "\n"
+        bodies = {m: header + body for m, body in bodies.items()}
+    else:
+        bodies = {
+            key.split("/")[0]: body.decode() for (_, key), body in s3.objects.items()
+        }
+    return {
+        m: pd.read_csv(io.StringIO(b))["quality"].iloc[0] for m, b in bodies.items()
+    }
+
+
+@pytest.mark.parametrize(
+    "offline_main",
+    [{"STORAGE_MODE": mode} for mode in ["segments", "wal", "wide"]],
+    indirect=True,
+    ids=["segments", "wal", "wide"],
+)
+def test_store_tops_in_every_storage_mode(offline_main, capsys):
+    import datetime as dt
+    from quality import CROSSED
+    from top_of_book import TopOfBook
+
+    main = offline_main
+    tops = {
+        "BTC-USD": TopOfBook("BTC-USD", 100.0, 1.0, 101.0, 2.0),
+        "ETH-USD": TopOfBook("ETH-USD", 11.0, 1.0, 10.0, 2.0),
+    }
+    ws_stream.store_tops(tops, dt.datetime(2024, 1, 1, 12, tzinfo=dt.timezone.utc))
+    main.flush_wide_writer()
+
+    assert "Failed" not in capsys.readouterr().out
+    quality = stored_quality(main.STORAGE_MODE, main.S3, main.WAL)
+    assert quality["BTC-USD"] == 0
+    assert int(quality["ETH-USD"]) & CROSSED
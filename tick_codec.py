@@ -0,0 +1,249 @@
+# =============================================================================
+# IMPORTS
+# =============================================================================
+import json, struct
+import numpy as np
+
+# =============================================================================
+# TICK-QUANTIZED COLUMNS, DELTA-OF-DELTA TIMESTAMPS, VARINT PACKED
+#
+# Layout, little endian:
+#   magic "DXTK" | u16 version | u32 header length | header JSON
+#   timestamps                       varints, zigzag delta-of-delta
+#   per column: [null bitmap] values
+#
+# The header says how every column was encoded, including its scale, so a
+# file never depends on today's tick sizes: data written before a tick size
+# change decodes exactly as it was written.
+#
+# Column kinds:
+#   "q"     int64(round(value / scale)) -> zigzag delta -> varints; decoded
+#           as counts * scale rounded to `decimals`, bit-identical to the
+#           floats that went in (checked when encoding); integer columns
+#           come back as int64
+#   "f8"    raw float64, for columns that aren't on any grid
+#   "json"  anything else, as a JSON list
+# A column with NaNs stores a packed bitmap of them and only the other rows.
+# =============================================================================
+MAGIC = b"DXTK"
+VERSION = 1
+PREAMBLE = struct.Struct("<4sHI")
+MAX_DECIMALS = 12
+
+
+# =============================================================================
+# VARINTS, VECTORIZED: NO PYTHON LOOP OVER VALUES
+# =============================================================================
+def zigzag(values):
+    values = values.astype(np.int64)
+    return ((values << 1) ^ (values >> 63)).view(np.uint64)
+
+
+def unzigzag(values):
+    values = values.astype(np.uint64)
+    return (values >> np.uint64(1)).view(np.int64) ^ -(values & np.uint64(1)).view(
+        np.int64
+    )
+
+
+def encode_varints(values):
+    values = np.asarray(values, dtype=np.uint64)
+    n_bytes = np.ones(len(values), dtype=np.int64)
+    for k in range(1, 10):
+        n_bytes += values >= np.uint64(1 << (7 * k))
+    starts = np.cumsum(n_bytes) - n_bytes
+    out = np.empty(int(n_bytes.sum()), dtype=np.uint8)
+    for k in range(int(n_bytes.max()) if len(values) else 0):
+        at = n_bytes > k
+        byte = (values[at] >> np.uint64(7 * k)) & np.uint64(0x7F)
+        more = (n_bytes[at] > k + 1).astype(np.uint64) << np.uint64(7)
+        out[starts[at] + k] = (byte | more).astype(np.uint8)
+    return out.tobytes()
+
+
+def decode_varints(data):
+    # every byte shifted into place, then one sum per varint (the bits don't
+    # overlap, so the sum is the OR)
+    raw = np.frombuffer(data, dtype=np.uint8)
+    if not len(raw):
+        return np.zeros(0, dtype=np.uint64)
+    last = raw < 0x80
+    starts = np.flatnonzero(np.concatenate([[True], last[:-1]]))
+    group = np.cumsum(last) - last
+    shift = (np.arange(len(raw)) - starts[group]) * 7
+    parts = (raw & 0x7F).astype(np.uint64) << shift.astype(np.uint64)
+    return np.add.reduceat(parts, starts)
+
+
+# =============================================================================
+# QUANTIZING
+# =============================================================================
+def scale_decimals(scale):
+    # decimals needed to write the grid exactly: 0.01 -> 2, 0.005 -> 3, 5 -> 0
+    for d in range(MAX_DECIMALS + 1):
+        if abs(round(scale * 10**d) - scale * 10**d) < 1e-9:
+            return d
+    return None
+
+
+def dequantize(counts, scale, decimals):
+    return np.round(counts * scale, decimals)
+
+
+def quantize(values, scale):
+    # counts if every value is on the grid (exactly, after decoding), else None
+    decimals = scale_decimals(scale)
+    if decimals is None:
+        return None, None
+    with np.errstate(invalid="ignore", over="ignore"):
+        counts = np.rint(values / scale)
+    if not np.all(np.abs(counts) < 2**62):
+        return None, None
+    counts = counts.astype(np.int64)
+    if not np.array_equal(dequantize(counts, scale, decimals), values):
+        return None, None
+    return counts, decimals
+
+
+def infer_scale(values):
+    # the coarsest power of ten grid the values sit on
+    for d in range(MAX_DECIMALS + 1):
+        counts, decimals = quantize(values, 10.0**-d)
+        if counts is not None:
+            return 10.0**-d, counts, decimals
+    return None, None, None
+
+
+# =============================================================================
+# ENCODE
+#
+# timestamps: int64 ns since epoch. columns: {name: array}. scales: {name:
+# grid step} for the columns with a known grid (tick size, step size); the
+# rest get the grid they actually sit on, or none at all. `meta` goes into
+# the header as is (tick / step size the scales came from).
+# =============================================================================
+def encode(timestamps, columns, scales=None, meta=None):
+    scales = scales or {}
+    timestamps = np.asarray(timestamps, dtype=np.int64)
+    unit = 1000 if np.all(timestamps % 1000 == 0) else 1
+    ticks = timestamps // unit
+    delta = np.diff(ticks, prepend=np.int64(0))
+    ts_body = encode_varints(zigzag(np.diff(delta, prepend=np.int64(0))))
+
+    header_columns, bodies = [], [ts_body]
+    for name, values in columns.items():
+        column, body = encode_column(name, values, scales.get(name))
+        header_columns.append(column)
+        bodies.append(body)
+
+    header = json.dumps(
+        {
+            "n_rows": len(timestamps),
+            "ts_unit": unit,
+            "ts_bytes": len(ts_body),
+            "columns": header_columns,
+            "meta": meta or {},
+        },
+        separators=(",", ":"),
+    ).encode("utf-8")
+    return b"".join([PREAMBLE.pack(MAGIC, VERSION, len(header)), header] + bodies)
+
+
+def encode_column(name, values, scale=None):
+    values = np.asarray(values)
+    if values.dtype.kind not in "iufb":
+        body = json.dumps([clean_json(v) for v in values.tolist()]).encode("utf-8")
+        return {"name": name, "kind": "json", "bytes": len(body)}, body
+
+    integer = values.dtype.kind in "iub"
+    values = values.astype(np.float64)
+    nulls = np.isnan(values)
+    bitmap = np.packbits(nulls).tobytes() if nulls.any() else b""
+    present = values[~nulls]
+
+    counts = None
+    if scale is not None:
+        counts, decimals = quantize(present, scale)
+    if counts is None:
+        scale, counts, decimals = infer_scale(present)
+    if counts is None:
+        body = bitmap + present.astype("<f8").tobytes()
+        column = {"name": name, "kind": "f8", "nulls": len(bitmap)}
+    else:
+        body = bitmap + encode_varints(zigzag(np.diff(counts, prepend=np.int64(0))))
+        column = {
+            "name": name,
+            "kind": "q",
+            "scale": scale,
+            "decimals": decimals,
+            "nulls": len(bitmap),
+        }
+        if integer:
+            column["int"] = True
+    column["bytes"] = len(body)
+    return column, body
+
+
+def clean_json(value):
+    # NaN isn't JSON
+    if isinstance(value, float) and value != value:
+        return None
+    return value
+
+
+# =============================================================================
+# DECODE, ONLY THE COLUMNS ASKED FOR ARE TOUCHED
+# =============================================================================
+def decode_header(data):
+    magic, version, header_len = PREAMBLE.unpack_from(data)
+    if magic != MAGIC:
+        raise Exception("Not a tick encoded file")
+    if version != VERSION:
+        raise Exception(f"Unsupported tick encoding version {version}")
+    header = json.loads(data[PREAMBLE.size : PREAMBLE.size + header_len])
+    header["data_offset"] = PREAMBLE.size + header_len
+    return header
+
+
+def decode(data, names=None):
+    # -> (timestamps int64 ns, {name: array}, header)
+    header = decode_header(data)
+    n = header["n_rows"]
+    offset = header["data_offset"]
+    ts_body = data[offset : offset + header["ts_bytes"]]
+    timestamps = np.cumsum(np.cumsum(unzigzag(decode_varints(ts_body))))
+    timestamps = timestamps * header["ts_unit"]
+    offset += header["ts_bytes"]
+
+    columns = {}
+    for column in header["columns"]:
+        body = data[offset : offset + column["bytes"]]
+        offset += column["bytes"]
+        if names is None or column["name"] in names:
+            columns[column["name"]] = decode_column(column, body, n)
+    return timestamps, columns, header
+
+
+def decode_column(column, body, n):
+    if column["kind"] == "json":
+        return np.array(json.loads(body), dtype=object)
+
+    nulls = None
+    if column["nulls"]:
+        bits = np.frombuffer(body[: column["nulls"]], dtype=np.uint8)
+        nulls = np.unpackbits(bits, count=n).astype(bool)
+        body = body[column["nulls"] :]
+
+    if column["kind"] == "f8":
+        present = np.frombuffer(body, dtype="<f8").astype(np.float64)
+    else:
+        counts = np.cumsum(unzigzag(decode_varints(body)))
+        present = dequantize(counts, column["scale"], column["decimals"])
+        if column.get("int"):
+            return counts * int(column["scale"])
+
+    if nulls is None:
+        return present
+    values = np.full(n, np.nan)
+    values[~nulls] = present
+    return values
@@ -0,0 +1,99 @@
+# =============================================================================
+# TOP OF BOOK RECORD
+# =============================================================================
+class TopOfBook:
+    __slots__ = ("market", "bid_price", "bid_size", "ask_price", "ask_size")
+
+    def __init__(self, market, bid_price, bid_size, ask_price, ask_size):
+        self.market = market
+        self.bid_price = bid_price
+        self.bid_size = bid_size
+        self.ask_price = ask_price
+        self.ask_size = ask_size
+
+    @property
+    def mid(self):
+        return (self.bid_price + self.ask_price) / 2
+
+    def as_dict(self):
+        return {
+            "market": self.market,
+            "ask_price": self.ask_price,
+            "ask_size": self.ask_size,
+            "bid_price": self.bid_price,
+            "bid_size": self.bid_size,
+        }
+
+    def __eq__(self, other):
+        if not isinstance(other, TopOfBook):
+            return NotImplemented
+        fields = TopOfBook.__slots__
+        return all(getattr(self, s) == getattr(other, s) for s in fields)
+
+    def __repr__(self):
+        return (
+            f"TopOfBook({self.market} bid={self.bid_price}x{self.bid_size} "
+            f"ask={self.ask_price}x{self.ask_size})"
+        )
+
+
+# =============================================================================
+# TOP OF BOOK FROM ANY VENUE, STAMPED WITH WHEN IT ARRIVED (UNIX SECONDS)
+# =============================================================================
+class Quote(TopOfBook):
+    __slots__ = ("venue", "received")
+
+    def __init__(
+        self, venue, market, bid_price, bid_size, ask_price, ask_size, received=None
+    ):
+        super().__init__(market, bid_price, bid_size, ask_price, ask_size)
+        self.venue = venue
+        self.received = received
+
+    @classmethod
+    def from_top(cls, venue, top, received=None):
+        return cls(
+            venue,
+            top.market,
+            top.bid_price,
+            top.bid_size,
+            top.ask_price,
+            top.ask_size,
+            received,
+        )
+
+    def __repr__(self):
+        return f"{self.venue}:{super().__repr__()}"
+
+
+# =============================================================================
+# PARSE BEST BID / ASK STRAIGHT FROM THE RAW dYdX JSON
+#
+# dYdX sends bids best-first (descending) and asks best-first (ascending). We
+# trust that order and only compare the first two levels; if they're out of
+# order we fall back to a full scan of the side.
+# =============================================================================
+def parse_top_of_book(market, orderbook):
+    bid_price, bid_size = best_bid(orderbook["bids"])
+    ask_price, ask_size = best_ask(orderbook["asks"])
+    return TopOfBook(market, bid_price, bid_size, ask_price, ask_size)
+
+
+def best_bid(levels):
+    price = float(levels[0]["price"])
+    if len(levels) > 1 and float(levels[1]["price"]) > price:
+        level = max(levels, key=level_price)
+        return float(level["price"]), float(level["size"])
+    return price, float(levels[0]["size"])
+
+
+def best_ask(levels):
+    price = float(levels[0]["price"])
+    if len(levels) > 1 and float(levels[1]["price"]) < price:
+        level = min(levels, key=level_price)
+        return float(level["price"]), float(level["size"])
+    return price, float(levels[0]["size"])
+
+
+def level_price(level):
+    return float(level["price"])
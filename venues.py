@@ -0,0 +1,326 @@
+# =============================================================================
+# IMPORTS
+# =============================================================================
+import os, abc, json, time, asyncio
+import http_client
+from constants import DYDX_URL
+from top_of_book import Quote, parse_top_of_book
+from fetch_scheduler import TokenBucket, RateLimited, retry_after_from_response
+from quality import MISSING
+
+# =============================================================================
+# EXCHANGE ADAPTERS
+#
+# An adapter only knows its venue's wire format:
+#   requests(markets) -> [(url, params, markets covered), ...]
+#   parse(markets, payload) -> {market: TopOfBook}
+#   refused(markets, payload) -> requests to send instead of one the venue
+#       answered with a 400, or None to fail it
+#   levels(payload, depth) -> (bids, asks), the top `depth` raw levels of a
+#       book, or None when the venue only gives the top of book
+#   tick_size(market) -> the market's tick for grading, or None to only judge
+#       its spreads relatively
+# Sending is done by fetch_quotes / fetch_quotes_async below, so the same
+# adapter serves one-shot runs, the daemon and anything else. dYdX's own
+# per-market retries and deadline are main.py / daemon.py's, they only use
+# its adapter for the request and the parsing. Markets are always named the
+# dYdX way ("BTC-USD"), each adapter maps to its symbols.
+# =============================================================================
+BINANCE_API_URL = os.getenv("BINANCE_API_URL", "https://api.binance.com/api/v3")
+BINANCE_QUOTE = os.getenv("BINANCE_QUOTE", "BUSD")
+
+
+class ExchangeAdapter(abc.ABC):
+    name = None
+    rate = 10.0  # requests per second, shared by every fetch for this venue
+
+    def __init__(self, bucket=None):
+        self.bucket = bucket or TokenBucket(self.rate)
+
+    def symbol(self, market):
+        return market
+
+    @abc.abstractmethod
+    def requests(self, markets):
+        pass
+
+    @abc.abstractmethod
+    def parse(self, markets, payload):
+        pass
+
+    def refused(self, markets, payload):
+        return None
+
+    def levels(self, payload, depth):
+        return None
+
+    def tick_size(self, market):
+        return None
+
+
+# =============================================================================
+# dYdX: ONE /orderbook/{market} REQUEST PER MARKET
+#
+# market_params: returns {market: {"price_rounder": tick, ...}}, main.py
+# passes load_market_params so the tick sizes are fetched on first use.
+# =============================================================================
+class DydxAdapter(ExchangeAdapter):
+    name = "dydx"
+    rate = 15.0
+
+    def __init__(self, base_url=DYDX_URL, bucket=None, market_params=None):
+        super().__init__(bucket)
+        self.base_url = base_url
+        self.market_params = market_params
+
+    def requests(self, markets):
+        return [(f"{self.base_url}/orderbook/{m}", None, [m]) for m in markets]
+
+    def parse(self, markets, payload):
+        # always one book, requests() never covers two markets
+        return {markets[0]: parse_top_of_book(markets[0], payload)}
+
+    def levels(self, payload, depth):
+        return payload["bids"][:depth], payload["asks"][:depth]
+
+    def tick_size(self, market):
+        if self.market_params is None:
+            return None
+        return self.market_params()[market]["price_rounder"]
+
+
+# =============================================================================
+# BINANCE: ONE /ticker/bookTicker REQUEST FOR EVERY MARKET, /klines FOR
+# backfill.py AND gap_filler.py
+#
+# A symbol Binance doesn't list fails the whole batch with -1121. The batch is
+# then retried one symbol at a time, and the ones refused on their own are
+# left out of every request after that.
+# =============================================================================
+BINANCE_INVALID_SYMBOL = -1121
+
+# dYdX market -> Binance symbol, when it isn't just {base}{quote}
+SYMBOL_OVERRIDES = {
+    "LUNA-USD": "LUNCBUSD",
+}
+
+
+def to_source_symbol(market, quote=BINANCE_QUOTE):
+    if market in SYMBOL_OVERRIDES:
+        return SYMBOL_OVERRIDES[market]
+    return f"{market.split('-')[0]}{quote}"
+
+
+class BinanceAdapter(ExchangeAdapter):
+    name = "binance"
+    rate = 10.0
+
+    def __init__(self, base_url=BINANCE_API_URL, quote=BINANCE_QUOTE, bucket=None):
+        super().__init__(bucket)
+        self.base_url = base_url
+        self.quote = quote
+        self.unlisted = set()
+
+    def symbol(self, market):
+        return to_source_symbol(market, self.quote)
+
+    def requests(self, markets):
+        markets = [m for m in markets if m not in self.unlisted]
+        if not markets:
+            return []
+        symbols = json.dumps([self.symbol(m) for m in markets], separators=(",", ":"))
+        return [(f"{self.base_url}/ticker/bookTicker", {"symbols": symbols}, markets)]
+
+    def refused(self, markets, payload):
+        if not isinstance(payload, dict):
+            return None
+        if payload.get("code") != BINANCE_INVALID_SYMBOL:
+            return None
+        if len(markets) == 1:
+            print(f"{self.name} doesn't list {self.symbol(markets[0])}, skipping it")
+            self.unlisted.add(markets[0])
+            return []
+        url = f"{self.base_url}/ticker/bookTicker"
+        return [(url, {"symbol": self.symbol(m)}, [m]) for m in markets]
+
+    def parse(self, markets, payload):
+        # a list for "symbols", a single ticker for "symbol"
+        if isinstance(payload, dict):
+            payload = [payload]
+        by_symbol = {t["symbol"]: t for t in payload}
+        tops = {}
+        for market in markets:
+            t = by_symbol.get(self.symbol(market))
+            if t is not None:
+                tops[market] = Quote(
+                    self.name,
+                    market,
+                    float(t["bidPrice"]),
+                    float(t["bidQty"]),
+                    float(t["askPrice"]),
+                    float(t["askQty"]),
+                )
+        return tops
+
+    def kline_request(self, market, interval, start_ms, end_ms, limit):
+        params = {
+            "symbol": self.symbol(market),
+            "interval": interval,
+            "startTime": start_ms,
+            "endTime": end_ms - 1,
+            "limit": limit,
+        }
+        return f"{self.base_url}/klines", params
+
+    def parse_klines(self, payload):
+        # [open time, open, high, low, close, volume], the rest is dropped
+        return [k[0:6] for k in payload]
+
+
+# =============================================================================
+# REGISTRY
+#
+# The venues VENUES can list next to dYdX, which main.py always fetches.
+# =============================================================================
+ADAPTERS = {adapter.name: adapter for adapter in (BinanceAdapter,)}
+
+
+def get_adapter(name, **kwargs):
+    try:
+        return ADAPTERS[name](**kwargs)
+    except KeyError:
+        raise Exception(f"Unknown venue: {name}, one of {list(ADAPTERS)}")
+
+
+def venue_market(venue, market):
+    # name a venue's series is stored under; dYdX keeps the original layout
+    return market if venue == "dydx" else f"{market}.{venue}"
+
+
+# =============================================================================
+# SEND: SYNC (http_client) AND ASYNC (aiohttp), SAME RESULT SHAPE
+#
+# Returns {market: Quote} with `received` set to when the response arrived.
+# A request that fails leaves its markets out, the caller decides on nan
+# rows; 429 / 418 raise RateLimited so the caller can back off.
+# =============================================================================
+def to_quotes(adapter, markets, payload, received):
+    return {
+        market: Quote.from_top(adapter.name, top, received)
+        for market, top in adapter.parse(markets, payload).items()
+    }
+
+
+def check_status(status, res):
+    if status in (418, 429):
+        raise RateLimited(retry_after_from_response(res))
+
+
+def error_payload(text):
+    try:
+        return json.loads(text)
+    except ValueError:
+        return None
+
+
+def fetch_quotes(adapter, markets, timeout=None):
+    quotes = {}
+    pending = adapter.requests(markets)
+    while pending:
+        url, params, covered = pending.pop(0)
+        adapter.bucket.acquire()
+        res = http_client.get(url, params=params, timeout=timeout)
+        check_status(res.status_code, res)
+        if res.status_code == 400:
+            instead = adapter.refused(covered, error_payload(res.text))
+            if instead is not None:
+                pending += instead
+                continue
+        res.raise_for_status()
+        quotes.update(to_quotes(adapter, covered, res.json(), time.time()))
+    return quotes
+
+
+async def fetch_quotes_async(session, adapter, markets, timeout):
+    import aiohttp
+
+    async def one(url, params, covered):
+        await asyncio.sleep(adapter.bucket.reserve())
+        async with session.get(
+            url, params=params, timeout=aiohttp.ClientTimeout(total=timeout)
+        ) as res:
+            check_status(res.status, res)
+            instead = None
+            if res.status == 400:
+                instead = adapter.refused(covered, error_payload(await res.text()))
+            if instead is None:
+                res.raise_for_status()
+                payload = await res.json(content_type=None)
+                return to_quotes(adapter, covered, payload, time.time())
+        return await gather_quotes(adapter, [one(*request) for request in instead])
+
+    return await gather_quotes(
+        adapter, [one(*request) for request in adapter.requests(markets)]
+    )
+
+
+async def gather_quotes(adapter, requests):
+    results = await asyncio.gather(*requests, return_exceptions=True)
+    quotes = {}
+    for result in results:
+        if isinstance(result, Exception):
+            print(f"{adapter.name} fetch failed: {result}")
+            continue
+        quotes.update(result)
+    return quotes
+
+
+# =============================================================================
+# EVERY VENUE AT THE SAME INSTANT, ALL REQUESTS START TOGETHER
+#
+# venues: {adapter: markets}. The result is {(venue, market): Quote}; the
+# caller stamps everything with the shared tick time, `received` says how
+# far apart the venues really were.
+# =============================================================================
+async def snapshot_venues(session, venues, timeout):
+    adapters = list(venues)
+    results = await asyncio.gather(
+        *(fetch_quotes_async(session, a, venues[a], timeout) for a in adapters)
+    )
+    quotes = {}
+    for adapter, venue_quotes in zip(adapters, results):
+        for market, quote in venue_quotes.items():
+            quotes[(adapter.name, market)] = quote
+    return quotes
+
+
+def venue_rows(venue, markets, quotes):
+    # storage rows, a nan row for every market the venue didn't answer for
+    rows = []
+    for market in markets:
+        quote = quotes.get(market)
+        if quote is None:
+            row = {
+                "ask_price": float("nan"),
+                "ask_size": float("nan"),
+                "bid_price": float("nan"),
+                "bid_size": float("nan"),
+                "quality": MISSING,
+            }
+        else:
+            row = quote.as_dict()
+        row["market"] = venue_market(venue, market)
+        rows.append(row)
+    return rows
+
+
+def venue_skew(received):
+    # {(venue, market): arrival time} -> {market: spread across venues, s}
+    by_market = {}
+    for (venue, market), ts in received.items():
+        by_market.setdefault(market, []).append(ts)
+    return {
+        market: max(times) - min(times)
+        for market, times in by_market.items()
+        if len(times) > 1
+    }
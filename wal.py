@@ -0,0 +1,210 @@
+# =============================================================================
+# IMPORTS
+# =============================================================================
+import os, time, threading
+import datetime as dt
+from segment_writer import put_segment
+
+# =============================================================================
+# CONSTANTS
+# =============================================================================
+# One append-only file per market per day, with a sidecar holding the number of
+# bytes already shipped to S3:
+#   {directory}/{market}/{market}_{today}.wal
+#   {directory}/{market}/{market}_{today}.wal.offset
+WAL_SUFFIX = ".wal"
+OFFSET_SUFFIX = ".offset"
+# ship a market once it has this many unshipped rows, or this many seconds
+# passed; `python wal.py` and daemon.py's flusher both go by these
+WAL_FLUSH_INTERVAL = float(os.getenv("WAL_FLUSH_INTERVAL", 60))
+WAL_FLUSH_ROWS = int(os.getenv("WAL_FLUSH_ROWS", 500))
+
+
+# =============================================================================
+# LOCAL WRITE-AHEAD LOG, THIS IS WHAT main() WRITES TO
+# =============================================================================
+class WriteAheadLog:
+    def __init__(self, directory, columns):
+        self.directory = directory
+        self.columns = columns
+
+    def path(self, market, today):
+        return os.path.join(self.directory, market, f"{market}_{today}{WAL_SUFFIX}")
+
+    def append(self, market, today, row):
+        self.append_many(market, today, [row])
+
+    def append_many(self, market, today, rows):
+        path = self.path(market, today)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        lines = "".join(
+            ",".join(str(row[col]) for col in self.columns) + "\n" for row in rows
+        )
+        # single write on an O_APPEND fd, fsync'd before we return
+        fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, lines.encode("utf-8"))
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def files(self):
+        if not os.path.isdir(self.directory):
+            return []
+        found = []
+        for market in sorted(os.listdir(self.directory)):
+            market_dir = os.path.join(self.directory, market)
+            if not os.path.isdir(market_dir):
+                continue
+            for name in sorted(os.listdir(market_dir)):
+                if not name.endswith(WAL_SUFFIX):
+                    continue
+                today = name[len(market) + 1 : -len(WAL_SUFFIX)]
+                found.append((market, today, os.path.join(market_dir, name)))
+        return found
+
+    def header(self):
+        return ",".join(self.columns) + "\n"
+
+
+# =============================================================================
+# OFFSET BOOKKEEPING, WRITTEN ATOMICALLY SO A CRASH NEVER LOSES PROGRESS
+# =============================================================================
+def read_offset(path):
+    try:
+        with open(path + OFFSET_SUFFIX) as f:
+            return int(f.read().strip() or 0)
+    except FileNotFoundError:
+        return 0
+
+
+def write_offset(path, offset):
+    tmp = path + OFFSET_SUFFIX + ".tmp"
+    with open(tmp, "w") as f:
+        f.write(str(offset))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path + OFFSET_SUFFIX)
+
+
+# =============================================================================
+# READ EVERYTHING AFTER offset, ONLY UP TO THE LAST COMPLETE LINE
+# =============================================================================
+def read_pending(path, offset):
+    with open(path, "rb") as f:
+        f.seek(offset)
+        chunk = f.read()
+    end = chunk.rfind(b"\n") + 1
+    return chunk[:end]
+
+
+# =============================================================================
+# SHIPS BATCHES FROM THE WAL TO S3 AS SEGMENTS
+#
+# A batch goes out once a file has `max_rows` pending rows or `interval`
+# seconds passed since its last flush. Segment keys are derived from the byte
+# range they cover, so replaying a batch after a crash overwrites the same
+# object instead of duplicating it.
+# =============================================================================
+class WalFlusher:
+    def __init__(
+        self,
+        wal,
+        s3,
+        bucket,
+        interval=WAL_FLUSH_INTERVAL,
+        max_rows=WAL_FLUSH_ROWS,
+        poll=1.0,
+    ):
+        self.wal = wal
+        self.s3 = s3
+        self.bucket = bucket
+        self.interval = interval
+        self.max_rows = max_rows
+        self.poll = poll
+        self.last_flush = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def flush(self, force=False):
+        shipped = 0
+        current_day = dt.datetime.now(dt.timezone.utc).date()
+        # files are kept a day past their date so late rows never restart at
+        # offset 0 and overwrite an already shipped segment key
+        stale_day = str(current_day - dt.timedelta(days=1))
+        for market, today, path in self.wal.files():
+            offset = read_offset(path)
+            chunk = read_pending(path, offset)
+            finished_day = today < str(current_day)
+            if chunk and self._due(path, chunk, force or finished_day):
+                shipped += self._ship(market, today, path, offset, chunk)
+                chunk = b""
+            if today < stale_day and not chunk:
+                self._remove(path)
+        return shipped
+
+    def flush_day(self, day):
+        # everything still pending for one day, e.g. right before compacting it
+        shipped = 0
+        for market, today, path in self.wal.files():
+            if today != day:
+                continue
+            offset = read_offset(path)
+            chunk = read_pending(path, offset)
+            if chunk:
+                shipped += self._ship(market, today, path, offset, chunk)
+        return shipped
+
+    def _ship(self, market, today, path, offset, chunk):
+        end = offset + len(chunk)
+        body = self.wal.header() + chunk.decode("utf-8")
+        seg_id = f"wal-{offset:012d}-{end:012d}"
+        put_segment(self.s3, self.bucket, market, today, body, seg_id)
+        write_offset(path, end)
+        self.last_flush[path] = time.monotonic()
+        return chunk.count(b"\n")
+
+    def _due(self, path, chunk, force):
+        if force or path not in self.last_flush:
+            return True
+        if self.max_rows and chunk.count(b"\n") >= self.max_rows:
+            return True
+        return time.monotonic() - self.last_flush[path] >= self.interval
+
+    def _remove(self, path):
+        for p in (path, path + OFFSET_SUFFIX):
+            if os.path.exists(p):
+                os.remove(p)
+        self.last_flush.pop(path, None)
+
+    # =========================================================================
+    # BACKGROUND LOOP
+    # =========================================================================
+    def run(self):
+        while not self._stop.is_set():
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"WAL flush failed: {e}")
+            self._stop.wait(self.poll)
+        self.flush(force=True)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+
+if __name__ == "__main__":
+    from main import S3, BUCKET_NAME, WAL
+
+    flusher = WalFlusher(WAL, S3, BUCKET_NAME)
+    try:
+        flusher.run()
+    except KeyboardInterrupt:
+        flusher.flush(force=True)
@@ -0,0 +1,200 @@
+# =============================================================================
+# IMPORTS
+# =============================================================================
+import json, struct, threading
+import datetime as dt
+import numpy as np
+import pandas as pd
+from segment_writer import segment_id
+
+# =============================================================================
+# CONSTANTS
+# =============================================================================
+# One object per tick (or batch of ticks) holding every market side by side:
+#   snapshots/{today}/{segment_id}.dxw
+#
+# Layout, little endian:
+#   magic "DXWS" | u16 version | u32 header length | header JSON
+#   i64[n_ticks]                       timestamps, ns since epoch (UTC)
+#   f64[n_markets][n_ticks][n_fields]  values, market-major
+#
+# Market-major means one market's series is a single contiguous byte range,
+# so the reader can pull it out with one ranged GET.
+MAGIC = b"DXWS"
+VERSION = 1
+PREAMBLE = struct.Struct("<4sHI")
+HEADER_PROBE = 4096
+FIELDS = ["bid_price", "ask_price", "mid", "bid_size", "ask_size", "quality"]
+EXTENSION = "dxw"
+
+
+def snapshot_prefix(today):
+    return f"snapshots/{today}/"
+
+
+# =============================================================================
+# ENCODE / DECODE
+# =============================================================================
+def encode_frame(timestamps, markets, values, fields=FIELDS):
+    values = np.ascontiguousarray(values, dtype="<f8")
+    n_markets, n_ticks, n_fields = values.shape
+    header = json.dumps(
+        {"markets": list(markets), "fields": list(fields), "n_ticks": n_ticks}
+    ).encode("utf-8")
+    return b"".join(
+        [
+            PREAMBLE.pack(MAGIC, VERSION, len(header)),
+            header,
+            np.asarray(timestamps, dtype="<i8").tobytes(),
+            values.tobytes(),
+        ]
+    )
+
+
+def decode_header(data):
+    magic, version, header_len = PREAMBLE.unpack_from(data)
+    if magic != MAGIC:
+        raise Exception("Not a wide snapshot frame")
+    if version != VERSION:
+        raise Exception(f"Unsupported wide snapshot version {version}")
+    header = json.loads(data[PREAMBLE.size : PREAMBLE.size + header_len])
+    header["data_offset"] = PREAMBLE.size + header_len
+    return header
+
+
+def decode_frame(data):
+    header = decode_header(data)
+    n_ticks, n_markets = header["n_ticks"], len(header["markets"])
+    offset = header["data_offset"]
+    timestamps = np.frombuffer(data, dtype="<i8", count=n_ticks, offset=offset)
+    values = np.frombuffer(
+        data,
+        dtype="<f8",
+        count=n_markets * n_ticks * len(header["fields"]),
+        offset=offset + 8 * n_ticks,
+    ).reshape(n_markets, n_ticks, len(header["fields"]))
+    return timestamps, header["markets"], header["fields"], values
+
+
+def market_byte_range(header, market):
+    n_ticks, n_fields = header["n_ticks"], len(header["fields"])
+    block = 8 * n_ticks * n_fields
+    first = header["data_offset"] + 8 * n_ticks
+    start = first + header["markets"].index(market) * block
+    return start, start + block - 1
+
+
+# =============================================================================
+# WRITER, ONE PUT PER TICK OR PER `batch_ticks` TICKS
+# =============================================================================
+class WideSnapshotWriter:
+    def __init__(self, s3, bucket, markets, batch_ticks=1):
+        self.s3 = s3
+        self.bucket = bucket
+        self.markets = list(markets)
+        self.index = {market: i for i, market in enumerate(self.markets)}
+        self.batch_ticks = batch_ticks
+        self.buffer = []  # (now_s, today, values[n_markets, n_fields])
+        self.lock = threading.Lock()
+
+    def add(self, rows, now_s, today):
+        values = np.full((len(self.markets), len(FIELDS)), np.nan)
+        for bid_ask in rows:
+            i = self.index.get(bid_ask["market"])
+            if i is not None:
+                values[i] = [bid_ask[field] for field in FIELDS]
+        with self.lock:
+            if self.buffer and self.buffer[0][1] != today:
+                self._flush()
+            self.buffer.append((now_s, today, values))
+            if len(self.buffer) >= self.batch_ticks:
+                return self._flush()
+
+    def flush(self):
+        with self.lock:
+            return self._flush()
+
+    def _flush(self):
+        if not self.buffer:
+            return None
+        buffer = sorted(self.buffer, key=lambda b: b[0])
+        self.buffer = []
+        first_s, today, _ = buffer[0]
+        timestamps = [timestamp_ns(now_s) for now_s, _, _ in buffer]
+        values = np.stack([v for _, _, v in buffer], axis=1)
+        key = f"{snapshot_prefix(today)}{segment_id(first_s)}.{EXTENSION}"
+        body = encode_frame(timestamps, self.markets, values)
+        self.s3.put_object(Bucket=self.bucket, Key=key, Body=body)
+        return key
+
+
+def timestamp_ns(now_s):
+    ts = dt.datetime.fromisoformat(now_s).replace(tzinfo=dt.timezone.utc)
+    epoch = dt.datetime(1970, 1, 1, tzinfo=dt.timezone.utc)
+    return (ts - epoch) // dt.timedelta(microseconds=1) * 1000
+
+
+# =============================================================================
+# READERS
+# =============================================================================
+def list_snapshots(s3, bucket, today):
+    keys = []
+    kwargs = {"Bucket": bucket, "Prefix": snapshot_prefix(today)}
+    while True:
+        res = s3.list_objects_v2(**kwargs)
+        keys += [obj["Key"] for obj in res.get("Contents", [])]
+        if not res.get("IsTruncated"):
+            break
+        kwargs["ContinuationToken"] = res["NextContinuationToken"]
+    return sorted(keys)
+
+
+def read_cross_sections(s3, bucket, key):
+    # every market at every tick of one object, one row per (timestamp, market)
+    data = s3.get_object(Bucket=bucket, Key=key)["Body"].read()
+    timestamps, markets, fields, values = decode_frame(data)
+    index = pd.MultiIndex.from_product(
+        [pd.to_datetime(timestamps), markets], names=["timestamp", "market"]
+    )
+    flat = values.transpose(1, 0, 2).reshape(-1, len(fields))
+    return pd.DataFrame(flat, index=index, columns=fields)
+
+
+def read_range(s3, bucket, key, start, end):
+    obj = s3.get_object(Bucket=bucket, Key=key, Range=f"bytes={start}-{end}")
+    return obj["Body"].read()
+
+
+def read_market(s3, bucket, key, market):
+    # header + timestamps come from the probe (or one more GET if they don't
+    # fit), then one ranged GET for the market's contiguous block
+    head = read_range(s3, bucket, key, 0, HEADER_PROBE - 1)
+    _, _, header_len = PREAMBLE.unpack_from(head)
+    if PREAMBLE.size + header_len > len(head):
+        head = read_range(s3, bucket, key, 0, PREAMBLE.size + header_len - 1)
+    header = decode_header(head)
+    n_ticks, fields = header["n_ticks"], header["fields"]
+    if market not in header["markets"]:
+        return pd.DataFrame(columns=fields)
+
+    ts_start = header["data_offset"]
+    ts_end = ts_start + 8 * n_ticks - 1
+    if ts_end < len(head):
+        ts_bytes = head[ts_start : ts_end + 1]
+    else:
+        ts_bytes = read_range(s3, bucket, key, ts_start, ts_end)
+
+    start, end = market_byte_range(header, market)
+    block = read_range(s3, bucket, key, start, end)
+    values = np.frombuffer(block, dtype="<f8").reshape(n_ticks, len(fields))
+    index = pd.to_datetime(np.frombuffer(ts_bytes, dtype="<i8"))
+    index = pd.Index(index, name="timestamp")
+    return pd.DataFrame(values, index=index, columns=fields)
+
+
+def load_market(s3, bucket, today, market):
+    keys = list_snapshots(s3, bucket, today)
+    frames = [read_market(s3, bucket, key, market) for key in keys]
+    if not frames:
+        return pd.DataFrame(columns=FIELDS)
+    return pd.concat(frames).sort_index()